@@ -0,0 +1,161 @@
+#This code remembers results that the graphs work out from the merged data (rolling averages, correlation matrices,
+#trend line fits, lead/lag tables) so they are only worked out once
+#Each result is stored under a key made from:
+#   the name of the calculation + a hash of the exact data it used + its settings (ex: window=6)
+#so a result is re-used only when the data and settings are the same, and a new download/processing run gives new keys
+#on its own (nothing has to be cleared). Results are kept:
+#   in memory   the ANALYSIS_CACHE_SIZE most recently used ones (older ones are dropped first)
+#   on disk     in ANALYSIS_CACHE_DIR (if not None), so the graph worker processes and later runs can re-use them.
+#               Only the ANALYSIS_CACHE_DISK_ITEMS most recently used files are kept. The folder is made by
+#               ensure_dirs() in config.py, not here: without it results are only kept in memory.
+#               set_cache_dir() points the cache somewhere else (ex: tests.py uses its own folder)
+#Ex:
+#   corr = cached("correlation", df[columns], lambda: df[columns].corr())
+#Don't change what cached() gives back: the same object is handed to the next caller
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from config import USE_ANALYSIS_CACHE, ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_DISK_ITEMS
+from profiler import span
+
+CACHE_VERSION = 1 #Change this when a cached calculation changes, so old results on disk aren't used
+
+
+def data_hash(data):
+    # Hash of a DataFrame, Series or NumPy array: its values, index, column names and types
+    digest = hashlib.sha1()
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+        names = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+        types = list(data.dtypes) if isinstance(data, pd.DataFrame) else [data.dtype]
+        digest.update(json.dumps([names, types], default=str).encode())
+    else:
+        data = np.ascontiguousarray(data)
+        digest.update(data.tobytes())
+        digest.update(json.dumps([data.shape, str(data.dtype)]).encode())
+    return digest.hexdigest()
+
+
+def cache_key(name, data, params):
+    text = json.dumps({"name": name, "data": data_hash(data), "params": params, "version": CACHE_VERSION},
+                      sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class AnalysisCache:
+
+    def __init__(self, max_items=ANALYSIS_CACHE_SIZE, cache_dir=ANALYSIS_CACHE_DIR, max_disk_items=ANALYSIS_CACHE_DISK_ITEMS):
+        self.max_items = max_items
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.max_disk_items = max_disk_items
+        self.items = OrderedDict() #key: result, least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, name, data, compute, **params):
+        # The result of compute() for this data and these settings, worked out only if it isn't saved yet
+        key = cache_key(name, data, params)
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+
+        found, result = self.read(key)
+        if found:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            with span(name, "analyze"):
+                result = compute()
+            self.write(key, name, result)
+        self.remember(key, result)
+        return result
+
+    def remember(self, key, result):
+        with self.lock:
+            self.items[key] = result
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+    # ----- disk -----
+    def path(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def read(self, key):
+        # (True, result) if the result was saved on disk, else (False, None). A broken file is ignored
+        if self.cache_dir is None or not self.path(key).exists():
+            return False, None
+        try:
+            with open(self.path(key), "rb") as f:
+                result = pickle.load(f)
+            os.utime(self.path(key)) #most recently used files are the last ones removed
+            return True, result
+        except Exception:
+            return False, None
+
+    def write(self, key, name, result):
+        if self.cache_dir is None or not self.cache_dir.is_dir():
+            return
+        try:
+            tmp_path = self.path(key).with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with span(f"save {name}", "io"):
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                tmp_path.replace(self.path(key)) #other processes never see half a file
+            self.prune()
+        except Exception as e:
+            print(f"ANALYSIS CACHE ERROR (saving {name}): Reason:", e)
+
+    def prune(self):
+        # Deletes the least recently used files past max_disk_items
+        def last_used(path):
+            try:
+                return path.stat().st_mtime
+            except FileNotFoundError: #just removed by another process
+                return 0
+        files = sorted(self.cache_dir.glob("*.pkl"), key=last_used)
+        for old in files[:max(0, len(files) - self.max_disk_items)]:
+            old.unlink(missing_ok=True)
+
+    def clear(self, disk=True):
+        with self.lock:
+            self.items.clear()
+        if disk and self.cache_dir is not None and self.cache_dir.exists():
+            for old in self.cache_dir.glob("*.pkl"):
+                old.unlink(missing_ok=True)
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "in_memory": len(self.items)}
+
+
+_cache = AnalysisCache() #Shared by every graph in this process
+
+
+def cached(name, data, compute, **params):
+    # Ex: smooth = cached("rolling_mean", df[columns], lambda: df[columns].rolling(6).mean(), window=6)
+    # data = exactly what compute() reads (the key is a hash of it), params = settings that change the result
+    if not USE_ANALYSIS_CACHE:
+        return compute()
+    return _cache.get(name, data, compute, **params)
+
+
+def get_cache() -> AnalysisCache:
+    return _cache
+
+
+def set_cache_dir(cache_dir):
+    # Saves results in cache_dir from now on (None = memory only). The folder must already exist
+    # Results in memory are forgotten so nothing worked out with the old folder is handed back
+    _cache.clear(disk=False)
+    _cache.cache_dir = None if cache_dir is None else Path(cache_dir)
@@ -1,39 +1,83 @@
 #This code will analyze the cleaned data generated from process.py
 #Results will be saved as CSV files in "results/" folder in the parent directory
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
 from config import (
+    ensure_dirs,
     RESULTS_DIR, PROCESSED_DIR,
     MERGED_CLEAN,
     TIME_SERIES_NAME, SMOOTH_SERIES_NAME,
     GOOGLE_FRED_NAME, GOOGLE_KAGGLE_NAME,
     HEATMAP_NAME, PAIRPLOT_NAME,
+    DATA_FORMAT,
+    HEADLESS_PLOTS, PLOT_WORKERS,
+    STATE_MERGED_CLEAN, STATE_CORRELATIONS_NAME, STATE_CORRELATIONS_PLOT_NAME,
+    LEAD_LAG_NAME, LEAD_LAG_BEST_NAME, LEAD_LAG_PLOT_NAME, LEAD_LAG_SERIES, LEAD_LAG_FOCUS, LEAD_LAG_CHANGES,
+    LEAD_LAG_MAX_LAG, LEAD_LAG_MIN_PERIODS,
+    STATE_LEAD_LAG_NAME, STATE_LEAD_LAG_PAIR,
+    FAST_REGRESSION, REGRESSION_CI,
+    SEASONAL_SERIES, SEASONAL_PERIOD, SEASONAL_MIN_CYCLES, SEASONAL_PLOT_NAME,
+    GOOGLE_SEARCH_TERM, GOOGLE_KEYWORD_COLUMNS,
+    KEYWORD_MACRO_SERIES, KEYWORD_ANNOTATE_LIMIT, KEYWORD_CORRELATIONS_NAME, KEYWORD_HEATMAP_NAME,
 )
+if HEADLESS_PLOTS:
+    matplotlib.use("Agg") #No plot windows, only files. This has to happen before pyplot is imported
+import matplotlib.pyplot as plt
+import seaborn as sns
+from storage import read_table
+from regression import fit_lines, draw_trend_lines
+from analysis_cache import cached, get_cache, set_cache_dir
+from leadlag import lead_lag_table, grouped_lead_lag, best_lags, focus_view
+from seasonal import decompose_frame
+from profiler import profiled, span
 
 
 def clear_results_folder(results_dir=RESULTS_DIR):
     # ----- CLEAN RESULTS FOLDER BEFORE STARTING -----
+    # Graphs and result tables (ex: state_correlations.csv, lead_lag.csv), so a plot that fails this time doesn't leave
+    # last run's numbers looking current. Folders (sweep/, profile/, bench/) are left alone
     for f in os.listdir(results_dir):
-        if f.endswith(".png"):
+        if f.endswith((".png", ".csv")) and (results_dir / f).is_file():
             os.remove(results_dir / f)
     #print("Cleaned old CSV files from data/processed directory.")
 
+@profiled("render")
 def save_plot(filename, results_dir = RESULTS_DIR): #Saves the current matplotlib figure to the results folder as a png file
 
     out_path = results_dir / filename
-    plt.savefig(out_path)
+    fig = plt.gcf()
+    fig.savefig(out_path)
+    plt.close(fig) #Free the figure right away so figures don't pile up in memory as more graphs are made
     #print(f"Saved: {full_path}")
 
 
-def load_merged_data(processed_dir = PROCESSED_DIR, merged_dir = MERGED_CLEAN ): #Loads the merged.csv dataset for use in making the graphs
-    merged_path = processed_dir / merged_dir
-    df = pd.read_csv(merged_path)
+def trend_fits(df, pairs):
+    # Trend line fits of y on x for every (x, y) pair of columns, all at once (see regression.py)
+    xs = [x for x, _ in pairs]
+    ys = [y for _, y in pairs]
+    columns = list(dict.fromkeys(xs + ys))
+    return cached("trend_lines", df[columns],
+                  lambda: fit_lines(df[xs].to_numpy(dtype="float64"), df[ys].to_numpy(dtype="float64")), pairs=pairs)
+
 
-    # Convert month column back into datetime so Python can work with it
-    df["month"] = pd.to_datetime(df["month"])
+def trend_line(df, x, y, label="Trend Line"):
+    # Red regression line of column y on column x with its confidence band (REGRESSION_CI) on the current graph
+    if FAST_REGRESSION:
+        with span("trend line", "plot"):
+            draw_trend_lines([plt.gca()], color="red", ci=REGRESSION_CI, label=label, fits=trend_fits(df, [(x, y)]))
+        return
+    with span("sns.regplot", "seaborn"): #the confidence band is found by bootstrapping (1000 refits)
+        sns.regplot(x=df[x], y=df[y], scatter=False, color="red", ci=REGRESSION_CI, label=label)
+
+
+@profiled("io")
+def load_merged_data(processed_dir = PROCESSED_DIR, merged_dir = MERGED_CLEAN, data_format = DATA_FORMAT ): #Loads the merged.csv dataset for use in making the graphs
+    # Convert month column back into datetime so Python can work with it (already a datetime if saved as parquet)
+    df = read_table(processed_dir, merged_dir, data_format, date_columns={"month": "%m/%d/%Y"})
 
     return df
 
@@ -41,6 +85,7 @@ def load_merged_data(processed_dir = PROCESSED_DIR, merged_dir = MERGED_CLEAN ):
 # -----------------------------------------------------------
 # Line Plot - All variables over time
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_time_series(df, results_dir = RESULTS_DIR): #Basic graph of Housing Prices VS Mortgage Rates VS Google Search Score
     # Make the base plot
     fig, ax1 = plt.subplots(figsize=(12,6))
@@ -95,16 +140,15 @@ def plot_time_series(df, results_dir = RESULTS_DIR): #Basic graph of Housing Pri
 # -----------------------------------------------------------
 # Line Plot - All variables over time smoothed (Moving Average)
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_time_series_smoothed(df, results_dir = RESULTS_DIR): #Same as above but 6 month moving average to smooth out zig zags
 
-    # Make a copy so we don't modify the original df
-    smooth = df.copy()
-
-    # 6-month moving averages
+    # 6-month moving averages (a new frame, so the original df isn't changed)
     rolling_window = 6
-    smooth["avg_price_smooth"] = smooth["avg_price"].rolling(rolling_window).mean()
-    smooth["mortgage_smooth"] = smooth["mortgage_rate"].rolling(rolling_window).mean()
-    smooth["search_smooth"] = smooth["search_interest"].rolling(rolling_window).mean()
+    columns = {"avg_price": "avg_price_smooth", "mortgage_rate": "mortgage_smooth", "search_interest": "search_smooth"}
+    smooth = cached("rolling_mean", df[["month"] + list(columns)],
+                    lambda: df[["month"]].join(df[list(columns)].rolling(rolling_window).mean().rename(columns=columns)),
+                    window=rolling_window)
 
     # Drop first 5 rows (they are NaN due to rolling window)
     smooth = smooth.dropna()
@@ -164,6 +208,7 @@ def plot_time_series_smoothed(df, results_dir = RESULTS_DIR): #Same as above but
 # -----------------------------------------------------------
 # Scatter: Search Interest vs Mortgage Rate
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_scatter_search_vs_mortgage(df, results_dir = RESULTS_DIR):
     plt.figure(figsize=(8,6))
 
@@ -171,13 +216,7 @@ def plot_scatter_search_vs_mortgage(df, results_dir = RESULTS_DIR):
     plt.scatter(df["search_interest"], df["mortgage_rate"], alpha=0.5, label="Data Points")
 
     # Regression line
-    sns.regplot(
-        x=df["search_interest"],
-        y=df["mortgage_rate"],
-        scatter=False,
-        color="red",
-        label="Trend Line"
-    )
+    trend_line(df, "search_interest", "mortgage_rate")
 
     plt.title("Search Interest vs Mortgage Rate", fontsize=20)
     plt.xlabel("Search Interest", fontsize=16)
@@ -196,18 +235,13 @@ def plot_scatter_search_vs_mortgage(df, results_dir = RESULTS_DIR):
 # -----------------------------------------------------------
 # Scatter: Search Interest vs Average Price
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_scatter_search_vs_price(df, results_dir = RESULTS_DIR):
     plt.figure(figsize=(8,6))
 
     plt.scatter(df["search_interest"], df["avg_price"], alpha=0.5, label="Data Points")
 
-    sns.regplot(
-        x=df["search_interest"],
-        y=df["avg_price"],
-        scatter=False,
-        color="red",
-        label="Trend Line"
-    )
+    trend_line(df, "search_interest", "avg_price")
 
     plt.title("Search Interest vs Average Price", fontsize=20)
     plt.xlabel("Search Interest", fontsize=16)
@@ -227,8 +261,10 @@ def plot_scatter_search_vs_price(df, results_dir = RESULTS_DIR):
 # -----------------------------------------------------------
 # Correlation Heatmap
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_correlation_heatmap(df, results_dir = RESULTS_DIR):
-    corr = df[["avg_price", "mortgage_rate", "search_interest"]].corr()
+    columns = ["avg_price", "mortgage_rate", "search_interest"]
+    corr = cached("correlation", df[columns], lambda: df[columns].corr())
 
     plt.figure(figsize=(8,4))
     sns.heatmap(corr, annot=True, annot_kws={"size": 14}, cmap="coolwarm", fmt=".2f")
@@ -248,20 +284,41 @@ def plot_correlation_heatmap(df, results_dir = RESULTS_DIR):
 # -----------------------------------------------------------
 # Pair Plot
 # -----------------------------------------------------------
+@profiled("plot")
 def plot_pairplot(df, results_dir = RESULTS_DIR):
     # Keep ONLY the 3 core variables
     plot_df = df[["avg_price", "mortgage_rate", "search_interest"]]
 
     # Create the pair plot
-    g = sns.pairplot(
-        plot_df,
-        diag_kind="hist",      # histograms on diagonal
-        kind="reg",            # regression line in scatter plots
-        plot_kws={
-            "line_kws": {"color": "red"},
-            "scatter_kws": {"alpha": 0.5}
-        }
-    )
+    if FAST_REGRESSION:
+        with span("sns.pairplot", "seaborn"):
+            g = sns.pairplot(
+                plot_df,
+                diag_kind="hist",      # histograms on diagonal
+                kind="scatter",
+                plot_kws={"alpha": 0.5}
+            )
+
+        # Regression lines in all 6 scatter plots, fitted together (row = y variable, column = x variable)
+        with span("trend lines", "plot"):
+            panels = [(row, col) for row in range(len(g.y_vars)) for col in range(len(g.x_vars)) if row != col]
+            draw_trend_lines(
+                [g.axes[row, col] for row, col in panels],
+                color="red", ci=REGRESSION_CI,
+                fits=trend_fits(plot_df, [(g.x_vars[col], g.y_vars[row]) for row, col in panels])
+            )
+    else:
+        with span("sns.pairplot", "seaborn"): #kind="reg" bootstraps a confidence band in all 6 scatter plots
+            g = sns.pairplot(
+                plot_df,
+                diag_kind="hist",      # histograms on diagonal
+                kind="reg",            # regression line in scatter plots
+                plot_kws={
+                    "line_kws": {"color": "red"},
+                    "scatter_kws": {"alpha": 0.5},
+                    "ci": REGRESSION_CI
+                }
+            )
 
     # Set font sizes for labels
     for ax in g.axes.flatten():
@@ -280,8 +337,285 @@ def plot_pairplot(df, results_dir = RESULTS_DIR):
 
 
 
+# -----------------------------------------------------------
+# State level correlations
+# -----------------------------------------------------------
+@profiled("io")
+def load_state_merged_data(processed_dir = PROCESSED_DIR, state_merged_name = STATE_MERGED_CLEAN, data_format = DATA_FORMAT): #Loads state_merged_clean.csv (one row per state and month)
+    return read_table(processed_dir, state_merged_name, data_format, date_columns={"month": "%m/%d/%Y"})
+
+
+@profiled("analyze")
+def state_correlations(df_states, results_dir = RESULTS_DIR):
+    # Correlations between search interest, price and mortgage rate inside each state, saved as one table (one row per state)
+    pairs = [
+        ("search_vs_price", "search_interest", "avg_price"),
+        ("search_vs_mortgage", "search_interest", "mortgage_rate"),
+        ("price_vs_mortgage", "avg_price", "mortgage_rate"),
+    ]
+    def compute():
+        grouped = df_states.groupby(["state", "state_code"], observed=True)
+        df_corr = grouped.size().rename("months").to_frame()
+        for name, x, y in pairs:
+            df_corr[name] = grouped[[x, y]].corr().xs(x, level=-1)[y]
+        return df_corr.reset_index().sort_values(by="search_vs_price", ascending=False)
+
+    columns = ["state", "state_code", "search_interest", "avg_price", "mortgage_rate"]
+    df_corr = cached("state_correlations", df_states[columns], compute)
+
+    df_corr.to_csv(results_dir / STATE_CORRELATIONS_NAME, index=False, float_format="%.3f")
+    return df_corr
+
+
+@profiled("plot")
+def plot_state_correlations(df_corr, results_dir = RESULTS_DIR):
+    # One bar per state: how closely searches follow prices there (states without search data are left out)
+    df_plot = df_corr.dropna(subset=["search_vs_price"]).sort_values(by="search_vs_price")
+
+    plt.figure(figsize=(10, max(4, 0.25 * len(df_plot))))
+    colors = ["tab:red" if r < 0 else "tab:blue" for r in df_plot["search_vs_price"]]
+    plt.barh(df_plot["state_code"], df_plot["search_vs_price"], color=colors)
+    plt.axvline(0, color="black", linewidth=0.8)
+    plt.xlim(-1, 1)
+
+    plt.title("Search Interest vs Avg Home Price Correlation by State", fontsize=16)
+    plt.xlabel("Correlation", fontsize=14)
+    plt.tight_layout()
+
+    save_plot(STATE_CORRELATIONS_PLOT_NAME, results_dir)
+
+
+# -----------------------------------------------------------
+# Lead/Lag: does one series move before another?
+# -----------------------------------------------------------
+@profiled("analyze")
+def lead_lag_analysis(df, results_dir = RESULTS_DIR, columns = LEAD_LAG_SERIES):
+    # Correlation of every pair of series at every lag (see leadlag.py), plus the strongest lag of each pair
+    columns = [c for c in columns if c in df.columns]
+    table = cached("lead_lag_table", df[["month"] + columns], lambda: lead_lag_table(df, columns),
+                   max_lag=LEAD_LAG_MAX_LAG, min_periods=LEAD_LAG_MIN_PERIODS, changes=LEAD_LAG_CHANGES)
+    table.to_csv(results_dir / LEAD_LAG_NAME, index=False, float_format="%.4f")
+    best_lags(table).to_csv(results_dir / LEAD_LAG_BEST_NAME, index=False, float_format="%.4f")
+    return table
+
+
+@profiled("plot")
+def plot_lead_lag_correlogram(df, results_dir = RESULTS_DIR, focus = LEAD_LAG_FOCUS):
+    # One panel per series: its correlation with the focus series (searches) at every lag. Blue bars (lag > 0) mean
+    # searches move first. Bars past the dashed lines are stronger than random noise would usually give (95%)
+    table = focus_view(lead_lag_analysis(df, results_dir), focus)
+    others = [name for name in LEAD_LAG_SERIES if name in set(table["series_b"])] #same order as in config.py
+    if not others:
+        raise ValueError(f"No series to compare with {focus}")
+
+    ncols = 2 if len(others) > 1 else 1
+    nrows = -(-len(others) // ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(7 * ncols, 3 * nrows), sharex=True, squeeze=False)
+    for ax, name in zip(axes.flat, others):
+        rows = table[table["series_b"] == name]
+        colors = ["tab:blue" if lag > 0 else "tab:orange" if lag < 0 else "black" for lag in rows["lag"]]
+        ax.bar(rows["lag"], rows["correlation"], color=colors, width=0.8)
+        noise = 1.96 / rows["months"].clip(lower=1) ** 0.5
+        ax.plot(rows["lag"], noise, "k--", linewidth=0.8)
+        ax.plot(rows["lag"], -noise, "k--", linewidth=0.8)
+        ax.axhline(0, color="black", linewidth=0.8)
+        ax.set_ylim(-1, 1)
+        ax.tick_params(labelbottom=True)
+        ax.grid(True, alpha=0.3)
+        best = rows.dropna(subset=["correlation"])
+        if best.empty:
+            ax.set_title(f"{name}: not enough months", fontsize=12)
+            continue
+        best = best.loc[best["correlation"].abs().idxmax()]
+        ax.set_title(f"{name}: strongest at {int(best['lag']):+d} months (r = {best['correlation']:.2f})", fontsize=12)
+    for ax in axes.flat[len(others):]:
+        ax.set_visible(False)
+    fig.supxlabel(f"Lag (months, > 0 = {focus} moves first)", fontsize=12)
+
+    what = "month-to-month changes" if LEAD_LAG_CHANGES else "levels"
+    fig.suptitle(f"Lead/Lag Correlation of {focus} ({what})", fontsize=16)
+    fig.tight_layout()
+    save_plot(LEAD_LAG_PLOT_NAME, results_dir)
+
+
+@profiled("analyze")
+def state_lead_lag(df_states, results_dir = RESULTS_DIR, pair = STATE_LEAD_LAG_PAIR):
+    # The same lead/lag correlation for one pair of columns inside every state (all states in one pass)
+    table = cached("state_lead_lag", df_states[["state", "month", *pair]], lambda: grouped_lead_lag(df_states, "state", *pair),
+                   max_lag=LEAD_LAG_MAX_LAG, min_periods=LEAD_LAG_MIN_PERIODS, changes=LEAD_LAG_CHANGES)
+    table.to_csv(results_dir / STATE_LEAD_LAG_NAME, index=False, float_format="%.4f")
+    return table
+
+
+# -----------------------------------------------------------
+# Seasonal decomposition: trend, seasonal and residual parts
+# -----------------------------------------------------------
+@profiled("plot")
+def plot_seasonal_decomposition(df, results_dir = RESULTS_DIR, columns = SEASONAL_SERIES):
+    # One row per series: the series with its trend and deseasonalized line, its average swing in each calendar month
+    # and what is left over (see seasonal.py). All the series are decomposed together in one pass
+    columns = [c for c in columns if c in df.columns]
+    if not columns:
+        raise ValueError("None of SEASONAL_SERIES are in the merged data")
+    parts = cached("seasonal_decomposition", df[["month"] + columns], lambda: decompose_frame(df, columns),
+                   period=SEASONAL_PERIOD, min_cycles=SEASONAL_MIN_CYCLES)
+    months = parts["observed"].index
+    labels = list("JFMAMJJASOND") if SEASONAL_PERIOD == 12 else [str(p + 1) for p in range(SEASONAL_PERIOD)]
+
+    fig, axes = plt.subplots(len(columns), 3, figsize=(16, 2.6 * len(columns)), squeeze=False,
+                             gridspec_kw={"width_ratios": [3, 1, 2]})
+    for row, name in zip(axes, columns):
+        row[0].plot(months, parts["observed"][name], color="lightgray", label="Observed")
+        row[0].plot(months, parts["observed"][name] - parts["seasonal"][name], color="tab:orange", linewidth=1,
+                    label="Deseasonalized")
+        row[0].plot(months, parts["trend"][name], color="tab:blue", linewidth=2, label="Trend")
+        row[0].set_ylabel(name, fontsize=12)
+
+        profile = parts["profile"][name]
+        row[1].bar(range(len(labels)), profile, color=["tab:red" if v < 0 else "tab:green" for v in profile.fillna(0)])
+        row[1].set_xticks(range(len(labels)), labels) #positions, since the month letters repeat
+        row[1].axhline(0, color="black", linewidth=0.8)
+
+        row[2].plot(months, parts["residual"][name], color="tab:gray", linewidth=1)
+        row[2].axhline(0, color="black", linewidth=0.8)
+        for ax in row:
+            ax.grid(True, alpha=0.3)
+
+    axes[0, 0].legend(loc="upper left", fontsize=10)
+    axes[0, 0].set_title("Series, trend and deseasonalized", fontsize=14)
+    axes[0, 1].set_title("Seasonal swing by month", fontsize=14)
+    axes[0, 2].set_title("Residual", fontsize=14)
+    fig.suptitle(f"Seasonal Decomposition ({SEASONAL_PERIOD}-month moving average trend)", fontsize=18)
+    fig.tight_layout()
+    save_plot(SEASONAL_PLOT_NAME, results_dir)
+
+
+# -----------------------------------------------------------
+# Keywords: every search against every other one and the macro series
+# -----------------------------------------------------------
+@profiled("analyze")
+def keyword_correlations(df, results_dir = RESULTS_DIR, keywords = None, macro = KEYWORD_MACRO_SERIES):
+    # One correlation matrix of every search (search_interest + the GOOGLE_KEYWORD_COLUMNS) and every macro column,
+    # searches first. One .corr() call for the whole matrix (months where either one is missing are skipped for that pair)
+    keywords = ["search_interest"] + list(GOOGLE_KEYWORD_COLUMNS.values()) if keywords is None else keywords
+    keywords = [c for c in dict.fromkeys(keywords) if c in df.columns]
+    macro = [c for c in macro if c in df.columns and c not in keywords]
+    columns = keywords + macro
+    corr = cached("correlation", df[columns], lambda: df[columns].corr())
+    corr.to_csv(results_dir / KEYWORD_CORRELATIONS_NAME, index_label="series", float_format="%.4f")
+    return corr
+
+
+def keyword_order(corr):
+    # Puts searches that move together next to each other: sorted by their angle on the 2 strongest eigenvectors of the
+    # correlation matrix (a clustering order without scipy). Missing correlations count as 0
+    if len(corr) < 3:
+        return list(corr.columns)
+    _, vectors = np.linalg.eigh(corr.fillna(0).to_numpy())
+    leading = vectors[:, -1] * np.sign(vectors[:, -1].sum() or 1) #point it at most searches so the cut is between unlike ones
+    angles = np.arctan2(vectors[:, -2], leading)
+    return list(corr.columns[np.argsort(angles, kind="stable")])
+
+
+@profiled("plot")
+def plot_keyword_heatmap(df, results_dir = RESULTS_DIR, keywords = None, macro = KEYWORD_MACRO_SERIES,
+                         annotate_limit = KEYWORD_ANNOTATE_LIMIT):
+    # Lower half of the keyword_correlations matrix: searches (grouped by keyword_order) above the line, macro series
+    # below it. The figure grows with the number of rows, the numbers are only written up to annotate_limit rows
+    corr = keyword_correlations(df, results_dir, keywords, macro)
+    keywords = [c for c in corr.columns if c not in macro]
+    if not keywords:
+        raise ValueError("No search columns in the merged data")
+    order = keyword_order(corr.loc[keywords, keywords]) + list(corr.columns[len(keywords):])
+    matrix = corr.loc[order, order]
+    names = {"search_interest": GOOGLE_SEARCH_TERM, **{column: kw for kw, column in GOOGLE_KEYWORD_COLUMNS.items()}}
+    matrix = matrix.rename(index=names, columns=names)
+
+    n = len(order)
+    annotate = n <= annotate_limit
+    size = max(8, 0.3 * n + 3)
+    plt.figure(figsize=(size + 2, size))
+    ax = sns.heatmap(matrix, mask=np.triu(np.ones((n, n), dtype=bool), k=1), cmap="coolwarm", vmin=-1, vmax=1,
+                     annot=annotate, annot_kws={"size": 10}, fmt=".2f", square=True, linewidths=0.5 if annotate else 0,
+                     xticklabels=True, yticklabels=True, cbar_kws={"shrink": 0.6}) #every label, even with 50+ rows
+    if len(keywords) < n: #line between the searches and the macro series (lower half only)
+        ax.hlines(len(keywords), 0, len(keywords), color="black", linewidth=1.5)
+        ax.vlines(len(keywords), len(keywords), n, color="black", linewidth=1.5)
+
+    labelsize = max(5, min(11, 300 // n))
+    ax.tick_params(labelsize=labelsize)
+    plt.title(f"Search Keyword Correlations ({len(keywords)} searches)", fontsize=18)
+    plt.tight_layout()
+    save_plot(KEYWORD_HEATMAP_NAME, results_dir)
+
+
+# -----------------------------------------------------------
+# Draw all the plots
+# -----------------------------------------------------------
+# Every plot function, in the order they are drawn
+PLOT_FUNCTIONS = [
+    plot_time_series,
+    plot_time_series_smoothed,
+    plot_scatter_search_vs_mortgage,
+    plot_scatter_search_vs_price,
+    plot_correlation_heatmap,
+    plot_pairplot,
+    plot_lead_lag_correlogram,
+    plot_seasonal_decomposition,
+    plot_keyword_heatmap,
+]
+
+_worker_df = None #The merged data inside each plot process (sent once when the process starts, not once per plot)
+
+
+def _init_plot_worker(df, cache_dir):
+    global _worker_df
+    matplotlib.use("Agg", force=True)
+    set_cache_dir(cache_dir) #same analysis cache folder as the main process
+    _worker_df = df
+
+
+def _draw_in_worker(plot_name, results_dir):
+    # Runs one plot function inside a worker process. Errors are sent back as text so one bad plot doesn't stop the rest
+    try:
+        globals()[plot_name](_worker_df, results_dir=results_dir)
+        return plot_name, None
+    except Exception as e:
+        return plot_name, str(e)
+    finally:
+        plt.close("all")
+
+
+@profiled("plot")
+def plot_all(df, results_dir = RESULTS_DIR, parallel = True, max_workers = PLOT_WORKERS):
+    # Draws every plot in PLOT_FUNCTIONS. In parallel mode each plot is drawn in its own process (pyplot can't draw
+    # 2 figures at once in one process), so the total time is about the slowest plot instead of all of them added up
+    workers = max_workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(PLOT_FUNCTIONS)))
+    if not parallel or workers == 1: #With 1 worker, starting a process only adds time
+        for plot_func in PLOT_FUNCTIONS:
+            try:
+                plot_func(df, results_dir=results_dir)
+            except Exception as e:
+                print(f"PLOT ERROR ({plot_func.__name__}): Reason:", e)
+            finally:
+                plt.close("all")
+        return
+
+    # "spawn" starts clean processes (same on Windows, Mac and Linux) instead of copying this one
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_plot_worker, initargs=(df, get_cache().cache_dir)) as pool:
+        futures = [pool.submit(_draw_in_worker, plot_func.__name__, results_dir) for plot_func in PLOT_FUNCTIONS]
+        for future in futures:
+            plot_name, error = future.result()
+            if error is not None:
+                print(f"PLOT ERROR ({plot_name}): Reason:", error)
+
+
 if __name__ == "__main__":
     print("----------------------Running Data Analysis----------------------")
+    ensure_dirs()
     clear_results_folder()
     # Load merged data
     try:
@@ -291,12 +625,7 @@ if __name__ == "__main__":
     #print(df.head())
 
     # Generate and save all plots
-        plot_time_series(df)
-        plot_time_series_smoothed(df)
-        plot_scatter_search_vs_mortgage(df)
-        plot_scatter_search_vs_price(df)
-        plot_correlation_heatmap(df)
-        plot_pairplot(df)
+        plot_all(df)
     except Exception as e:
         print("ANALYSIS RESULTS GENERATION ERROR: Reason:", e)
 
@@ -0,0 +1,218 @@
+#This code times the processing and analysis stages on synthetic data (see synthetic.py) so speed and memory can be
+#compared between versions of the code without the internet or the real downloads
+#For each size (ex: 100k, 1M, 50M Kaggle rows) it:
+#   1. makes the synthetic input files once in data/bench/<size>/ (re-used by later runs)
+#   2. runs each stage in its own fresh Python process: process_realtor_data, process_mortgage_data,
+#      process_google_data, process_merge_data and every plot_* function
+#   3. records the wall time and peak memory of each stage in results/bench/latest.json
+#   4. compares against results/bench/baseline.json (if there is one) and flags anything that got slower or bigger
+#      than BENCH_TOLERANCE allows. The exit code is 1 when something regressed
+#Run from the src/ directory:
+#   python bench.py                        (sizes from BENCH_SIZES in config.py)
+#   python bench.py --sizes 100k 10M --save-baseline
+#   python bench.py --sizes 100k --only process_realtor_data process_merge_data
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from config import BENCH_DATA_DIR, BENCH_RESULTS_DIR, BENCH_SIZES, BENCH_TOLERANCE
+from profiler import peak_rss_mb
+
+SRC_DIR = Path(__file__).resolve().parent
+PROCESS_STAGES = ["process_realtor_data", "process_mortgage_data", "process_google_data", "process_merge_data"]
+PLOT_STAGES = ["plot_time_series", "plot_time_series_smoothed", "plot_scatter_search_vs_mortgage",
+               "plot_scatter_search_vs_price", "plot_correlation_heatmap", "plot_pairplot",
+               "plot_seasonal_decomposition", "plot_keyword_heatmap"]
+STAGES = PROCESS_STAGES + PLOT_STAGES
+
+MIN_SECONDS = 0.05 #differences smaller than this are never called a regression (timer noise)
+MIN_MEMORY_MB = 10
+
+
+# -----------------------------------------------------------
+# Inside the worker process (one stage per process so peak memory belongs to that stage alone)
+# -----------------------------------------------------------
+def run_stage(stage, data_dir):
+    data_dir = Path(data_dir)
+    processed_dir = data_dir / "processed"
+    results_dir = data_dir / "results"
+    processed_dir.mkdir(exist_ok=True)
+    results_dir.mkdir(exist_ok=True)
+
+    if stage in PROCESS_STAGES:
+        import process
+        func = getattr(process, stage)
+        if stage == "process_merge_data":
+            call = lambda: func(processed_dir=processed_dir)
+        else:
+            call = lambda: func(data_dir=data_dir, processed_dir=processed_dir)
+    else:
+        import analyze
+        import analysis_cache
+        analysis_cache.set_cache_dir(None) #time the calculations, not results saved by an earlier run
+        df = analyze.load_merged_data(processed_dir=processed_dir) #loading isn't part of the plot's time
+        func = getattr(analyze, stage)
+        call = lambda: func(df, results_dir=results_dir)
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    call()
+    wall = time.perf_counter() - start
+    peak = peak_rss_mb()
+    return {
+        "wall_seconds": round(wall, 4),
+        "peak_rss_mb": None if peak is None else round(peak, 1),
+        "stage_memory_mb": None if peak is None else round(peak - baseline, 1), #memory added during the stage
+    }
+
+
+# -----------------------------------------------------------
+# Driver
+# -----------------------------------------------------------
+def prepare_data(label, rows, seed):
+    # Makes the synthetic files for one size, unless the same ones are already there
+    data_dir = BENCH_DATA_DIR / label
+    info_path = data_dir / "synthetic.json"
+    info = {"rows": rows, "seed": seed}
+    if info_path.exists() and json.loads(info_path.read_text()) == info:
+        return data_dir
+    print(f"Making synthetic data: {rows:,} Kaggle rows in {data_dir} ...")
+    start = time.perf_counter()
+    # In its own process so this one stays small (the stage processes start as copies of it)
+    subprocess.run([sys.executable, "synthetic.py", "--rows", str(rows), "--out", str(data_dir), "--seed", str(seed)],
+                   cwd=SRC_DIR, check=True)
+    info_path.write_text(json.dumps(info))
+    print(f"  done in {time.perf_counter() - start:.1f} s")
+    return data_dir
+
+
+def time_stage(stage, data_dir, repeat=1):
+    # Runs the stage in fresh processes and keeps the median time and the largest memory
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, __file__, "--worker", stage, "--data", str(data_dir)],
+                                cwd=SRC_DIR, capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"error": (result.stderr.strip().splitlines() or ["unknown error"])[-1]}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    memory = [r["stage_memory_mb"] for r in runs if r["stage_memory_mb"] is not None]
+    peaks = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+    return {
+        "wall_seconds": round(statistics.median(r["wall_seconds"] for r in runs), 4),
+        "peak_rss_mb": max(peaks) if peaks else None,
+        "stage_memory_mb": max(memory) if memory else None,
+    }
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE):
+    # Returns a list of (size, stage, what, old, new) for everything that got worse than the tolerance allows
+    regressions = []
+    for label, size in results["sizes"].items():
+        old_stages = baseline.get("sizes", {}).get(label, {}).get("stages", {})
+        for stage, new in size["stages"].items():
+            old = old_stages.get(stage)
+            if not old or "error" in old:
+                continue
+            if "error" in new:
+                regressions.append((label, stage, "error", None, new["error"]))
+                continue
+            checks = [("wall_seconds", MIN_SECONDS), ("stage_memory_mb", MIN_MEMORY_MB)]
+            for key, minimum in checks:
+                if old.get(key) is None or new.get(key) is None:
+                    continue
+                if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > minimum:
+                    regressions.append((label, stage, key, old[key], new[key]))
+    return regressions
+
+
+def print_results(results, baseline):
+    for label, size in results["sizes"].items():
+        old_stages = (baseline or {}).get("sizes", {}).get(label, {}).get("stages", {})
+        print(f"\n{label} ({size['rows']:,} Kaggle rows)")
+        print(f"  {'stage':<34} {'time (s)':>9} {'memory (MB)':>12} {'vs baseline':>12}")
+        for stage, result in size["stages"].items():
+            if "error" in result:
+                print(f"  {stage:<34} ERROR: {result['error']}")
+                continue
+            memory = "-" if result["stage_memory_mb"] is None else f"{result['stage_memory_mb']:.1f}"
+            old = old_stages.get(stage, {})
+            ratio = f"{result['wall_seconds'] / old['wall_seconds']:.2f}x" if old.get("wall_seconds") else ""
+            print(f"  {stage:<34} {result['wall_seconds']:>9.3f} {memory:>12} {ratio:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the processing and analysis stages on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", default=BENCH_SIZES, help="Kaggle rows per run, ex: 100k 1M 50M")
+    parser.add_argument("--only", nargs="+", choices=STAGES, help="Only time these stages (the others still run so the inputs exist, but aren't timed)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage (the median time is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=BENCH_RESULTS_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=BENCH_RESULTS_DIR / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Save these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE, help="Allowed slowdown, ex: 0.25 = 25%%")
+    parser.add_argument("--worker", help=argparse.SUPPRESS) #used internally: run one stage in this process
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_stage(args.worker, args.data)))
+        return 0
+
+    from synthetic import parse_rows
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sizes": {},
+    }
+    for label in args.sizes:
+        rows = parse_rows(label)
+        data_dir = prepare_data(label, rows, args.seed)
+        stages = {}
+        for stage in STAGES:
+            print(f"[{label}] {stage} ...")
+            result = time_stage(stage, data_dir, args.repeat if not args.only or stage in args.only else 1)
+            if not args.only or stage in args.only:
+                stages[stage] = result
+        results["sizes"][label] = {"rows": rows, "stages": stages}
+
+    baseline = None
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+
+    print_results(results, baseline)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nSaved to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"Saved as the new baseline: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print("No baseline yet. Run again with --save-baseline to save one.")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+        return 0
+    print(f"\nREGRESSIONS against {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for label, stage, key, old, new in regressions:
+        print(f"  {label} {stage}: {key} {old} -> {new}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
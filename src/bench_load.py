@@ -0,0 +1,104 @@
+#This code times the whole load stage (run_load in main.py) with no internet, against the stand-ins in standins.py:
+#a local FRED server, fake Google Trends clients and a fake Kaggle download. Their latency, payload size and
+#429 ("too many requests") rate can be changed, so retries, the Google rate limiter and concurrent vs one after
+#another downloading can be compared offline. Files go to data/bench/load/, results to results/bench/load.json
+#Run from the src/ directory:
+#   python bench_load.py
+#   python bench_load.py --latency 0.2 --error-rate 0.2 --states 10 --rows 1M
+#   python bench_load.py --modes concurrent --retry-after 1 --verbose
+
+import argparse
+import contextlib
+import io
+import json
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from config import BENCH_DATA_DIR, BENCH_RESULTS_DIR, STATE_CODES
+from main import run_load
+from rate_limiter import get_trends_limiter
+from standins import FredStandIn, TrendsStandIn, KaggleStandIn
+from synthetic import parse_rows
+
+LOAD_DIR = BENCH_DATA_DIR / "load"
+
+
+def bench_mode(concurrent, args):
+    # One run_load with brand new stand-ins (fresh counts) and a fresh Google rate limiter
+    data_dir = LOAD_DIR / ("concurrent" if concurrent else "sequential")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    data_dir.mkdir(parents=True)
+    limiter_state = data_dir / "trends_rate_limiter.json"
+    states = dict(list(STATE_CODES.items())[:args.states])
+
+    trends = TrendsStandIn(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    kaggle = KaggleStandIn(LOAD_DIR, rows=parse_rows(args.rows), latency=args.latency,
+                           error_rate=args.error_rate, seed=args.seed).prepare()
+    with FredStandIn(observations=args.observations, latency=args.latency, error_rate=args.error_rate,
+                     retry_after=args.retry_after, seed=args.seed) as fred:
+        output = sys.stdout if args.verbose else io.StringIO() #run_load prints a lot
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            results = run_load(args.sleep, use_cache=False, concurrent=concurrent, data_dir=data_dir,
+                               fred_base_url=fred.base_url, trends_client_factory=trends.client,
+                               kaggle_fetcher=kaggle, limiter_state=limiter_state, states=states)
+        total = time.perf_counter() - start
+
+    limiter = get_trends_limiter(max_wait=args.sleep, state_path=limiter_state)
+    stand_ins = {"FRED": fred.stats.to_dict(), "Google Trends": trends.stats.to_dict(), "Kaggle": kaggle.stats.to_dict()}
+    for stats in stand_ins.values():
+        stats["requests_per_second"] = round(stats["requests"] / total, 2) if total else None
+    return {
+        "total_seconds": round(total, 3),
+        "sources": {name: {"status": status, "seconds": round(elapsed, 3)} for name, status, elapsed in results},
+        "stand_ins": stand_ins,
+        "trends_limiter": {"throttle_count": limiter.throttle_count, "final_rate": round(limiter.rate, 4)},
+    }
+
+
+def print_mode(mode, result):
+    print(f"\n{mode}: {result['total_seconds']:.2f} s total")
+    for name, source in result["sources"].items():
+        print(f"  {name:<15} {source['status']:<7} {source['seconds']:7.2f} s")
+    print(f"  {'stand-in':<15} {'requests':>8} {'429s':>6} {'MB sent':>8} {'req/s':>7}")
+    for name, stats in result["stand_ins"].items():
+        print(f"  {name:<15} {stats['requests']:>8} {stats['throttled']:>6} {stats['bytes_sent'] / 1e6:>8.2f} "
+              f"{stats['requests_per_second']:>7.2f}")
+    limiter = result["trends_limiter"]
+    print(f"  Google rate limiter: {limiter['throttle_count']} slow downs, ended at {limiter['final_rate']} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_load offline against local FRED, Google Trends and Kaggle stand-ins.")
+    parser.add_argument("--modes", nargs="+", choices=["concurrent", "sequential"], default=["concurrent", "sequential"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds every stand-in waits before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 429, ex: 0.1")
+    parser.add_argument("--retry-after", type=int, help="Seconds sent in FRED's Retry-After header with a 429 (default: none)")
+    parser.add_argument("--rows", default="100k", help="Rows in the fake Kaggle download, ex: 100k, 1M")
+    parser.add_argument("--observations", type=int, default=2800, help="Weeks sent back for each FRED series")
+    parser.add_argument("--states", type=int, default=5, help=f"States searched on Google Trends (0 to {len(STATE_CODES)})")
+    parser.add_argument("--sleep", type=int, default=20, help="Longest wait between Google requests (same as main.py --sleep)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, default=BENCH_RESULTS_DIR / "load.json", help="Where to save the results")
+    parser.add_argument("--verbose", action="store_true", help="Show everything run_load prints")
+    args = parser.parse_args()
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("json", "verbose", "modes")},
+        "modes": {},
+    }
+    for mode in args.modes:
+        print(f"Running run_load ({mode}) against the stand-ins ...")
+        results["modes"][mode] = bench_mode(mode == "concurrent", args)
+        print_mode(mode, results["modes"][mode])
+
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(results, indent=2))
+    print(f"\nSaved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#This code measures how long main.py takes to start (before any real work) for "--help", "process" and "analyze"
+#Each command is run in a brand new Python process (a "cold start") with "python -X importtime", several times,
+#and the middle (median) time is kept. It also lists the modules that take the longest to import
+#Run from the src/ directory:
+#   python bench_startup.py
+#   python bench_startup.py --repeat 10 --json ../results/startup.json
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+
+# What each command imports before it starts working (same imports as main.py does for that stage)
+COMMANDS = {
+    "--help": ["main.py", "--help"],
+    "process": ["-c", "import main, process"],
+    "analyze": ["-c", "import main, analyze"],
+}
+
+
+def parse_importtime(stderr):
+    # "-X importtime" prints one line per module: "import time: self [us] | cumulative | name"
+    # Returns {module: cumulative microseconds} for the top level imports only (their times include everything below them)
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "): #deeper imports are indented more than 1 space
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def run_once(args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=SRC_DIR,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def bench_command(args, repeat=5):
+    # Median wall time and import time over several cold starts, plus the slowest top level imports
+    walls, imports, runs = [], [], []
+    for _ in range(repeat):
+        wall, modules = run_once(args)
+        walls.append(wall)
+        imports.append(sum(modules.values()) / 1e6)
+        runs.append(modules)
+    middle = runs[imports.index(statistics.median_low(imports))]
+    slowest = sorted(middle.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "wall_seconds": round(statistics.median(walls), 4),
+        "import_seconds": round(statistics.median(imports), 4),
+        "slowest_imports": {name: round(us / 1e6, 4) for name, us in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure main.py cold start time for --help, process and analyze.")
+    parser.add_argument("--repeat", type=int, default=5, help="Cold starts per command (the median is kept)")
+    parser.add_argument("--json", type=Path, help="Also save the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {name: bench_command(command, args.repeat) for name, command in COMMANDS.items()}
+
+    print(f"{'command':<10} {'wall (s)':>9} {'imports (s)':>12}   slowest imports")
+    for name, result in results.items():
+        slowest = ", ".join(f"{module} {seconds:.3f}" for module, seconds in list(result["slowest_imports"].items())[:3])
+        print(f"{name:<10} {result['wall_seconds']:>9.3f} {result['import_seconds']:>12.3f}   {slowest}")
+
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "commands": results}, f, indent=2)
+        print(f"Saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,9 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
+#Importing this file has no side effects (no folders made, .env not read) so every command starts fast.
+#The folders are made by ensure_dirs() when a stage runs, and .env is only read the first time an API key is used
 
-# ---------------------------------------------------
-# Load environment variables from .env
-# ---------------------------------------------------
-load_dotenv() # By default it loads from a file named .env in the same folder
 
 # ---------------------------------------------------
 # Project folder paths
@@ -17,24 +14,78 @@ DATA_DIR = PROJECT_ROOT / "data"
 PROCESSED_DIR = DATA_DIR / "processed"
 RESULTS_DIR = PROJECT_ROOT / "results"
 
-# Ensure folders exist
-DATA_DIR.mkdir(exist_ok=True)
-PROCESSED_DIR.mkdir(exist_ok=True)
-RESULTS_DIR.mkdir(exist_ok=True)
+
+def ensure_dirs():
+    # Ensure folders exist (called by main.py and each file's __main__ before a stage runs)
+    DATA_DIR.mkdir(exist_ok=True)
+    PROCESSED_DIR.mkdir(exist_ok=True)
+    RESULTS_DIR.mkdir(exist_ok=True)
+    if ANALYSIS_CACHE_DIR is not None:
+        ANALYSIS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
 
 # ---------------------------------------------------
 # API KEYS from .env
 # ---------------------------------------------------
-KAGGLE_CONFIG_DIR = os.getenv("KAGGLE_CONFIG_DIR") #This should match same variable name from .env
-FRED_API_KEY = os.getenv("FRED_API_KEY") #This should match same variable name from .env
+ENV_KEYS = ["KAGGLE_CONFIG_DIR", "FRED_API_KEY"] #These should match same variable names from .env
+_env_loaded = False
+
+
+def load_env():
+    # Load environment variables from .env (only once, and only when a key is actually asked for)
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv() # By default it loads from a file named .env in the same folder
+        _env_loaded = True
+
+
+def __getattr__(name):
+    # "from config import FRED_API_KEY" still works: the key is looked up in .env the first time it is imported
+    if name in ENV_KEYS:
+        load_env()
+        return os.getenv(name)
+    raise AttributeError(f"module 'config' has no attribute '{name}'")
+
 
 # ---------------------------------------------------
 # Data Sources Configuration
 # ---------------------------------------------------
 KAGGLE_DATASET = 'ahmedshahriarsakib/usa-real-estate-dataset'
 FRED_SERIES_ID = "MORTGAGE30US"
-FRED_API_URL = f"https://api.stlouisfed.org/fred/series/observations"
+FRED_BASE_URL = "https://api.stlouisfed.org/fred" #Change to send every FRED request somewhere else (ex: FredStandIn in standins.py)
+FRED_API_URL = f"{FRED_BASE_URL}/series/observations"
+FRED_SERIES_URL = f"{FRED_BASE_URL}/series" #Series info (used to check last_updated before re-downloading)
 GOOGLE_SEARCH_TERM = "homes for sale"
+#More searches downloaded next to GOOGLE_SEARCH_TERM and compared with it and with the macro series (see
+#plot_keyword_heatmap in analyze.py). Off by default (each one costs Google requests). GOOGLE_SEARCH_TERM always gets a
+#request of its own so search_interest stays its own 0-100 series. Google only compares 5 searches per request, so the
+#extras are fetched 4 at a time with GOOGLE_SEARCH_TERM in every request to put them on its scale
+#Ex: GOOGLE_EXTRA_KEYWORDS = ["mortgage rates", "houses for rent", "realtor", "zillow"]
+GOOGLE_EXTRA_KEYWORDS = []
+GOOGLE_KEYWORDS_PER_REQUEST = 5 #Google Trends' limit on searches per request
+#Column of each extra search in the merged data (GOOGLE_SEARCH_TERM stays "search_interest"), ex: "mortgage rates" -> kw_mortgage_rates
+GOOGLE_KEYWORD_COLUMNS = {kw: "kw_" + "_".join("".join(c if c.isalnum() else " " for c in kw.lower()).split())
+                          for kw in dict.fromkeys(GOOGLE_EXTRA_KEYWORDS) if kw != GOOGLE_SEARCH_TERM}
+#Extra FRED series pulled all at once and merged as extra columns (one column per series ID). Use [] to skip
+#MORTGAGE15US = 15-Year Fixed Mortgage, CPIAUCSL = Consumer Price Index, UNRATE = Unemployment Rate, HOUST = Housing Starts
+FRED_BULK_SERIES = ["MORTGAGE15US", "CPIAUCSL", "UNRATE", "HOUST"]
+#State level data: house prices from Kaggle and Google searches from each state, merged with the national mortgage rate
+#One row per (state, month) in state_merged_clean.csv. Off by default: True adds ~51 Google Trends requests to --load
+#(one per state), and Google Trends is the source most likely to start refusing requests
+STATE_LEVEL = False
+STATE_CODES = { #State name as written in the Kaggle data: Google Trends code (searched as "US-" + code)
+    "Alabama": "AL", "Alaska": "AK", "Arizona": "AZ", "Arkansas": "AR", "California": "CA", "Colorado": "CO",
+    "Connecticut": "CT", "Delaware": "DE", "District of Columbia": "DC", "Florida": "FL", "Georgia": "GA",
+    "Hawaii": "HI", "Idaho": "ID", "Illinois": "IL", "Indiana": "IN", "Iowa": "IA", "Kansas": "KS", "Kentucky": "KY",
+    "Louisiana": "LA", "Maine": "ME", "Maryland": "MD", "Massachusetts": "MA", "Michigan": "MI", "Minnesota": "MN",
+    "Mississippi": "MS", "Missouri": "MO", "Montana": "MT", "Nebraska": "NE", "Nevada": "NV", "New Hampshire": "NH",
+    "New Jersey": "NJ", "New Mexico": "NM", "New York": "NY", "North Carolina": "NC", "North Dakota": "ND",
+    "Ohio": "OH", "Oklahoma": "OK", "Oregon": "OR", "Pennsylvania": "PA", "Rhode Island": "RI",
+    "South Carolina": "SC", "South Dakota": "SD", "Tennessee": "TN", "Texas": "TX", "Utah": "UT", "Vermont": "VT",
+    "Virginia": "VA", "Washington": "WA", "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
+}
+STATE_WORKERS = None #Processes used to merge the states. None = one per CPU core
 
 # ---------------------------------------------------
 # Data File Names
@@ -42,13 +93,109 @@ GOOGLE_SEARCH_TERM = "homes for sale"
 #Downloaded CSV Files
 KAGGLE_NAME = "kaggle_housing.csv"
 FRED_NAME = "mortgage_rates.csv"
+FRED_BULK_NAME = "fred_bulk.csv" #All the FRED_BULK_SERIES observations in one long table (series_id, date, value)
 GOOGLE_NAME = "google_trends_" + GOOGLE_SEARCH_TERM + ".csv"
+GOOGLE_STATE_NAME = "google_trends_states_" + GOOGLE_SEARCH_TERM + ".csv" #Every state in one long table (state_code, date, search term)
 
 #Processed/Clean CSV Files
 KAGGLE_NAME_CLEAN = "realtor_clean.csv"
+KAGGLE_NAME_MONTHLY = "realtor_monthly.csv" #Monthly price sums and counts so merging doesn't have to re-read every row
+REALTOR_CACHE_NAME = "realtor_cache" #Folder with realtor_clean as NumPy arrays, opened instantly by later steps (see realtor_cache.py)
 FRED_NAME_CLEAN = "mortgage_clean.csv"
+FRED_BULK_NAME_CLEAN = "fred_bulk_clean.csv" #One row per month, one column per FRED_BULK_SERIES
 GOOGLE_NAME_CLEAN = "google_clean.csv"
 MERGED_CLEAN = "merged_clean.csv"
+GOOGLE_STATE_NAME_CLEAN = "google_states_clean.csv"
+STATE_MERGED_CLEAN = "state_merged_clean.csv" #One row per state and month
+
+#HTTP settings for FRED requests (see http_session.py)
+HTTP_TIMEOUT = 30 #Seconds to wait for FRED to answer
+HTTP_RETRIES = 5 #How many times to retry when FRED says "too many requests" (429) or has a server error (5xx)
+HTTP_BACKOFF = 1 #Seconds before the first retry. Doubles every retry (1, 2, 4, 8 ...)
+HTTP_POOL_SIZE = 10 #How many connections to keep open
+
+#Download cache: keeps a copy of each download in data/cache so --load doesn't re-download unchanged data
+DOWNLOAD_CACHE_DIR = DATA_DIR / "cache"
+USE_DOWNLOAD_CACHE = True
+CACHE_TTL = { #Seconds a cached download is trusted without asking upstream. After that Kaggle/FRED are asked for their version
+    "kaggle": 7 * 24 * 60 * 60, #1 week
+    "fred": 24 * 60 * 60, #1 day (FRED updates mortgage rates weekly)
+    "google": 7 * 24 * 60 * 60, #1 week (Google Trends has no version to check so it is re-downloaded after this)
+}
+
+CONCURRENT_LOAD = True #Download Kaggle, FRED and Google Trends at the same time instead of one after another
+
+#File format for everything saved in data/ and data/processed/ (file names above keep .csv but the extension follows this)
+#"csv" = text files you can open in Excel (default)
+#"parquet" = typed columnar files (needs pyarrow). Much faster to reload between load, process and analyze
+DATA_FORMAT = "csv"
+RAW_DATE_FORMAT = "%Y-%m-%d" #How dates look in the downloaded Kaggle, FRED and Google files. Others are still read, just slower (see dates.py)
+
+#Derived columns added to the merged data (see features.py): % change, direction, log change, lag and lead
+FEATURE_SERIES = { #Merged column: short name used in the new column names. Any merged column can be added (ex: "UNRATE": "unrate")
+    "avg_price": "price",
+    "mortgage_rate": "mortgage",
+    "search_interest": "search",
+}
+FEATURE_HORIZONS = [1, 3, 6, 12] #Months to compare against. 12 = year over year
+
+#Benchmarks (see bench.py and synthetic.py)
+BENCH_DATA_DIR = DATA_DIR / "bench" #Synthetic input files, one folder per size
+BENCH_RESULTS_DIR = RESULTS_DIR / "bench" #latest.json and baseline.json
+BENCH_SIZES = ["100k", "1M"] #Kaggle rows to benchmark with. Can go up to "50M" (needs ~5 GB of disk for the CSV)
+BENCH_TOLERANCE = 0.25 #A stage more than 25% slower (or bigger) than the baseline is flagged as a regression
+
+#Lead/lag analysis (see leadlag.py)
+LEAD_LAG_MAX_LAG = 36 #Months before and after
+LEAD_LAG_MIN_PERIODS = 24 #A lag with fewer overlapping months than this gets no correlation
+LEAD_LAG_CHANGES = True #Compare month-to-month changes instead of levels (levels that both trend up look related at every lag)
+LEAD_LAG_SERIES = ["avg_price", "price_median", "mortgage_rate", "search_interest"] + FRED_BULK_SERIES #merged_clean columns compared
+LEAD_LAG_FOCUS = "search_interest" #The correlogram shows this series against each of the others
+STATE_LEAD_LAG_PAIR = ("search_interest", "price_median") #Compared inside every state
+
+#Seasonal decomposition (see seasonal.py): trend + seasonal + residual of every SEASONAL_SERIES column. The merged data
+#and the state data get a deseasonalized copy of each one (value - seasonal part) named <column>_sa ("seasonally adjusted")
+SEASONAL_SERIES = ["avg_price", "price_median", "mortgage_rate", "search_interest"] + FRED_BULK_SERIES
+SEASONAL_PERIOD = 12 #Months in one cycle
+SEASONAL_MIN_CYCLES = 2 #Years each calendar month needs (with a trend value) before a series gets a seasonal part
+SEASONAL_SUFFIX = "_sa"
+
+#Keyword correlations (plot_keyword_heatmap in analyze.py): every GOOGLE_KEYWORDS search against every other one and
+#against these merged columns, all in one matrix
+KEYWORD_MACRO_SERIES = ["avg_price", "price_median", "mortgage_rate"] + FRED_BULK_SERIES
+KEYWORD_ANNOTATE_LIMIT = 15 #The heatmap writes the numbers in the squares only up to this many rows (too small to read after)
+
+#Sweep (main.py sweep, see sweep.py): the correlations, trend lines and graphs for many periods at once.
+#Every window is combined with every mask and every season (3 x 3 x 3 = 27 variants by default).
+#Windows only go as far as START_DATE/END_DATE (the merged data doesn't have other months)
+SWEEP_WINDOWS = { #Name: (first month, last month). None = no limit
+    "all": (None, None),
+    "2004-2012": (None, "2012-12-31"),
+    "2013-2024": ("2013-01-01", None),
+}
+SWEEP_MASKS = { #Name: periods left out, ex: major events
+    "none": [],
+    "no_2008": [("2007-12-01", "2009-06-30")], #Great Recession
+    "no_2008_2020": [("2007-12-01", "2009-06-30"), ("2020-03-01", "2021-12-31")], #and the COVID-19 years
+}
+SWEEP_SEASONS = { #Name: months kept (1 = January). None = all
+    "all_year": None,
+    "summer": [6, 7, 8],
+    "winter": [12, 1, 2],
+}
+SWEEP_SERIES = ["avg_price", "price_median", "mortgage_rate", "search_interest", #Correlation of every pair (merged_clean columns)
+                "avg_price_sa", "search_interest_sa"]
+SWEEP_REGRESSIONS = [("search_interest", "mortgage_rate"), ("search_interest", "avg_price"), #(x, y) trend lines
+                     ("search_interest_sa", "avg_price_sa")]
+SWEEP_PLOTS = ["plot_scatter_search_vs_mortgage", "plot_scatter_search_vs_price", "plot_correlation_heatmap"] #analyze.py graphs per variant. [] = table only
+SWEEP_MIN_MONTHS = 12 #Variants with fewer months get no numbers or graphs
+SWEEP_DIR = RESULTS_DIR / "sweep" #sweep_summary.csv plus one folder of graphs per variant
+SWEEP_SUMMARY_NAME = "sweep_summary.csv" #One row per variant
+SWEEP_WORKERS = None #Processes used. None = one per CPU core (never more than the number of variants)
+
+#Profiling (main.py --profile, see profiler.py)
+PROFILE_DIR = RESULTS_DIR / "profile" #profile_summary.json and profile_trace.json
+PROFILE_TRACEMALLOC = False #Also record Python memory peaks with tracemalloc (more detail, but everything runs ~2x slower)
 
 #Plots
 TIME_SERIES_NAME = "time_series.png"
@@ -57,6 +204,31 @@ GOOGLE_FRED_NAME = "search_vs_mortgage.png"
 GOOGLE_KAGGLE_NAME = "search_vs_price.png"
 HEATMAP_NAME = "correlation_heatmap.png"
 PAIRPLOT_NAME = "pairplot.png"
+STATE_CORRELATIONS_NAME = "state_correlations.csv" #Correlations for every state (table)
+STATE_CORRELATIONS_PLOT_NAME = "state_correlations.png"
+LEAD_LAG_NAME = "lead_lag.csv" #Correlation of every pair of series at every lag (see leadlag.py)
+LEAD_LAG_BEST_NAME = "lead_lag_best.csv" #The strongest lag of each pair and which series moves first
+LEAD_LAG_PLOT_NAME = "lead_lag_correlogram.png"
+STATE_LEAD_LAG_NAME = "state_lead_lag.csv" #STATE_LEAD_LAG_PAIR at every lag in every state
+SEASONAL_PLOT_NAME = "seasonal_decomposition.png" #Trend, seasonal and residual parts of every SEASONAL_SERIES column
+KEYWORD_CORRELATIONS_NAME = "keyword_correlations.csv" #Every GOOGLE_KEYWORDS search against every other one and KEYWORD_MACRO_SERIES
+KEYWORD_HEATMAP_NAME = "keyword_heatmap.png"
+
+#Trend lines in the scatter plots and the pair plot (see regression.py)
+FAST_REGRESSION = True #Exact confidence band from a formula. False = seaborn's regplot (bootstraps 1000 refits per graph, slow)
+REGRESSION_CI = 95 #Confidence band around the trend lines in %. None = no band
+
+#Results the graphs work out from the data (rolling averages, correlations, trend line fits, lead/lag tables) are
+#remembered and re-used while the data and settings stay the same (see analysis_cache.py)
+USE_ANALYSIS_CACHE = True
+ANALYSIS_CACHE_DIR = DOWNLOAD_CACHE_DIR / "analysis" #Saved between runs and shared by the graph processes. None = memory only
+ANALYSIS_CACHE_SIZE = 64 #Results kept in memory (the least recently used are dropped first)
+ANALYSIS_CACHE_DISK_ITEMS = 256 #Files kept in ANALYSIS_CACHE_DIR (the least recently used are deleted first)
+
+#Plots are only saved (never shown on screen) so draw them without a window. Needed to draw them in parallel
+HEADLESS_PLOTS = True
+PARALLEL_PLOTS = True #Draw the graphs at the same time in separate processes (one per CPU core)
+PLOT_WORKERS = None #How many processes to use. None = one per CPU core (never more than the number of graphs)
 
 
 # ---------------------------------------------------
@@ -64,5 +236,24 @@ PAIRPLOT_NAME = "pairplot.png"
 # ---------------------------------------------------
 START_DATE = "2004-12-31"
 END_DATE   = "2024-12-31"
-time_sleep = 20 #Wait time between google requests. This is here so you can speed it up if it works for you.
-    #Default is 20 seconds which is what worked for me. This is used two times so 40 seconds total.
+KAGGLE_CHUNKSIZE = 250000 #Rows read at a time from the Kaggle CSV. Keeps memory flat no matter how big the file is.
+    #Set to None to read the whole file at once (old behavior)
+#Monthly median, 10th and 90th percentile prices are found with quantile sketches while the chunks are read (see sketch.py)
+SKETCH_K = 200 #Sketch size. Medians of big months are off by about 1% in rank (1.7 / SKETCH_K). Bigger = more accurate
+SKETCH_EXACT_LIMIT = 20000 #Months with up to this many sales are kept exactly, so their median is exact
+PRICE_QUANTILES = {"price_p10": 0.1, "price_median": 0.5, "price_p90": 0.9} #Column name: percentile
+time_sleep = 20 #Longest wait time between google requests. This is here so you can speed it up if it works for you.
+    #Default is 20 seconds which is what worked for me. The rate limiter below only waits this long when Google throttles us.
+
+#Google Trends rate limiter (see rate_limiter.py). Instead of always sleeping time_sleep, requests go as fast as Google allows
+#and only slow down when Google says "too many requests" (429). time_sleep (or --sleep) becomes the longest wait allowed
+TRENDS_RATE_LIMIT = {
+    "max_rate": 1.0, #Requests per second when Google isn't throttling us
+    "min_rate": 1 / time_sleep, #Slowest rate (1 request every time_sleep seconds). Replaced by 1 / --sleep when it is used
+    "burst": 2, #Requests that can go back to back with no wait at all
+    "increase": 0.05, #Rate added after every request that works
+    "decrease": 0.5, #Rate is multiplied by this every time Google throttles us
+    "recovery": 0.01, #Rate added back for every second that passes
+}
+TRENDS_MAX_RETRIES = 5 #How many times to retry a throttled Google Trends request
+TRENDS_LIMITER_STATE = DOWNLOAD_CACHE_DIR / "trends_rate_limiter.json" #Remembers the rate between runs
@@ -0,0 +1,82 @@
+#This code turns date text into datetimes (and datetimes back into text) one distinct value at a time
+#The Kaggle file has over 2 million sale dates but only a few thousand different ones, so instead of reading every row:
+#   1. each row gets a number for its date text (pd.factorize), ex: "2019-05-01" -> 17
+#   2. only the distinct date texts are converted, with the expected format first and, for any that don't fit,
+#      pandas' slower guess-the-format reader (fallback)
+#   3. the converted dates are copied back to every row using the numbers from step 1
+#The same goes the other way when saving dates as text in a CSV (format_dates).
+#DateStats counts the rows that couldn't be read (turned into NaT) across all the chunks of a file
+
+import numpy as np
+import pandas as pd
+
+
+class DateStats:
+    # Counts for one date column. Add it to to_datetime(stats=...) for every chunk, then print it with report()
+    def __init__(self, name="date"):
+        self.name = name
+        self.rows = 0
+        self.distinct = 0 #distinct date texts per chunk, added up
+        self.missing = 0 #rows that were empty to begin with
+        self.fallback = 0 #rows that didn't fit the format but were read by the fallback
+        self.coerced = 0 #rows with text that couldn't be read at all (now NaT)
+        self.examples = [] #a few of the texts that couldn't be read
+
+    def report(self):
+        print(f"  {self.name}: {self.rows:,} rows, {self.distinct:,} distinct dates, {self.missing:,} empty, "
+              f"{self.fallback:,} read by the fallback, {self.coerced:,} could not be read (NaT)")
+        if self.examples:
+            print(f"  {self.name} examples that could not be read: {', '.join(map(repr, self.examples))}")
+
+
+def parse_distinct(texts, date_format=None):
+    # Converts each distinct text once. Returns (datetimes, read by the fallback) as arrays the same length as texts
+    texts = pd.Index(texts)
+    if date_format is None:
+        parsed = pd.to_datetime(texts, errors="coerce").to_numpy()
+        return parsed, np.zeros(len(texts), dtype=bool)
+
+    parsed = pd.to_datetime(texts, format=date_format, errors="coerce").to_numpy(copy=True)
+    failed = np.isnat(parsed)
+    fallback = np.zeros(len(texts), dtype=bool)
+    if failed.any():
+        retried = pd.to_datetime(texts[failed], format="mixed", errors="coerce").to_numpy().astype(parsed.dtype)
+        parsed[failed] = retried
+        fallback[failed] = ~np.isnat(retried)
+    return parsed, fallback
+
+
+def to_datetime(values, date_format=None, errors="coerce", stats=None) -> pd.Series:
+    # Same result as pd.to_datetime(values, errors=errors), but each distinct value is converted only once
+    # date_format = the format most values have (ex: "%Y-%m-%d"), values that don't fit it go to the fallback
+    # errors = "coerce" turns unreadable values into NaT, "raise" stops with a ValueError
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    codes, distinct = pd.factorize(values, use_na_sentinel=True) #empty values get code -1
+    parsed, fallback = parse_distinct(distinct, date_format)
+    unreadable = np.isnat(parsed)
+    if errors == "raise" and unreadable.any():
+        raise ValueError(f"Could not read {unreadable.sum()} date value(s) with format {date_format!r}, "
+                         f"ex: {list(distinct[unreadable][:3])}")
+
+    # The NaT added at the end is what code -1 (empty) picks up
+    dates = np.append(parsed, np.array("NaT", dtype=parsed.dtype))[codes]
+
+    if stats is not None:
+        rows_per_value = np.bincount(codes[codes >= 0], minlength=len(distinct))
+        stats.rows += len(values)
+        stats.distinct += len(distinct)
+        stats.missing += int((codes < 0).sum())
+        stats.fallback += int(rows_per_value[fallback].sum())
+        stats.coerced += int(rows_per_value[unreadable].sum())
+        stats.examples = (stats.examples + [str(v) for v in distinct[unreadable][:3]])[:3]
+    return pd.Series(dates, index=values.index, name=values.name)
+
+
+def format_dates(values, date_format) -> pd.Series:
+    # Same result as values.dt.strftime(date_format) (NaT stays empty), but each distinct date is formatted only once
+    codes, distinct = pd.factorize(values, use_na_sentinel=True)
+    texts = pd.DatetimeIndex(distinct).strftime(date_format).to_numpy(dtype=object)
+    return pd.Series(np.append(texts, np.nan)[codes], index=values.index, name=values.name)
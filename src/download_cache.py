@@ -0,0 +1,140 @@
+#This code keeps a copy of every download (Kaggle, FRED, Google Trends) in "data/cache" so that running
+#--load again doesn't re-download everything when nothing has changed upstream.
+#Each download gets a small manifest (JSON) that records:
+#   the request parameters, the upstream version (Kaggle dataset version / FRED last_updated), when it was fetched,
+#   and a checksum of the file. The file itself is stored under its checksum (content-addressed) in "data/cache/objects"
+#A cached copy is used when it is younger than the TTL for that source (see CACHE_TTL in config.py).
+#Once it is older than that, the upstream version is checked and the copy is still used if the version hasn't changed.
+
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+from config import DOWNLOAD_CACHE_DIR, CACHE_TTL
+
+
+def file_checksum(path, block_size=1024 * 1024) -> str:
+    # SHA-256 of a file, read a block at a time so big files aren't loaded into memory
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def entry_key(source, params) -> str:
+    # Same source + same request parameters = same cache entry
+    text = json.dumps({"source": source, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def manifest_path(source, params, cache_dir=DOWNLOAD_CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{source}-{entry_key(source, params)}.json"
+
+
+def object_path(checksum, suffix, cache_dir=DOWNLOAD_CACHE_DIR) -> Path:
+    return Path(cache_dir) / "objects" / f"{checksum}{suffix}"
+
+
+def read_manifest(source, params, cache_dir=DOWNLOAD_CACHE_DIR):
+    path = manifest_path(source, params, cache_dir)
+    if not path.exists():
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None #Broken manifest = treat as not cached
+
+
+def write_manifest(manifest, cache_dir=DOWNLOAD_CACHE_DIR):
+    path = manifest_path(manifest["source"], manifest["params"], cache_dir)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(path) #Replace in one step so a crash never leaves half a manifest
+
+
+def lookup(source, params, get_version=None, ttl=None, cache_dir=DOWNLOAD_CACHE_DIR):
+    # Returns the manifest of a usable cached copy, or None if it needs to be downloaded again
+    # get_version is a function that asks upstream for its current version. It is only called once the TTL runs out
+    manifest = read_manifest(source, params, cache_dir)
+    if manifest is None:
+        return None
+
+    blob = object_path(manifest["checksum"], manifest["suffix"], cache_dir)
+    if not blob.exists() or blob.stat().st_size != manifest["size"]:
+        return None
+
+    if ttl is None:
+        ttl = CACHE_TTL.get(source, 0)
+
+    age = time.time() - manifest["fetched_at"]
+    if age < ttl:
+        return manifest
+
+    # TTL ran out. If upstream can tell us its version and it's the same one, the copy is still good
+    if get_version is None or manifest.get("version") is None:
+        return None
+
+    try:
+        current_version = get_version()
+    except Exception as e:
+        print(f"CACHE WARNING: Could not check the {source} version, downloading again. Reason:", e)
+        return None
+
+    if current_version is None or str(current_version) != manifest["version"]:
+        return None
+
+    manifest["fetched_at"] = time.time() #Confirmed fresh, so start the TTL over
+    write_manifest(manifest, cache_dir)
+    return manifest
+
+
+def restore(manifest, data_dir, filename, cache_dir=DOWNLOAD_CACHE_DIR) -> Path:
+    # Copies the cached file back into the data folder under the usual file name
+    # (a copy, not a link, so later edits of the data file can never change the cached one)
+    blob = object_path(manifest["checksum"], manifest["suffix"], cache_dir)
+    out_path = Path(data_dir) / Path(filename).with_suffix(manifest["suffix"]).name
+    shutil.copyfile(blob, out_path)
+    return out_path
+
+
+def store(source, params, path, version=None, cache_dir=DOWNLOAD_CACHE_DIR):
+    # Saves a fresh download into the cache and records its manifest
+    path = Path(path)
+    old_manifest = read_manifest(source, params, cache_dir)
+    checksum = file_checksum(path)
+    blob = object_path(checksum, path.suffix, cache_dir)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    if not blob.exists():
+        shutil.copyfile(path, blob)
+
+    manifest = {
+        "source": source,
+        "params": params,
+        "version": None if version is None else str(version),
+        "fetched_at": time.time(),
+        "checksum": checksum,
+        "suffix": path.suffix,
+        "size": path.stat().st_size,
+    }
+    write_manifest(manifest, cache_dir)
+
+    # Delete the previous version of this entry unless another entry still uses the same file
+    if old_manifest is not None and old_manifest["checksum"] != checksum:
+        remove_unused_object(old_manifest["checksum"], old_manifest["suffix"], cache_dir)
+
+    return manifest
+
+
+def remove_unused_object(checksum, suffix, cache_dir=DOWNLOAD_CACHE_DIR):
+    for other in Path(cache_dir).glob("*.json"):
+        try:
+            with open(other) as f:
+                if json.load(f).get("checksum") == checksum:
+                    return
+        except (OSError, ValueError):
+            continue
+    object_path(checksum, suffix, cache_dir).unlink(missing_ok=True)
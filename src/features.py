@@ -0,0 +1,82 @@
+#This code adds the "derived" columns to the merged data: how much each series changed over 1, 3, 6 and 12 months
+#(12 = year over year), whether it went up or down, and its value some months before (lag) and after (lead)
+#All the series and horizons are done together as one NumPy array (rows = months, columns = series) instead of
+#one pandas column or one row at a time, so adding more series or horizons stays fast
+#
+#Columns made for each series and horizon h (names use the short name from FEATURE_SERIES in config.py, ex: "price"):
+#   <name>_pct_change_<h>m  % change from h months before, rounded to 1 decimal
+#   <name>_direction_<h>m   1 = went up, 0 = no change, -1 = went down (or unknown, same as the old columns)
+#   <name>_log_diff_<h>m    log(now) - log(h months before), same as % change but adds up across months
+#   <name>_lag_<h>m         value h months before
+#   <name>_lead_<h>m        value h months after
+#For h = 1 the "_1m" is left off the % change and direction columns so they keep their old names (ex: price_pct_change)
+#
+#Rows must be sorted by month with one row per month (process_merge_data does this). A horizon of h means h rows
+
+import numpy as np
+import pandas as pd
+from config import FEATURE_SERIES, FEATURE_HORIZONS
+from profiler import profiled
+
+FEATURE_KINDS = ["pct_change", "direction", "log_diff", "lag", "lead"]
+
+
+def feature_name(name, kind, horizon) -> str:
+    if horizon == 1 and kind in ("pct_change", "direction"):
+        return f"{name}_{kind}"
+    return f"{name}_{kind}_{horizon}m"
+
+
+def shift_rows(values, periods):
+    # Same as pandas .shift() for a 2D array: positive = value from earlier rows, negative = value from later rows
+    shifted = np.full(values.shape, np.nan)
+    if periods > 0:
+        shifted[periods:] = values[:-periods]
+    elif periods < 0:
+        shifted[:periods] = values[-periods:]
+    else:
+        shifted[:] = values
+    return shifted
+
+
+def direction(pct_change):
+    # 1 if up, 0 if no change, -1 otherwise. Missing values give -1 like the old .apply(lambda ...) did
+    return np.where(pct_change > 0, 1, np.where(pct_change == 0, 0, -1))
+
+
+def compute_features(df, series=FEATURE_SERIES, horizons=FEATURE_HORIZONS) -> pd.DataFrame:
+    # Returns a new DataFrame (same index as df) with every feature column for every series and horizon
+    missing = [column for column in series if column not in df.columns]
+    if missing:
+        print("FEATURE WARNING: These columns are not in the merged data and were skipped:", ", ".join(missing))
+    columns = [column for column in series if column in df.columns]
+    names = [series[column] for column in columns]
+
+    values = df[columns].to_numpy(dtype="float64") #rows = months, columns = series
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.where(values > 0, np.log(values), np.nan) #log of 0 or a negative number = missing
+
+    features = {}
+    for horizon in horizons:
+        before = shift_rows(values, horizon)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct_change = np.round((values - before) / before * 100, 1)
+        blocks = {
+            "pct_change": pct_change,
+            "direction": direction(pct_change),
+            "log_diff": logs - shift_rows(logs, horizon),
+            "lag": before,
+            "lead": shift_rows(values, -horizon),
+        }
+        for kind in FEATURE_KINDS:
+            for i, name in enumerate(names):
+                features[feature_name(name, kind, horizon)] = blocks[kind][:, i]
+
+    return pd.DataFrame(features, index=df.index)
+
+
+@profiled("features")
+def add_features(df, series=FEATURE_SERIES, horizons=FEATURE_HORIZONS) -> pd.DataFrame:
+    # Adds the feature columns to the end of df (all at once, so pandas doesn't copy the table once per column)
+    features = compute_features(df, series, horizons)
+    return pd.concat([df.drop(columns=[c for c in features.columns if c in df.columns]), features], axis=1)
@@ -0,0 +1,41 @@
+#This code makes one shared requests.Session for every HTTP call in the project (FRED for now)
+#A Session keeps connections open between requests (keep-alive) instead of reconnecting every time,
+#and the retry settings below automatically wait and try again when the server says "too many requests" (429)
+#or has a temporary error (500, 502, 503, 504). Each wait is twice as long as the one before (exponential backoff)
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import HTTP_RETRIES, HTTP_BACKOFF, HTTP_POOL_SIZE
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock() #run_load can call get_session from several threads at once
+
+
+def make_session(retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=HTTP_POOL_SIZE) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff, #waits backoff, 2*backoff, 4*backoff, ... seconds between tries
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True, #if the server says how long to wait, wait that long
+        raise_on_status=False, #give back the last response so raise_for_status() shows the real error
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    # Gives back the same session every time so connections are reused
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = make_session()
+        return _session
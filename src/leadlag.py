@@ -0,0 +1,133 @@
+#This code checks if one monthly series moves before another one (leads) or after it (lags), ex: do searches for
+#"homes for sale" go up a few months before prices do?
+#For a pair of series a and b and every lag from -max_lag to +max_lag months it gives the correlation of
+#   a(month) with b(month + lag)
+#so when the strongest correlation is at a positive lag, a moves first (a leads b by that many months).
+#Months where either series is missing are skipped for that pair and lag (same as pandas a.corr(b.shift(-lag))).
+#Every lag of every pair is found at once with FFTs (Fast Fourier Transforms) instead of one .corr() per lag,
+#so thousands of pairs (keywords x states x macro series) take about as long as a handful
+
+import numpy as np
+import pandas as pd
+from config import LEAD_LAG_MAX_LAG, LEAD_LAG_MIN_PERIODS, LEAD_LAG_CHANGES
+
+
+def lags(max_lag=LEAD_LAG_MAX_LAG):
+    return np.arange(-max_lag, max_lag + 1)
+
+
+def fft_length(n):
+    # Smallest power of 2 that is at least n (FFTs are fastest at these lengths)
+    return 1 << max(0, int(n - 1).bit_length())
+
+
+def lagged_sums(spectrum_a, spectrum_b, n_fft, max_lag):
+    # sum over months t of a[t] * b[t + lag] for every lag and every column, from the FFTs of a and b
+    # Gives an array of (lags, columns). Negative lags wrap around to the end of the inverse FFT
+    sums = np.fft.irfft(np.conj(spectrum_a) * spectrum_b, n=n_fft, axis=0)
+    return sums[np.r_[n_fft - max_lag:n_fft, 0:max_lag + 1]]
+
+
+def cross_correlation(left, right, max_lag=LEAD_LAG_MAX_LAG, min_periods=LEAD_LAG_MIN_PERIODS):
+    # left and right are (months, pairs) arrays: column p of left is compared with column p of right
+    # Returns (correlation, months used), both (pairs, lags). Correlations with fewer than min_periods months are NaN
+    left = np.asarray(left, dtype="float64")
+    right = np.asarray(right, dtype="float64")
+    if left.ndim == 1:
+        left, right = left[:, None], right[:, None]
+    months = left.shape[0]
+    max_lag = min(max_lag, months - 1)
+
+    # Pearson correlation from sums: with m = 1 where a value is there (0 where missing), every sum below is a lagged
+    # sum of two columns (ex: count = m_a * m_b, sum_ab = a * b). Centering first keeps the sums small and accurate
+    n_fft = fft_length(months + max_lag)
+    spectra = {}
+    for side, values in (("a", left), ("b", right)):
+        present = ~np.isnan(values)
+        centered = np.where(present, values - np.nanmean(np.where(present, values, np.nan), axis=0), 0.0)
+        for name, column in (("m", present.astype("float64")), ("x", centered), ("xx", centered ** 2)):
+            spectra[side + name] = np.fft.rfft(column, n=n_fft, axis=0)
+
+    def sums(a, b):
+        return lagged_sums(spectra["a" + a], spectra["b" + b], n_fft, max_lag)
+
+    count = np.rint(sums("m", "m"))
+    sum_a, sum_b = sums("x", "m"), sums("m", "x")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = sums("x", "x") - sum_a * sum_b / count
+        variance_a = sums("xx", "m") - sum_a ** 2 / count
+        variance_b = sums("m", "xx") - sum_b ** 2 / count
+        correlation = covariance / np.sqrt(variance_a * variance_b)
+    bad = (count < max(min_periods, 2)) | (variance_a <= 1e-12 * np.abs(sums("xx", "m"))) | (variance_b <= 1e-12 * np.abs(sums("m", "xx")))
+    correlation = np.where(bad, np.nan, np.clip(correlation, -1, 1))
+    return correlation.T, count.T.astype("int64")
+
+
+def monthly_frame(df, columns, date_column="month", changes=LEAD_LAG_CHANGES) -> pd.DataFrame:
+    # One row for every month (missing months become empty rows so a lag of 1 is always 1 month)
+    # changes = compare month-to-month changes instead of levels (two series that both trend up look related at every lag)
+    df = df.set_index(date_column)[columns].sort_index().astype("float64")
+    df = df[~df.index.duplicated()].asfreq("MS")
+    return df.diff() if changes else df
+
+
+def lead_lag_table(df, columns, max_lag=LEAD_LAG_MAX_LAG, min_periods=LEAD_LAG_MIN_PERIODS,
+                   date_column="month", changes=LEAD_LAG_CHANGES) -> pd.DataFrame:
+    # Every pair of columns (each pair once) at every lag: series_a, series_b, lag, correlation, months
+    columns = [c for c in columns if c in df.columns]
+    wide = monthly_frame(df, columns, date_column, changes)
+    first, second = np.triu_indices(len(columns), k=1)
+    values = wide.to_numpy()
+    correlation, count = cross_correlation(values[:, first], values[:, second], max_lag, min_periods)
+
+    lag_values = lags(correlation.shape[1] // 2)
+    names = np.array(columns, dtype=object)
+    return pd.DataFrame({
+        "series_a": np.repeat(names[first], len(lag_values)),
+        "series_b": np.repeat(names[second], len(lag_values)),
+        "lag": np.tile(lag_values, len(first)),
+        "correlation": correlation.ravel(),
+        "months": count.ravel(),
+    })
+
+
+def grouped_lead_lag(df, group_column, a, b, max_lag=LEAD_LAG_MAX_LAG, min_periods=LEAD_LAG_MIN_PERIODS,
+                     date_column="month", changes=LEAD_LAG_CHANGES) -> pd.DataFrame:
+    # Column a vs column b inside every group (ex: search_interest vs price_median in each state), all groups at once
+    # Returns group_column, lag, correlation, months
+    wide_a = df.pivot_table(index=date_column, columns=group_column, values=a, observed=True)
+    wide_b = df.pivot_table(index=date_column, columns=group_column, values=b, observed=True)
+    groups = wide_a.columns.intersection(wide_b.columns)
+    wide_a = monthly_frame(wide_a[groups].reset_index(), list(groups), date_column, changes)
+    wide_b = monthly_frame(wide_b[groups].reset_index(), list(groups), date_column, changes)
+    correlation, count = cross_correlation(wide_a.to_numpy(), wide_b.to_numpy(), max_lag, min_periods)
+
+    lag_values = lags(correlation.shape[1] // 2)
+    return pd.DataFrame({
+        group_column: np.repeat(np.asarray(groups, dtype=object), len(lag_values)),
+        "lag": np.tile(lag_values, len(groups)),
+        "correlation": correlation.ravel(),
+        "months": count.ravel(),
+    })
+
+
+def best_lags(table, keys=("series_a", "series_b")) -> pd.DataFrame:
+    # The lag with the strongest correlation (largest absolute value) for each pair, next to the same-month correlation
+    keys = list(keys)
+    table = table.dropna(subset=["correlation"])
+    if table.empty:
+        return pd.DataFrame(columns=keys + ["lag", "correlation", "months", "same_month_correlation", "leader"])
+    best = table.loc[table["correlation"].abs().groupby([table[k] for k in keys]).idxmax()]
+    same_month = table[table["lag"] == 0].set_index(keys)["correlation"].rename("same_month_correlation")
+    best = best.join(same_month, on=keys)
+    if "series_a" in keys:
+        best["leader"] = np.select([best["lag"] > 0, best["lag"] < 0], [best["series_a"], best["series_b"]], "same month")
+    return best.sort_values(by="correlation", key=np.abs, ascending=False).reset_index(drop=True)
+
+
+def focus_view(table, focus):
+    # The rows that involve the focus series, turned so the focus is always series_a (lags flipped where needed)
+    as_a = table[table["series_a"] == focus]
+    as_b = table[table["series_b"] == focus].rename(columns={"series_a": "series_b", "series_b": "series_a"})
+    as_b = as_b.assign(lag=-as_b["lag"])
+    return pd.concat([as_a, as_b[as_a.columns]], ignore_index=True).sort_values(by=["series_b", "lag"])
@@ -1,28 +1,46 @@
 #This code will pull data from 3 locations:
 #Kaggle Housing Prices, Federal Reserve 30-Year Fixed Mortgage Rates, and Google Trends-Homes for sale
-#Data will be saved as CSV files in "data" folder in the parent directory
+#Data will be saved as CSV (or parquet, see DATA_FORMAT in config.py) files in "data" folder in the parent directory
 
 import os
-import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import requests
 from pytrends.request import TrendReq
 from config import (
+    ensure_dirs,
     DATA_DIR,
     KAGGLE_CONFIG_DIR,
     FRED_API_KEY,
     KAGGLE_DATASET,
     FRED_SERIES_ID,
     FRED_API_URL,
+    FRED_SERIES_URL,
+    FRED_BASE_URL,
+    FRED_BULK_SERIES,
+    FRED_BULK_NAME,
     GOOGLE_SEARCH_TERM,
+    GOOGLE_EXTRA_KEYWORDS,
+    GOOGLE_KEYWORDS_PER_REQUEST,
     KAGGLE_NAME, FRED_NAME, GOOGLE_NAME,
+    GOOGLE_STATE_NAME, STATE_CODES, STATE_LEVEL,
     START_DATE, END_DATE, time_sleep,
+    DATA_FORMAT,
+    USE_DOWNLOAD_CACHE,
+    HTTP_TIMEOUT,
+    TRENDS_MAX_RETRIES,
+    TRENDS_LIMITER_STATE,
 )
+from storage import TABLE_SUFFIXES, write_table, read_table, find_table, convert_csv_to_table
+from http_session import get_session
+from rate_limiter import get_trends_limiter, call_with_limiter, is_throttled
+import download_cache
+from profiler import profiled, span
 
 def clear_data_folder(data_dir=DATA_DIR):
     # ----- CLEAN DATA FOLDER BEFORE STARTING -----
     for f in os.listdir(data_dir):
-        if f.endswith(".csv"):
+        if f.endswith(tuple(TABLE_SUFFIXES.values())):
             os.remove(data_dir / f)
     #print("Cleaned old CSV files from data directory.")
 
@@ -30,47 +48,99 @@ def clear_data_folder(data_dir=DATA_DIR):
 #kaggle is also imported below but needs to be below path normalization because we're changing default location of kaggle API
 
 
-def kaggle_housing(data_dir=DATA_DIR, dataset=KAGGLE_DATASET, kaggle_config_dir = KAGGLE_CONFIG_DIR, KAGGLE_NAME = KAGGLE_NAME): #kaggle is a website with databases for public use
-    #----------------------KAGGLE - Housing Prices Data Collection---------------------------
-    #os.environ["KAGGLE_CONFIG_DIR"] = kaggle_config_dir  # Location of Kaggle API Key found from .env file
-    # Validate Kaggle config directory
-    try:
-        if not kaggle_config_dir or not os.path.isdir(kaggle_config_dir):
-            raise FileNotFoundError(
-                f"Kaggle config directory not found: {kaggle_config_dir}"
-            )
+def kaggle_dataset_version(dataset=KAGGLE_DATASET):
+    # Asks Kaggle for the current version of the dataset (used by the download cache to know if it changed)
+    # Only call this after KAGGLE_CONFIG_DIR is set (see kaggle_housing)
+    import kaggle
+    owner, slug = dataset.split("/", 1)
+    for found in kaggle.api.dataset_list(user=owner, search=slug):
+        if str(getattr(found, "ref", "")) == dataset:
+            # Attribute names changed between kaggle package versions so try both spellings
+            version = getattr(found, "currentVersionNumber", None) or getattr(found, "current_version_number", None)
+            updated = getattr(found, "lastUpdated", None) or getattr(found, "last_updated", None)
+            return f"v{version} {updated}"
+    return None
 
-        # Apply it ONLY after confirming it exists
-        os.environ["KAGGLE_CONFIG_DIR"] = kaggle_config_dir #os.environ is a built-in Python dictionary that stores environment variables
 
-    except Exception as e:
-        print("\nKAGGLE CONFIG ERROR: Kaggle configuration is invalid.")
-        print("Reason:", e)
-        print("Skipping Kaggle download...\n")
-        return
+class KaggleApiFetcher:
+    # The real Kaggle download (through the kaggle package). kaggle_housing takes anything with the same two methods
+    # as fetcher=, ex: KaggleStandIn in standins.py which works with no internet
+    def version(self, dataset):
+        return kaggle_dataset_version(dataset)
 
+    def download(self, dataset, path):
+        # Puts the unzipped files of the dataset in path
+        import kaggle
+        kaggle.api.dataset_download_files(dataset, path=path, unzip=True)
 
-    #print("Using Kaggle config dir:", kaggle_config_dir)
 
+@profiled("load")
+def kaggle_housing(data_dir=DATA_DIR, dataset=KAGGLE_DATASET, kaggle_config_dir = KAGGLE_CONFIG_DIR, KAGGLE_NAME = KAGGLE_NAME, data_format = DATA_FORMAT, use_cache = USE_DOWNLOAD_CACHE, fetcher = None): #kaggle is a website with databases for public use
+    #----------------------KAGGLE - Housing Prices Data Collection---------------------------
+    #os.environ["KAGGLE_CONFIG_DIR"] = kaggle_config_dir  # Location of Kaggle API Key found from .env file
+    # Validate Kaggle config directory (only the real Kaggle API needs it, not a fetcher passed in)
+    use_kaggle_api = fetcher is None
+    if use_kaggle_api:
+        try:
+            if not kaggle_config_dir or not os.path.isdir(kaggle_config_dir):
+                raise FileNotFoundError(
+                    f"Kaggle config directory not found: {kaggle_config_dir}"
+                )
+
+            # Apply it ONLY after confirming it exists
+            os.environ["KAGGLE_CONFIG_DIR"] = kaggle_config_dir #os.environ is a built-in Python dictionary that stores environment variables
+
+        except Exception as e:
+            print("\nKAGGLE CONFIG ERROR: Kaggle configuration is invalid.")
+            print("Reason:", e)
+            print("Skipping Kaggle download...\n")
+            return
+        fetcher = KaggleApiFetcher()
 
-    try:
-        import kaggle #This needs to be here after environment variable is set
-    except Exception as e:
-        print("KAGGLE IMPORT ERROR: This usually means your kaggle.json file is missing or invalid.")
-        print(f"Expected kaggle.json in: {kaggle_config_dir}")
-        print("Reason:", e)
-        print("Skipping Kaggle download...")
-        return #Stops kaggle_housing from continuing
+
+    #print("Using Kaggle config dir:", kaggle_config_dir)
+
+    # Use the cached copy instead of downloading again if the dataset hasn't changed (see download_cache.py)
+    cache_params = {"dataset": dataset, "data_format": data_format}
+    if use_cache:
+        manifest = download_cache.lookup("kaggle", cache_params, get_version=lambda: fetcher.version(dataset))
+        if manifest is not None:
+            download_cache.restore(manifest, data_dir, KAGGLE_NAME)
+            print(f"Using cached Kaggle Data: ({dataset}) {manifest['version'] or ''}")
+            return
+
+    if use_kaggle_api:
+        try:
+            import kaggle #This needs to be here after environment variable is set
+        except Exception as e:
+            print("KAGGLE IMPORT ERROR: This usually means your kaggle.json file is missing or invalid.")
+            print(f"Expected kaggle.json in: {kaggle_config_dir}")
+            print("Reason:", e)
+            print("Skipping Kaggle download...")
+            return #Stops kaggle_housing from continuing
     # -------------------------
     print(f"Fetching Kaggle Data: ({dataset})...")
 
-    #Download dataset from Kaggle
+    # Remember which version we are downloading so the cache can tell later if it changed
+    version = None
+    if use_cache:
+        try:
+            version = fetcher.version(dataset)
+        except Exception as e:
+            print("KAGGLE VERSION WARNING: Could not read the dataset version. Reason:", e)
+
+    #Download dataset from Kaggle into its own folder first. The FRED and Google files can be saved into data/
+    #at the same time (see run_load in main.py), so looking for "any CSV" in data/ could pick up the wrong file
+    download_dir = data_dir / "_kaggle_download"
+    shutil.rmtree(download_dir, ignore_errors=True)
     try:
-        kaggle.api.dataset_download_files(dataset, path=data_dir, unzip=True)
+        with span("kaggle download", "network", dataset=dataset):
+            fetcher.download(dataset, download_dir)
     except Exception as e:
         print(f"KAGGLE DOWNLOAD ERROR: Dataset attempted: {dataset}")
         print("Reason:", e)
         print("Skipping Kaggle download...\n")
+        shutil.rmtree(download_dir, ignore_errors=True)
         return #Stops kaggle_housing from continuing
 
 
@@ -79,11 +149,12 @@ def kaggle_housing(data_dir=DATA_DIR, dataset=KAGGLE_DATASET, kaggle_config_dir
     #Find and load CSV file from the zip folder and put it into data folder
     #From this Kaggle dataset, there's only one CSV file so no need to tweak this code. It's good enough
 
-    csv_files = [f for f in os.listdir(data_dir) if f.lower().endswith(".csv")]
+    csv_files = sorted(f for f in os.listdir(download_dir) if f.lower().endswith(".csv"))
     # One final check if no CSV found -> dataset failed or was corrupt
     if not csv_files:
         print("KAGGLE DOWNLOAD ERROR: No CSV found in extracted files.")
         print("Skipping Kaggle download...\n")
+        shutil.rmtree(download_dir, ignore_errors=True)
         return
 
     # If multiple CSVs, warn but continue with the first
@@ -92,23 +163,67 @@ def kaggle_housing(data_dir=DATA_DIR, dataset=KAGGLE_DATASET, kaggle_config_dir
         print("Using the first one:", csv_files[0])
 
     csv_file = csv_files[0]
-    original_csv_path = data_dir / csv_file
+    original_csv_path = download_dir / csv_file
     new_csv_path = data_dir / KAGGLE_NAME
 
     # Rename/move the file to your chosen name. I put an error check here just in case
     try:
-        os.rename(original_csv_path, new_csv_path)
+        os.replace(original_csv_path, new_csv_path)
     except Exception as e:
         print("KAGGLE DOWNLOAD ERROR: Could not rename Kaggle CSV file.")
         print("Reason:", e)
         print("Skipping Kaggle renaming...\n")
         return
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True) #Any other extracted files aren't used
+
+    # Kaggle always gives a CSV. If parquet was chosen in config.py, convert it once here so every later read is fast
+    output_path = convert_csv_to_table(new_csv_path, data_dir, KAGGLE_NAME, data_format)
+
+    if use_cache:
+        download_cache.store("kaggle", cache_params, output_path, version)
     #-----------------------------------------------------------------------------------------------
 
 
-def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_DIR, FRED_NAME = FRED_NAME): #FRED is the federal reserve database to pull mortgage rates from
+def fred_urls(base_url=FRED_BASE_URL):
+    # Observations URL and series info URL for a FRED server, ex: fred_urls("http://127.0.0.1:8000/fred")
+    base_url = str(base_url).rstrip("/")
+    return f"{base_url}/series/observations", f"{base_url}/series"
+
+
+@profiled("network")
+def FRED_last_updated(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, series_url=FRED_SERIES_URL):
+    # Asks FRED when the series was last updated (a tiny request compared to downloading every observation)
+    params = {
+        "series_id": series_id,
+        "api_key": api_key,
+        "file_type": "json"
+    }
+    response = get_session().get(series_url, params=params, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["seriess"][0]["last_updated"]
+
+
+@profiled("load")
+def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_DIR, FRED_NAME = FRED_NAME, data_format = DATA_FORMAT, use_cache = USE_DOWNLOAD_CACHE, incremental = False, api_url = FRED_API_URL, series_url = FRED_SERIES_URL): #FRED is the federal reserve database to pull mortgage rates from
     #----------------------FRED - 30-Year Fixed Mortgage Rates---------------------------
 
+    # Incremental mode: if we already have the file, only ask FRED for the weeks after the last one we have
+    existing = None
+    if incremental and find_table(data_dir, FRED_NAME, data_format) is not None:
+        existing = read_table(data_dir, FRED_NAME, data_format, dtype=str) #keep FRED's text exactly as it was saved
+        if existing.empty:
+            existing = None
+
+    # Use the cached copy if FRED hasn't updated the series since (the API key is left out on purpose so it isn't saved)
+    cache_params = {"series_id": series_id, "data_format": data_format}
+    if use_cache and existing is None:
+        manifest = download_cache.lookup("fred", cache_params, get_version=lambda: FRED_last_updated(api_key, series_id, series_url))
+        if manifest is not None:
+            download_cache.restore(manifest, data_dir, FRED_NAME)
+            print(f"Using cached FRED Data: ({series_id}) last updated {manifest['version']}")
+            return
+
     #settings parameters before accessing FRED
     params = {
         "series_id": series_id,
@@ -116,10 +231,18 @@ def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_
         "file_type": "json"
     }
 
-    #Request data from FRED
-    print(f"Fetching FRED Data: ({series_id})...")
+    if existing is not None:
+        last_date = pd.to_datetime(existing["date"]).max()
+        params["observation_start"] = (last_date + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+    #Request data from FRED (shared session: reuses the connection and retries 429/5xx with backoff)
+    if existing is not None:
+        print(f"Fetching FRED Data: ({series_id}) since {params['observation_start']}...")
+    else:
+        print(f"Fetching FRED Data: ({series_id})...")
     try:
-        response = requests.get(FRED_API_URL, params=params)
+        with span("FRED observations", "network", series_id=series_id):
+            response = get_session().get(api_url, params=params, timeout=HTTP_TIMEOUT)
         response.raise_for_status()   # this will error for bad API or series ID
 
     except Exception as e:
@@ -131,6 +254,10 @@ def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_
     data = response.json()
     observations = data.get("observations", [])
 
+    if not observations and existing is not None:
+        print(f"FRED Data ({series_id}) is already up to date.")
+        return
+
     if not observations:
         raise ValueError("No data returned from FRED API")
 
@@ -138,9 +265,22 @@ def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_
     df = pd.DataFrame(observations)
     #print(f"Data successfully loaded: {df.shape[0]} records")
 
+    # Add the new weeks to the end of what we already had (if FRED re-sent a week, keep its newest value)
+    if existing is not None:
+        print(f"Adding {len(df)} new FRED observations.")
+        df = pd.concat([existing, df], ignore_index=True)
+        df = df.drop_duplicates(subset="date", keep="last").sort_values(by="date").reset_index(drop=True)
+
     #Save raw data to CSV
-    output_path = data_dir / FRED_NAME
-    df.to_csv(output_path, index=False)
+    output_path = write_table(df, data_dir, FRED_NAME, data_format)
+
+    if use_cache:
+        try:
+            version = FRED_last_updated(api_key, series_id, series_url)
+        except Exception as e:
+            print("FRED VERSION WARNING: Could not read last_updated. Reason:", e)
+            version = None
+        download_cache.store("fred", cache_params, output_path, version)
 
     #print(f"Mortgage rate data saved to: {output_path}")
     #-----------------------------------------------------------------------------------------------
@@ -148,7 +288,103 @@ def FRED_mortgage(api_key=FRED_API_KEY, series_id=FRED_SERIES_ID, data_dir=DATA_
 
 
 
-def GTrends_Homes_Selling(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, data_dir=DATA_DIR, GOOGLE_NAME = GOOGLE_NAME, START_DATE = START_DATE, END_DATE = END_DATE ): #Google Trends records trends in how people search on Google
+@profiled("network")
+def FRED_series_observations(series_id, api_key=FRED_API_KEY, api_url=FRED_API_URL) -> pd.DataFrame:
+    # Downloads every observation of one FRED series (over the shared, retrying session) with a series_id column added
+    params = {
+        "series_id": series_id,
+        "api_key": api_key,
+        "file_type": "json"
+    }
+    response = get_session().get(api_url, params=params, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+
+    observations = response.json().get("observations", [])
+    if not observations:
+        raise ValueError(f"No data returned from FRED API for {series_id}")
+
+    df = pd.DataFrame(observations)[["date", "value"]]
+    df.insert(0, "series_id", series_id)
+    return df
+
+
+@profiled("load")
+def FRED_bulk(series_ids=FRED_BULK_SERIES, api_key=FRED_API_KEY, data_dir=DATA_DIR, FRED_BULK_NAME = FRED_BULK_NAME, data_format = DATA_FORMAT, api_url = FRED_API_URL, max_workers = 8):
+    #----------------------FRED - Many series at once---------------------------
+    # Downloads all the series at the same time (sharing one connection pool) and saves them in ONE long table
+    # process_fred_bulk_data then turns it into one wide monthly table (one column per series)
+    series_ids = list(dict.fromkeys(series_ids)) #drop duplicates, keep order
+    if not series_ids:
+        print("No FRED bulk series chosen. Skipping FRED bulk download...")
+        return
+
+    print(f"Fetching FRED Data: ({', '.join(series_ids)})...")
+
+    def fetch(series_id):
+        # One series failing (ex: a typo in the ID) shouldn't stop the others
+        try:
+            return FRED_series_observations(series_id, api_key, api_url)
+        except Exception as e:
+            print(f"\nFRED API request failed - Series attempted: {series_id}")
+            print("Reason:", e)
+            print("Skipping this series and continuing...\n")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(series_ids)))) as pool:
+        frames = [df for df in pool.map(fetch, series_ids) if df is not None]
+
+    if not frames:
+        raise ValueError("No data returned from FRED API for any bulk series")
+
+    # Save raw data (long format: series_id, date, value)
+    df = pd.concat(frames, ignore_index=True)
+    write_table(df, data_dir, FRED_BULK_NAME, data_format)
+    #-----------------------------------------------------------------------------------------------
+
+
+def trends_client() -> TrendReq:
+    #The GTrends functions take any function that makes a client with the same methods as client_factory=
+    #(ex: TrendsStandIn.client in standins.py, which works with no internet)
+    #Create a clean Trends session with explicit connection headers to avoid being banned as a bot similar to HW assignment
+    return TrendReq(
+        hl='en-US',
+        tz=360,
+        requests_args={
+            'headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                              'AppleWebKit/537.36 (KHTML, like Gecko) '
+                              'Chrome/118.0.5993.90 Safari/537.36'
+            }
+        }
+    )
+
+
+def align_keyword_batches(frames, anchor) -> pd.DataFrame:
+    # Google scales every request on its own (its highest month = 100), so the same search gets different numbers in
+    # different requests. Every request has the anchor search in it, so each later request is multiplied by
+    # (anchor total in the first request / anchor total in this one) over the months both have.
+    # The first request is the anchor alone, so its column is returned exactly as Google sent it.
+    # Returns one wide table: the anchor, then the other searches (same months as the first request), then isPartial
+    first = frames[0]
+    extras = []
+    for frame in frames[1:]:
+        months = first.index.intersection(frame.index)
+        anchor_total = frame.loc[months, anchor].sum()
+        if anchor_total > 0:
+            scale = first.loc[months, anchor].sum() / anchor_total
+        else:
+            scale = float("nan")
+            print(f'"{anchor}" has no searches in the request with {list(frame.columns.drop([anchor, "isPartial"], errors="ignore"))}. Their values are left empty')
+        keywords = frame.drop(columns=[anchor, "isPartial"], errors="ignore")
+        extras.append((keywords.astype("float64") * scale).round(2))
+    if not extras:
+        return first
+    df = pd.concat([first] + extras, axis=1, join="outer").reindex(first.index)
+    return df[[c for c in df.columns if c != "isPartial"] + [c for c in df.columns if c == "isPartial"]] #isPartial stays last
+
+
+@profiled("load")
+def GTrends_Homes_Selling(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, data_dir=DATA_DIR, GOOGLE_NAME = GOOGLE_NAME, START_DATE = START_DATE, END_DATE = END_DATE, data_format = DATA_FORMAT, use_cache = USE_DOWNLOAD_CACHE, client_factory = trends_client, limiter_state = TRENDS_LIMITER_STATE, extra_keywords = GOOGLE_EXTRA_KEYWORDS, per_request = GOOGLE_KEYWORDS_PER_REQUEST): #Google Trends records trends in how people search on Google
     #------------------------------Google Trends - Default: "Homes for sale"------------------------------
 
     #No API needed for this one but access is limited
@@ -168,33 +404,44 @@ def GTrends_Homes_Selling(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, data_dir
         kw = "homes for sale"
     #=========================================
 
+    # ==========Same check for the extra searches (a bad one is left out, not replaced)========
+    extras = []
+    for extra in dict.fromkeys(extra_keywords or []):
+        if (not isinstance(extra, str)) or (extra.strip() == "") or (len(extra.split()) > 10):
+            print(f"Invalid keyword '{extra}' — must be a non-empty string under 10 words. Skipping it.")
+        elif extra != kw:
+            extras.append(extra)
+    #=========================================
+
+    # Google Trends has no version to check, so a cached copy is used until its TTL runs out (no waiting at all)
+    cache_params = {"kw": kw, "keywords": extras, "timeframe": f"{START_DATE} {END_DATE}", "geo": "US", "data_format": data_format}
+    if use_cache:
+        manifest = download_cache.lookup("google", cache_params)
+        if manifest is not None:
+            download_cache.restore(manifest, data_dir, GOOGLE_NAME)
+            print(f'Using cached Google Trends data for "{kw}"')
+            return
+
     #Download Google Search Interest Data (via pytrends) ---
-    print(f'Fetching Google Trends data for "{kw}"...')
+    print(f'Fetching Google Trends data for "{kw}"' + (f" and {len(extras)} more searches..." if extras else "..."))
 
-    #Create a clean Trends session with explicit connection headers to avoid being banned as a bot similar to HW assignment
-    pytrends = TrendReq(
-        hl='en-US',
-        tz=360,
-        requests_args={
-            'headers': {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                              'AppleWebKit/537.36 (KHTML, like Gecko) '
-                              'Chrome/118.0.5993.90 Safari/537.36'
-            }
-        }
-    )
+    pytrends = client_factory()
 
-    #Give Google a short pause between actions to prevent being blocked
-    print(f"Please wait {time_sleep * 2} seconds . . .")
-    time.sleep(time_sleep) #20 seconds is what we use as default 2 times for 40 seconds
-    #time.sleep(20)
+    #Every Google request goes through the rate limiter (see rate_limiter.py) to prevent being blocked.
+    #It only waits when Google has been throttling us, and never longer than time_sleep between requests
+    limiter = get_trends_limiter(max_wait=time_sleep, state_path=limiter_state)
 
-    #Pick data we want
-    kw_list = [kw] #search term we're working with
+    #Pick data we want: kw alone first, so its 0-100 numbers aren't squeezed by a bigger search in the same request.
+    #Then up to per_request - 1 extra searches per request, each with kw to line them up (see align_keyword_batches)
+    size = max(1, per_request - 1)
+    batches = [[kw]] + [[kw] + extras[i:i + size] for i in range(0, len(extras), size)]
+    timeframe = f"{START_DATE} {END_DATE}"
 
     try:
-        pytrends.build_payload(kw_list, timeframe=f"{START_DATE} {END_DATE}", geo='US')  # set timeframe (20 years)
+        call_with_limiter(limiter, pytrends.build_payload, batches[0], timeframe=timeframe, geo='US', retries=TRENDS_MAX_RETRIES)  # set timeframe (20 years)
     except Exception as e:
+        if is_throttled(e): #Still throttled after every retry, the dates are not the problem
+            raise
         print("DATE FORMAT/RANGE ERROR: Your dates are invalid. Change the format and/or range.")
         print("Reverting to default 2004-12-31 to 2024-12-31.")
         print("Reason:", e)
@@ -202,21 +449,34 @@ def GTrends_Homes_Selling(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, data_dir
         # Default fail-safe values
         START_DATE_default = "2004-12-31"
         END_DATE_default = "2024-12-31"
-        pytrends.build_payload(kw_list, timeframe=f"{START_DATE_default} {END_DATE_default}", geo='US')  # set timeframe (20 years)
+        timeframe = f"{START_DATE_default} {END_DATE_default}"
+        call_with_limiter(limiter, pytrends.build_payload, batches[0], timeframe=timeframe, geo='US', retries=TRENDS_MAX_RETRIES)  # set timeframe (20 years)
 
-    #Pause again before fetch
-    print(f"Please wait {time_sleep} seconds . . .")
-    time.sleep(time_sleep)
-    #time.sleep(20)
-    df_trends = pytrends.interest_over_time()
+    #Fetch (also through the rate limiter)
+    df_trends = call_with_limiter(limiter, pytrends.interest_over_time, retries=TRENDS_MAX_RETRIES)
 
     #Check
     if df_trends.empty:
         raise ValueError(f"No data returned from Google Trends for '{kw}'")
 
-    #Save
-    output_path = data_dir / GOOGLE_NAME
-    df_trends.to_csv(output_path)
+    #The other requests. One failing only loses its searches, being throttled after every retry stops everything
+    frames = [df_trends]
+    for kw_list in batches[1:]:
+        try:
+            call_with_limiter(limiter, pytrends.build_payload, kw_list, timeframe=timeframe, geo='US', retries=TRENDS_MAX_RETRIES)
+            frames.append(call_with_limiter(limiter, pytrends.interest_over_time, retries=TRENDS_MAX_RETRIES))
+        except Exception as e:
+            if is_throttled(e):
+                raise
+            print(f"Google Trends request failed for {kw_list[1:]}. Reason:", e)
+    df_trends = align_keyword_batches([frame for frame in frames if not frame.empty], kw)
+
+    #Save (the date index becomes a normal "date" column)
+    output_path = write_table(df_trends.reset_index(), data_dir, GOOGLE_NAME, data_format)
+
+    # Only cache a complete download so the missing searches are asked for again next time
+    if use_cache and len(frames) == len(batches):
+        download_cache.store("google", cache_params, output_path)
     #print(f"Google Trends data saved to: {output_path}")
     #print("Data loaded:", df_trends.shape)
     #print(df_trends.head())
@@ -224,12 +484,67 @@ def GTrends_Homes_Selling(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, data_dir
 
 
 
+@profiled("load")
+def GTrends_states(time_sleep=time_sleep, kw=GOOGLE_SEARCH_TERM, states=STATE_CODES, data_dir=DATA_DIR, GOOGLE_STATE_NAME = GOOGLE_STATE_NAME, START_DATE = START_DATE, END_DATE = END_DATE, data_format = DATA_FORMAT, use_cache = USE_DOWNLOAD_CACHE, client_factory = trends_client, limiter_state = TRENDS_LIMITER_STATE):
+    #------------------------------Google Trends - Same search, once per state------------------------------
+    # Saves ONE long table (state_code, date, search term) so process_state_data can match each state's searches to its prices
+    # Google only allows a few requests at a time so the states go one after another through the same rate limiter
+    state_codes = list(dict.fromkeys(states.values())) #drop duplicates, keep order
+    if not state_codes:
+        print("No states chosen. Skipping Google Trends state download...")
+        return
+
+    cache_params = {"kw": kw, "timeframe": f"{START_DATE} {END_DATE}", "states": state_codes, "data_format": data_format}
+    if use_cache:
+        manifest = download_cache.lookup("google", cache_params)
+        if manifest is not None:
+            download_cache.restore(manifest, data_dir, GOOGLE_STATE_NAME)
+            print(f'Using cached Google Trends state data for "{kw}"')
+            return
+
+    print(f'Fetching Google Trends data for "{kw}" in {len(state_codes)} states...')
+    pytrends = client_factory()
+    limiter = get_trends_limiter(max_wait=time_sleep, state_path=limiter_state)
+
+    frames = []
+    for code in state_codes:
+        # One state failing (ex: not enough searches there) shouldn't stop the others. Being throttled after every retry should
+        try:
+            call_with_limiter(limiter, pytrends.build_payload, [kw], timeframe=f"{START_DATE} {END_DATE}", geo=f"US-{code}", retries=TRENDS_MAX_RETRIES)
+            df_state = call_with_limiter(limiter, pytrends.interest_over_time, retries=TRENDS_MAX_RETRIES)
+        except Exception as e:
+            if is_throttled(e):
+                raise
+            print(f"Google Trends request failed for US-{code}. Reason:", e)
+            continue
+        if df_state.empty:
+            print(f"No Google Trends data for US-{code}. Skipping...")
+            continue
+        df_state = df_state.reset_index()
+        df_state.insert(0, "state_code", code)
+        frames.append(df_state)
+
+    if not frames:
+        raise ValueError(f"No data returned from Google Trends for '{kw}' in any state")
+
+    output_path = write_table(pd.concat(frames, ignore_index=True), data_dir, GOOGLE_STATE_NAME, data_format)
+
+    # Only cache a complete download so missing states are asked for again next time
+    if use_cache and len(frames) == len(state_codes):
+        download_cache.store("google", cache_params, output_path)
+    #-----------------------------------------------------------------------------------------------
+
+
 if __name__ == "__main__":
     print("----------------------Running Data Collection----------------------")
+    ensure_dirs()
     clear_data_folder()
     kaggle_housing()
     FRED_mortgage()
+    FRED_bulk()
     GTrends_Homes_Selling()
+    if STATE_LEVEL:
+        GTrends_states()
     print('Data Collection Complete: All successfully collected data will be saved to "data" folder.')
 
 
@@ -1,49 +1,93 @@
 import argparse
+import time
 
-# Import data collection
-from load import (
-    clear_data_folder,
-    kaggle_housing,
-    FRED_mortgage,
-    GTrends_Homes_Selling
+# Only config is imported here. Each stage imports its own modules (pandas, pytrends, matplotlib, seaborn ...) when it
+# runs, so "--help" or "process" don't pay for the libraries they don't use (see bench_startup.py)
+from config import (
+    time_sleep, USE_DOWNLOAD_CACHE, CONCURRENT_LOAD, FRED_BULK_SERIES, PARALLEL_PLOTS, STATE_LEVEL, ensure_dirs,
+    DATA_DIR, STATE_CODES, TRENDS_LIMITER_STATE, FRED_API_URL, FRED_SERIES_URL,
 )
+from profiler import profiled, span #standard library only, so it doesn't slow the start down
 
-# Import processing
-from process import (
-    process_realtor_data,
-    process_mortgage_data,
-    process_google_data,
-    process_merge_data,
-    clear_processed_folder,
-)
 
-# Import analysis
-from analyze import (
-    load_merged_data,
-    plot_time_series,
-    plot_time_series_smoothed,
-    plot_scatter_search_vs_mortgage,
-    plot_scatter_search_vs_price,
-    plot_correlation_heatmap,
-    plot_pairplot,
-    clear_results_folder,
-)
+def run_source(name, func, *args, **kwargs):
+    # Runs one data source on its own so an error in one doesn't stop the others, and times it
+    start = time.perf_counter()
+    try:
+        func(*args, **kwargs)
+        status = "done"
+    except Exception as e:
+        print(f"{name.upper()} LOAD ERROR: Reason:", e)
+        status = "failed"
+    elapsed = time.perf_counter() - start
+    print(f"{name} {status} in {elapsed:.1f} seconds")
+    return name, status, elapsed
 
-# Import cleaned filenames from config.py
-from config import time_sleep
 
-def run_load(local_time_sleep):
+@profiled("stage")
+def run_load(local_time_sleep, use_cache=USE_DOWNLOAD_CACHE, concurrent=CONCURRENT_LOAD, incremental=False,
+             data_dir=DATA_DIR, fred_base_url=None, trends_client_factory=None, kaggle_fetcher=None,
+             limiter_state=TRENDS_LIMITER_STATE, states=STATE_CODES):
+    # fred_base_url, trends_client_factory and kaggle_fetcher send the downloads somewhere other than the real
+    # websites (ex: the offline stand-ins in standins.py, see bench_load.py). None = the real ones
     print("----------------------Running Data Collection----------------------")
-    clear_data_folder()
-    kaggle_housing()
-    FRED_mortgage()
-    GTrends_Homes_Selling(local_time_sleep)
+    with span("import load", "import"):
+        from concurrent.futures import ThreadPoolExecutor
+        from load import (
+            clear_data_folder, kaggle_housing, FRED_mortgage, FRED_bulk, GTrends_Homes_Selling, GTrends_states, fred_urls,
+        )
+    ensure_dirs()
+
+    # Incremental mode keeps the old files so FRED only has to send the newest weeks
+    if not incremental:
+        clear_data_folder(data_dir)
+
+    api_url, series_url = fred_urls(fred_base_url) if fred_base_url else (FRED_API_URL, FRED_SERIES_URL)
+    trends_kwargs = {"data_dir": data_dir, "use_cache": use_cache, "limiter_state": limiter_state}
+    if trends_client_factory:
+        trends_kwargs["client_factory"] = trends_client_factory
+
+    # The sources don't depend on each other
+    sources = [
+        ("Kaggle", kaggle_housing, (), {"data_dir": data_dir, "use_cache": use_cache, "fetcher": kaggle_fetcher}),
+        ("FRED", FRED_mortgage, (), {"data_dir": data_dir, "use_cache": use_cache, "incremental": incremental,
+                                     "api_url": api_url, "series_url": series_url}),
+        ("Google Trends", GTrends_Homes_Selling, (local_time_sleep,), trends_kwargs),
+    ]
+    if FRED_BULK_SERIES:
+        sources.append(("FRED bulk", FRED_bulk, (), {"data_dir": data_dir, "api_url": api_url}))
+    if STATE_LEVEL and states:
+        sources.append(("Google states", GTrends_states, (local_time_sleep,), {**trends_kwargs, "states": states}))
+
+    start = time.perf_counter()
+    if concurrent:
+        # Run them all at the same time on threads. They mostly wait on the network (and Google's rate limit),
+        # so the total time is about the slowest one instead of all of them added together
+        with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            futures = [pool.submit(run_source, name, func, *args, **kwargs) for name, func, args, kwargs in sources]
+            results = [future.result() for future in futures]
+    else:
+        results = [run_source(name, func, *args, **kwargs) for name, func, args, kwargs in sources]
+    total = time.perf_counter() - start
+
+    print("\nData Collection Timing:")
+    for name, status, elapsed in results:
+        print(f"  {name:<15} {status:<7} {elapsed:6.1f} s")
+    print(f"  {'Total':<15} {'':<7} {total:6.1f} s")
 
     print('Data Collection Complete: All successfully collected data will be saved to "data/" folder.')
+    return results
 
 
+@profiled("stage")
 def run_data_processing():
     print("----------------------Running Data Cleaning/Processing----------------------")
+    with span("import process", "import"):
+        from process import (
+            clear_processed_folder, process_realtor_data, process_mortgage_data, process_fred_bulk_data,
+            process_google_data, process_merge_data, process_google_state_data, process_state_data,
+        )
+    ensure_dirs()
     clear_processed_folder()
 
     try:
@@ -56,6 +100,12 @@ def run_data_processing():
     except Exception as e:
         print("FRED PROCESSING ERROR: Reason:", e)
 
+    if FRED_BULK_SERIES:
+        try:
+            process_fred_bulk_data()
+        except Exception as e:
+            print("FRED BULK PROCESSING ERROR: Reason:", e)
+
     try:
         process_google_data()
     except Exception as e:
@@ -66,28 +116,109 @@ def run_data_processing():
     except Exception as e:
         print("MERGING ERROR: Reason:", e)
 
+    if STATE_LEVEL:
+        try:
+            process_google_state_data()
+        except Exception as e:
+            print("GOOGLE STATE PROCESSING ERROR: Reason:", e)
+
+        try:
+            process_state_data()
+        except Exception as e:
+            print("STATE MERGING ERROR: Reason:", e)
+
     print('Data Cleaning/Processing Complete: All successfully processed data will be saved to "data/processed/" folder.')
 
-def run_analysis():
+@profiled("stage")
+def run_analysis(parallel=PARALLEL_PLOTS):
     print("----------------------Running Data Analysis----------------------")
+    with span("import analyze", "import"): #matplotlib and seaborn are slow to import
+        from analyze import (
+            clear_results_folder, load_merged_data, plot_all,
+            load_state_merged_data, state_correlations, plot_state_correlations, state_lead_lag,
+        )
+    ensure_dirs()
     clear_results_folder()
     try:
         df = load_merged_data()
 
-    # Generate and save all plots
-        plot_time_series(df)
-        plot_time_series_smoothed(df)
-        plot_scatter_search_vs_mortgage(df)
-        plot_scatter_search_vs_price(df)
-        plot_correlation_heatmap(df)
-        plot_pairplot(df)
+    # Generate and save all plots (at the same time in separate processes unless parallel is False)
+        start = time.perf_counter()
+        plot_all(df, parallel=parallel)
+        print(f"Graphs drawn in {time.perf_counter() - start:.1f} seconds")
     except Exception as e:
         print("ANALYSIS RESULTS GENERATION ERROR: Reason:", e)
 
+    if STATE_LEVEL:
+        try:
+            df_states = load_state_merged_data()
+            plot_state_correlations(state_correlations(df_states))
+            state_lead_lag(df_states)
+        except Exception as e:
+            print("STATE ANALYSIS ERROR: Reason:", e)
+
     print('Data Analysis Complete: All successfully generated graphs will be saved to "results/" folder.')
 
+@profiled("stage")
+def run_sweep_analysis(parallel=PARALLEL_PLOTS):
+    print("----------------------Running Analysis Sweep----------------------")
+    with span("import sweep", "import"): #matplotlib and seaborn are slow to import
+        from analyze import load_merged_data
+        from sweep import make_variants, run_sweep
+    ensure_dirs()
+    try:
+        df = load_merged_data()
+
+    # Every window x mask x season in config.py (at the same time in separate processes unless parallel is False)
+        variants = make_variants()
+        start = time.perf_counter()
+        run_sweep(df, variants, parallel=parallel)
+        print(f"{len(variants)} variants analyzed in {time.perf_counter() - start:.1f} seconds")
+    except Exception as e:
+        print("SWEEP ERROR: Reason:", e)
+
+    print('Analysis Sweep Complete: The summary table and graphs will be saved to "results/sweep/" folder.')
+
+@profiled("stage")
+def run_make(force=False):
+    print("----------------------Running Data Cleaning/Processing and Analysis (out of date steps only)----------------------")
+    with span("import pipeline", "import"):
+        from pipeline import build_steps, run_steps
+    ensure_dirs()
+    report = run_steps(build_steps(), force=force)
+
+    ran = [name for name, result in report.items() if result == "ran"]
+    problems = [name for name, result in report.items() if result in ("failed", "skipped")]
+    print(f"\n{len(ran)} of {len(report)} steps ran, {len(report) - len(ran) - len(problems)} were already up to date.")
+    if problems:
+        print("Steps that failed or were skipped:", ", ".join(problems))
+
+    print('Data Cleaning/Processing and Analysis Complete: Results will be saved to "data/processed/" and "results/" folders.')
+
+def add_run_options(parser, defaults=True):
+    # Options shared by the old flags and the subcommands. Subcommands get no defaults (argparse.SUPPRESS) so
+    # "main.py --sleep 5 load" and "main.py load --sleep 5" both work
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument("--sleep", type=int, default=default(time_sleep),
+                        help="Longest wait between Google Trends requests when Google is throttling us (default 20 seconds set by config.py)")
+    parser.add_argument("--refresh", action="store_true", default=default(False),
+                        help="Ignore the download cache in data/cache and download everything again")
+    parser.add_argument("--incremental", action="store_true", default=default(False),
+                        help="Keep the existing FRED file and only download the weeks after its last date")
+    parser.add_argument("--sequential", action="store_true", default=default(False),
+                        help="Download the data sources and draw the graphs one after another instead of at the same time")
+    parser.add_argument("--force", action="store_true", default=default(False),
+                        help="With make, re-run every step even if it is up to date")
+    parser.add_argument("--profile", action="store_true", default=default(False),
+                        help="Time every step and save results/profile/profile_summary.json and profile_trace.json (see profiler.py)")
+
+
 def main():
     # -------------------- Command-Line Arguments --------------------
+    # Subcommands:  python main.py load | process | analyze | all | make | sweep
+    # The old flags (--load, --process, --analyze, --all, --make, --sweep) still work the same way
 
 
     parser = argparse.ArgumentParser(
@@ -103,38 +234,93 @@ def main():
     parser.add_argument("--all", action="store_true",
                         help="Run all steps: load data then process then analyze")
 
-    parser.add_argument("--sleep", type=int, default=time_sleep,
-                        help="Override sleep time for Google Trends (default 20 seconds set by config.py)")
+    parser.add_argument("--make", action="store_true",
+                        help="Process and analyze, re-running only the steps whose inputs or settings changed")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Analyze every window, mask and season in config.py (SWEEP_*) and save one summary table")
+    add_run_options(parser)
+
+    subcommands = parser.add_subparsers(dest="command", metavar="command")
+    for name, help_text in [
+        ("load", "Run load.py data collection"),
+        ("process", "Run process.py cleaning and merging"),
+        ("analyze", "Run analyze.py and generate graphs"),
+        ("all", "Run all steps: load data then process then analyze"),
+        ("make", "Process and analyze, re-running only the steps whose inputs or settings changed (add --load to download first)"),
+        ("sweep", "Analyze every window, mask and season in config.py (SWEEP_*) and save one summary table"),
+    ]:
+        subparser = subcommands.add_parser(name, help=help_text, description=help_text)
+        add_run_options(subparser, defaults=False)
+        if name == "make":
+            subparser.add_argument("--load", action="store_true", default=argparse.SUPPRESS, help="Download the data first")
 
     args = parser.parse_args()
 
+    # A subcommand is the same as its flag
+    if args.command:
+        setattr(args, args.command, True)
+
+    if not args.profile:
+        run_commands(args)
+        return
+
+    import profiler
+    profiler.enable()
+    try:
+        run_commands(args)
+    finally:
+        profiler.print_summary()
+        summary_path, trace_path = profiler.save()
+        print(f"\nProfile saved to {summary_path}")
+        print(f"Timeline saved to {trace_path} (open it in https://ui.perfetto.dev or chrome://tracing)")
+
+
+def run_commands(args):
+    # Runs what the command-line arguments asked for
     local_time_sleep = max(1, min(args.sleep, 50)) # Prevents accidentally putting too low of a sleep time or too high
+    use_cache = USE_DOWNLOAD_CACHE and not args.refresh
+    concurrent = CONCURRENT_LOAD and not args.sequential
+    parallel = PARALLEL_PLOTS and not args.sequential
+
+    # --make replaces --process and --analyze (it decides which of their steps need to run)
+    if args.make:
+        if args.load or args.all:
+            run_load(local_time_sleep, use_cache, concurrent, args.incremental)
+        run_make(args.force)
+        if args.sweep:
+            run_sweep_analysis(parallel)
+        return
 
     # DEFAULT BEHAVIOR = run everything if no flags used
-    if not (args.load or args.process or args.analyze or args.all):
+    if not (args.load or args.process or args.analyze or args.all or args.sweep):
         #print("\nNo flags provided,  running FULL PIPELINE.\n")
-        run_load(local_time_sleep)
+        run_load(local_time_sleep, use_cache, concurrent, args.incremental)
         run_data_processing()
-        run_analysis()
+        run_analysis(parallel)
         return
 
     # If flags *were* used:
     # If --all is selected
     if args.all:
-        run_load(local_time_sleep)
+        run_load(local_time_sleep, use_cache, concurrent, args.incremental)
         run_data_processing()
-        run_analysis()
+        run_analysis(parallel)
+        if args.sweep:
+            run_sweep_analysis(parallel)
         return
 
     # Otherwise, run selected features
     if args.load:
-        run_load(local_time_sleep)
+        run_load(local_time_sleep, use_cache, concurrent, args.incremental)
 
     if args.process:
         run_data_processing()
 
     if args.analyze:
-        run_analysis()
+        run_analysis(parallel)
+
+    if args.sweep:
+        run_sweep_analysis(parallel)
 
 
 
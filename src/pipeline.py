@@ -0,0 +1,346 @@
+#This code runs the processing and analysis steps like "make" does: each step lists the files it reads (inputs),
+#the files it writes (outputs) and its settings (params). A step only runs again when one of those changed:
+#   - an output file is missing, or
+#   - an input file's contents changed (checked with a SHA-256 hash), or
+#   - one of its settings changed (dates, search term, file names from config.py)
+#Hashes from the last run are saved in data/pipeline_state.json
+#Ex: changing only END_DATE re-runs the FRED/Google cleaning, the merge and the plots, but not the 2M row Kaggle cleaning
+
+import hashlib
+import json
+import os
+from functools import partial
+from pathlib import Path
+from config import (
+    DATA_DIR, PROCESSED_DIR, RESULTS_DIR,
+    KAGGLE_NAME, FRED_NAME, GOOGLE_NAME, FRED_BULK_NAME,
+    KAGGLE_NAME_CLEAN, KAGGLE_NAME_MONTHLY, REALTOR_CACHE_NAME, FRED_NAME_CLEAN, GOOGLE_NAME_CLEAN, FRED_BULK_NAME_CLEAN, MERGED_CLEAN,
+    TIME_SERIES_NAME, SMOOTH_SERIES_NAME, GOOGLE_FRED_NAME, GOOGLE_KAGGLE_NAME, HEATMAP_NAME, PAIRPLOT_NAME,
+    START_DATE, END_DATE, GOOGLE_SEARCH_TERM, FRED_BULK_SERIES, KAGGLE_CHUNKSIZE, DATA_FORMAT,
+    FEATURE_SERIES, FEATURE_HORIZONS, SKETCH_K, SKETCH_EXACT_LIMIT, PRICE_QUANTILES,
+    STATE_LEVEL, STATE_CODES, GOOGLE_STATE_NAME, GOOGLE_STATE_NAME_CLEAN, STATE_MERGED_CLEAN,
+    STATE_CORRELATIONS_NAME, STATE_CORRELATIONS_PLOT_NAME,
+    LEAD_LAG_NAME, LEAD_LAG_BEST_NAME, LEAD_LAG_PLOT_NAME, LEAD_LAG_SERIES, LEAD_LAG_FOCUS, LEAD_LAG_MAX_LAG,
+    LEAD_LAG_MIN_PERIODS, LEAD_LAG_CHANGES, STATE_LEAD_LAG_NAME, STATE_LEAD_LAG_PAIR,
+    FAST_REGRESSION, REGRESSION_CI,
+    SEASONAL_SERIES, SEASONAL_PERIOD, SEASONAL_MIN_CYCLES, SEASONAL_SUFFIX, SEASONAL_PLOT_NAME,
+    GOOGLE_KEYWORD_COLUMNS, KEYWORD_MACRO_SERIES, KEYWORD_ANNOTATE_LIMIT, KEYWORD_CORRELATIONS_NAME, KEYWORD_HEATMAP_NAME,
+)
+from storage import table_path
+from profiler import span
+import realtor_cache
+
+PIPELINE_STATE = DATA_DIR / "pipeline_state.json"
+
+
+class Step:
+    def __init__(self, name, func, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.func = func #Called with no arguments, so settings are filled in with functools.partial
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.params = params or {}
+
+
+def file_digest(path, memo, block_size=1024 * 1024) -> str:
+    # SHA-256 of a file. If the size and modified time didn't change since last time, the old hash is reused
+    # so the 2M row Kaggle file isn't re-hashed on every run
+    stat = os.stat(path)
+    key = str(path)
+    known = memo.get(key)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    memo[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return memo[key]["sha256"]
+
+
+def step_signature(step, memo) -> str:
+    # One hash for everything a step depends on: the contents of its inputs and its settings
+    record = {
+        "inputs": {str(p): file_digest(p, memo) for p in step.inputs},
+        "params": step.params,
+    }
+    text = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_state(state_path=PIPELINE_STATE):
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        state.setdefault("steps", {})
+        state.setdefault("files", {})
+        return state
+    except (OSError, ValueError):
+        return {"steps": {}, "files": {}}
+
+
+def save_state(state, state_path=PIPELINE_STATE):
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    tmp_path.replace(state_path)
+
+
+def check_order(steps):
+    # Every input must either already be a file or be made by an EARLIER step (so steps run in a valid order)
+    made_by = {}
+    for step in steps:
+        for p in step.inputs:
+            if p in made_by or p.exists():
+                continue
+            later = [s.name for s in steps if p in s.outputs]
+            if later:
+                raise ValueError(f"Step '{step.name}' needs {p.name} which is only made later by '{later[0]}'")
+        for p in step.outputs:
+            made_by[p] = step.name
+
+
+def run_steps(steps, state_path=PIPELINE_STATE, force=False):
+    # Runs only the steps that are out of date, in order. Returns a dictionary of {step name: what happened}
+    check_order(steps)
+    state = load_state(state_path)
+    report = {}
+    failed_outputs = set()
+
+    for step in steps:
+        # Inputs that are missing, or that an earlier step failed to update (so they'd be old), mean this step can't run
+        bad_inputs = [p for p in step.inputs if not p.exists() or p in failed_outputs]
+        if bad_inputs:
+            print(f"[{step.name}] skipped: missing or out of date {', '.join(p.name for p in bad_inputs)}")
+            report[step.name] = "skipped"
+            failed_outputs.update(step.outputs)
+            continue
+
+        signature = step_signature(step, state["files"])
+        up_to_date = (
+            not force
+            and state["steps"].get(step.name) == signature
+            and all(p.exists() for p in step.outputs)
+        )
+        if up_to_date:
+            print(f"[{step.name}] up to date")
+            report[step.name] = "up to date"
+            continue
+
+        print(f"[{step.name}] running...")
+        try:
+            with span(step.name, "step"):
+                step.func()
+        except Exception as e:
+            print(f"[{step.name}] ERROR: Reason:", e)
+            state["steps"].pop(step.name, None) #Make sure it runs again next time
+            report[step.name] = "failed"
+            failed_outputs.update(step.outputs)
+            continue
+
+        state["steps"][step.name] = signature
+        report[step.name] = "ran"
+        save_state(state, state_path) #Save after every step so a crash later doesn't forget finished work
+
+    save_state(state, state_path)
+    return report
+
+
+def render_plot(plot_func, processed_dir, merged_name, results_dir, data_format):
+    # One plot step: load the merged data and draw one graph
+    from analyze import load_merged_data
+    df = load_merged_data(processed_dir=processed_dir, merged_dir=merged_name, data_format=data_format)
+    plot_func(df, results_dir=results_dir)
+
+
+def render_state_analysis(processed_dir, results_dir, data_format):
+    # State correlations table and bar chart, and the state lead/lag table, from state_merged_clean
+    from analyze import load_state_merged_data, state_correlations, plot_state_correlations, state_lead_lag
+    df_states = load_state_merged_data(processed_dir=processed_dir, data_format=data_format)
+    df_corr = state_correlations(df_states, results_dir=results_dir)
+    plot_state_correlations(df_corr, results_dir=results_dir)
+    state_lead_lag(df_states, results_dir=results_dir)
+
+
+def build_steps(
+        data_dir=DATA_DIR,
+        processed_dir=PROCESSED_DIR,
+        results_dir=RESULTS_DIR,
+        START_DATE=START_DATE,
+        END_DATE=END_DATE,
+        google_search_term=GOOGLE_SEARCH_TERM,
+        fred_bulk_series=FRED_BULK_SERIES,
+        data_format=DATA_FORMAT,
+        state_level=STATE_LEVEL,
+    ):
+    # The whole process + analyze stage as steps: raw files -> clean files -> merged file -> each plot
+    import process
+    import analyze
+
+    def table(directory, name):
+        return table_path(directory, name, data_format)
+
+    def raw(name):
+        # Raw downloads may be CSV even when parquet is chosen (ex: Kaggle without pyarrow), use whichever exists
+        preferred = table(data_dir, name)
+        csv_path = data_dir / Path(name).with_suffix(".csv").name
+        return csv_path if not preferred.exists() and csv_path.exists() else preferred
+
+    steps = []
+
+    # realtor_clean and realtor_monthly hold START_DATE to END_DATE, same as after --process. The realtor store
+    # (see realtor_cache.py) has every month, so when only the dates changed this step re-writes those 2 files from
+    # the store's month index instead of re-cleaning 2M rows
+    steps.append(Step(
+        "clean_realtor",
+        partial(process.process_realtor_data, filename=KAGGLE_NAME, data_dir=data_dir, processed_dir=processed_dir,
+                kaggle_name_clean=KAGGLE_NAME_CLEAN, START_DATE=START_DATE, END_DATE=END_DATE,
+                chunksize=KAGGLE_CHUNKSIZE, kaggle_name_monthly=KAGGLE_NAME_MONTHLY, data_format=data_format),
+        inputs=[raw(KAGGLE_NAME)],
+        outputs=[table(processed_dir, KAGGLE_NAME_CLEAN), table(processed_dir, KAGGLE_NAME_MONTHLY),
+                 realtor_cache.manifest_path(processed_dir, REALTOR_CACHE_NAME)],
+        params={"start": START_DATE, "end": END_DATE, "chunksize": KAGGLE_CHUNKSIZE, "format": data_format,
+                "sketch": [SKETCH_K, SKETCH_EXACT_LIMIT], "quantiles": PRICE_QUANTILES},
+    ))
+
+    steps.append(Step(
+        "clean_mortgage",
+        partial(process.process_mortgage_data, filename=FRED_NAME, data_dir=data_dir, processed_dir=processed_dir,
+                fred_name_clean=FRED_NAME_CLEAN, START_DATE=START_DATE, END_DATE=END_DATE, data_format=data_format),
+        inputs=[raw(FRED_NAME)],
+        outputs=[table(processed_dir, FRED_NAME_CLEAN)],
+        params={"start": START_DATE, "end": END_DATE, "format": data_format},
+    ))
+
+    realtor_store = realtor_cache.manifest_path(processed_dir, REALTOR_CACHE_NAME) #changes whenever the store is re-made
+    merge_inputs = [table(processed_dir, KAGGLE_NAME_MONTHLY), realtor_store, table(processed_dir, FRED_NAME_CLEAN)]
+    if fred_bulk_series:
+        steps.append(Step(
+            "clean_fred_bulk",
+            partial(process.process_fred_bulk_data, filename=FRED_BULK_NAME, data_dir=data_dir,
+                    processed_dir=processed_dir, fred_bulk_name_clean=FRED_BULK_NAME_CLEAN,
+                    START_DATE=START_DATE, END_DATE=END_DATE, data_format=data_format),
+            inputs=[raw(FRED_BULK_NAME)],
+            outputs=[table(processed_dir, FRED_BULK_NAME_CLEAN)],
+            params={"start": START_DATE, "end": END_DATE, "series": list(fred_bulk_series), "format": data_format},
+        ))
+        merge_inputs.append(table(processed_dir, FRED_BULK_NAME_CLEAN))
+
+    steps.append(Step(
+        "clean_google",
+        partial(process.process_google_data, filename=GOOGLE_NAME, data_dir=data_dir, processed_dir=processed_dir,
+                google_name_clean=GOOGLE_NAME_CLEAN, google_search_term=google_search_term,
+                START_DATE=START_DATE, END_DATE=END_DATE, data_format=data_format),
+        inputs=[raw(GOOGLE_NAME)],
+        outputs=[table(processed_dir, GOOGLE_NAME_CLEAN)],
+        params={"start": START_DATE, "end": END_DATE, "search_term": google_search_term, "format": data_format,
+                "keywords": GOOGLE_KEYWORD_COLUMNS},
+    ))
+    merge_inputs.append(table(processed_dir, GOOGLE_NAME_CLEAN))
+
+    merged_path = table(processed_dir, MERGED_CLEAN)
+    seasonal = [SEASONAL_SERIES, SEASONAL_PERIOD, SEASONAL_MIN_CYCLES, SEASONAL_SUFFIX] #settings of the _sa columns
+    steps.append(Step(
+        "merge",
+        partial(process.process_merge_data, processed_dir=processed_dir, kaggle_name_clean=KAGGLE_NAME_CLEAN,
+                google_name_clean=GOOGLE_NAME_CLEAN, fred_name_clean=FRED_NAME_CLEAN, merged_dir=MERGED_CLEAN,
+                google_search_term=google_search_term, kaggle_name_monthly=KAGGLE_NAME_MONTHLY,
+                data_format=data_format, fred_bulk_name_clean=FRED_BULK_NAME_CLEAN,
+                START_DATE=START_DATE, END_DATE=END_DATE),
+        inputs=merge_inputs,
+        outputs=[merged_path],
+        params={"start": START_DATE, "end": END_DATE, "search_term": google_search_term, "format": data_format,
+                "features": FEATURE_SERIES, "horizons": FEATURE_HORIZONS, "seasonal": seasonal,
+                "keywords": GOOGLE_KEYWORD_COLUMNS},
+    ))
+
+    # One step per plot, so changing one plot only redraws that plot
+    plots = [
+        (analyze.plot_time_series, TIME_SERIES_NAME),
+        (analyze.plot_time_series_smoothed, SMOOTH_SERIES_NAME),
+        (analyze.plot_scatter_search_vs_mortgage, GOOGLE_FRED_NAME),
+        (analyze.plot_scatter_search_vs_price, GOOGLE_KAGGLE_NAME),
+        (analyze.plot_correlation_heatmap, HEATMAP_NAME),
+        (analyze.plot_pairplot, PAIRPLOT_NAME),
+    ]
+    regression = {"fast_regression": FAST_REGRESSION, "ci": REGRESSION_CI} #settings of the trend lines
+    for plot_func, plot_name in plots:
+        steps.append(Step(
+            f"plot:{plot_name}",
+            partial(render_plot, plot_func, processed_dir, MERGED_CLEAN, results_dir, data_format),
+            inputs=[merged_path],
+            outputs=[results_dir / plot_name],
+            params={"plot": plot_func.__name__, "file": plot_name,
+                    **(regression if plot_name in (GOOGLE_FRED_NAME, GOOGLE_KAGGLE_NAME, PAIRPLOT_NAME) else {})},
+        ))
+
+    # The correlogram step also saves the lead/lag tables it draws from
+    steps.append(Step(
+        f"plot:{LEAD_LAG_PLOT_NAME}",
+        partial(render_plot, analyze.plot_lead_lag_correlogram, processed_dir, MERGED_CLEAN, results_dir, data_format),
+        inputs=[merged_path],
+        outputs=[results_dir / LEAD_LAG_PLOT_NAME, results_dir / LEAD_LAG_NAME, results_dir / LEAD_LAG_BEST_NAME],
+        params={"series": LEAD_LAG_SERIES, "focus": LEAD_LAG_FOCUS, "max_lag": LEAD_LAG_MAX_LAG,
+                "min_periods": LEAD_LAG_MIN_PERIODS, "changes": LEAD_LAG_CHANGES},
+    ))
+
+    steps.append(Step(
+        f"plot:{SEASONAL_PLOT_NAME}",
+        partial(render_plot, analyze.plot_seasonal_decomposition, processed_dir, MERGED_CLEAN, results_dir, data_format),
+        inputs=[merged_path],
+        outputs=[results_dir / SEASONAL_PLOT_NAME],
+        params={"seasonal": seasonal},
+    ))
+
+    # The keyword heatmap step also saves the correlation table it draws
+    steps.append(Step(
+        f"plot:{KEYWORD_HEATMAP_NAME}",
+        partial(render_plot, analyze.plot_keyword_heatmap, processed_dir, MERGED_CLEAN, results_dir, data_format),
+        inputs=[merged_path],
+        outputs=[results_dir / KEYWORD_HEATMAP_NAME, results_dir / KEYWORD_CORRELATIONS_NAME],
+        params={"keywords": GOOGLE_KEYWORD_COLUMNS, "macro": KEYWORD_MACRO_SERIES, "annotate": KEYWORD_ANNOTATE_LIMIT},
+    ))
+
+    if state_level:
+        # State searches are optional: without them the state merge still runs with an empty search_interest
+        state_inputs = [table(processed_dir, KAGGLE_NAME_CLEAN), realtor_store, table(processed_dir, FRED_NAME_CLEAN)]
+        if raw(GOOGLE_STATE_NAME).exists():
+            steps.append(Step(
+                "clean_google_states",
+                partial(process.process_google_state_data, filename=GOOGLE_STATE_NAME, data_dir=data_dir,
+                        processed_dir=processed_dir, google_state_name_clean=GOOGLE_STATE_NAME_CLEAN,
+                        google_search_term=google_search_term, START_DATE=START_DATE, END_DATE=END_DATE,
+                        data_format=data_format),
+                inputs=[raw(GOOGLE_STATE_NAME)],
+                outputs=[table(processed_dir, GOOGLE_STATE_NAME_CLEAN)],
+                params={"start": START_DATE, "end": END_DATE, "search_term": google_search_term, "format": data_format},
+            ))
+            state_inputs.append(table(processed_dir, GOOGLE_STATE_NAME_CLEAN))
+
+        state_merged_path = table(processed_dir, STATE_MERGED_CLEAN)
+        steps.append(Step(
+            "merge_states",
+            partial(process.process_state_data, processed_dir=processed_dir, kaggle_name_clean=KAGGLE_NAME_CLEAN,
+                    fred_name_clean=FRED_NAME_CLEAN, google_state_name_clean=GOOGLE_STATE_NAME_CLEAN,
+                    state_merged_name=STATE_MERGED_CLEAN, google_search_term=google_search_term,
+                    data_format=data_format, START_DATE=START_DATE, END_DATE=END_DATE),
+            inputs=state_inputs,
+            outputs=[state_merged_path],
+            params={"start": START_DATE, "end": END_DATE, "search_term": google_search_term, "states": STATE_CODES,
+                    "format": data_format, "seasonal": seasonal},
+        ))
+
+        steps.append(Step(
+            "analyze_states",
+            partial(render_state_analysis, processed_dir, results_dir, data_format),
+            inputs=[state_merged_path],
+            outputs=[results_dir / STATE_CORRELATIONS_NAME, results_dir / STATE_CORRELATIONS_PLOT_NAME,
+                     results_dir / STATE_LEAD_LAG_NAME],
+            params={"files": [STATE_CORRELATIONS_NAME, STATE_CORRELATIONS_PLOT_NAME, STATE_LEAD_LAG_NAME],
+                    "lead_lag": [STATE_LEAD_LAG_PAIR, LEAD_LAG_MAX_LAG, LEAD_LAG_MIN_PERIODS, LEAD_LAG_CHANGES]},
+        ))
+
+    return steps
@@ -1,28 +1,131 @@
 #This code will clean and process the 3 sets of data pulled from load.py
-#Cleaned Data will be saved as CSV files in "data/processed" folder in the parent directory
+#Cleaned Data will be saved as CSV (or parquet, see DATA_FORMAT in config.py) files in "data/processed" folder in the parent directory
 
 
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from config import (
+    ensure_dirs,
     DATA_DIR, PROCESSED_DIR,
     KAGGLE_NAME, FRED_NAME, GOOGLE_NAME,
     KAGGLE_NAME_CLEAN, FRED_NAME_CLEAN, GOOGLE_NAME_CLEAN, MERGED_CLEAN,
-    START_DATE, END_DATE,
-    GOOGLE_SEARCH_TERM,
+    FRED_BULK_NAME, FRED_BULK_NAME_CLEAN,
+    KAGGLE_NAME_MONTHLY,
+    START_DATE, END_DATE, RAW_DATE_FORMAT,
+    KAGGLE_CHUNKSIZE,
+    GOOGLE_SEARCH_TERM, GOOGLE_KEYWORD_COLUMNS,
+    FRED_BULK_SERIES,
+    DATA_FORMAT,
+    FEATURE_SERIES, FEATURE_HORIZONS,
+    GOOGLE_STATE_NAME, GOOGLE_STATE_NAME_CLEAN, STATE_MERGED_CLEAN, STATE_CODES, STATE_WORKERS, STATE_LEVEL,
+    SKETCH_K, SKETCH_EXACT_LIMIT, PRICE_QUANTILES,
+    REALTOR_CACHE_NAME,
+    SEASONAL_SERIES,
 )
+from realtor_cache import RealtorCacheWriter, cache_exists, open_realtor_cache, remove_cache, manifest_path as realtor_manifest_path
+from sketch import QuantileSketch
+from features import add_features
+from storage import TABLE_SUFFIXES, read_table, iter_table, write_table, table_exists, find_table, TableWriter
+from profiler import profiled, span
+from dates import DateStats, to_datetime
+from seasonal import add_deseasonalized
 
 
 def clear_processed_folder(processed_dir=PROCESSED_DIR):
     # ----- CLEAN DATA/PROCESSED FOLDER BEFORE STARTING -----
     for f in os.listdir(processed_dir):
-        if f.endswith(".csv"):
+        if f.endswith(tuple(TABLE_SUFFIXES.values())):
             os.remove(processed_dir / f)
+    # The realtor store (realtor_cache) is kept: it remembers which Kaggle file it was made from, so
+    # process_realtor_data re-uses it when only START_DATE/END_DATE changed and re-makes it otherwise
     #print("Cleaned old CSV files from data/processed directory.")
 
 
+# Columns and types we need from the Kaggle CSV. Reading only these (instead of all 12 as text) is most of the memory savings
+# price is left to pandas on purpose: one bad cell (ex: "N/A ") would make read_csv fail on a float64 type, so
+# clean_realtor_chunk turns it into a number and drops the rows that can't be read instead
+REALTOR_COLUMNS = ["prev_sold_date", "price", "state"]
+REALTOR_DTYPES = {"prev_sold_date": "str", "state": "category"}
+
+
+@profiled("process")
+def clean_realtor_chunk(df, START_DATE = START_DATE, END_DATE = END_DATE, date_stats = None) -> pd.DataFrame:
+    # Cleans one piece (or all) of the Kaggle data. Used by both the whole-file and the chunked modes so they match
+    # date_stats (a DateStats) counts the dates that couldn't be read, chunk after chunk
+
+    # Keep only the columns we actually need
+    df = df[REALTOR_COLUMNS]
+
+    # Rename prev_sold_date to date
+    df = df.rename(columns={"prev_sold_date": "date"})
+
+    # Convert the date column into a real datetime type
+    with span("to_datetime", "dates", rows_in=len(df)):
+        #Each distinct date text is read once (see dates.py). Unreadable dates become NaT (dropped below) instead of crashing
+        df["date"] = to_datetime(df["date"], RAW_DATE_FORMAT, errors="coerce", stats=date_stats)
+
+    # Convert price to a numeric column just in case
+    df["price"] = pd.to_numeric(df["price"], errors="coerce")
+
+    # Drop rows where date or price is missing
+    df = df.dropna(subset=["date", "price"])
+
+    # Filter to 20 year range (None = no limit, used by pipeline.py so date changes don't need a re-clean)
+    if START_DATE is not None:
+        df = df[df["date"] >= START_DATE]
+    if END_DATE is not None:
+        df = df[df["date"] <= END_DATE]
+
+    return df
+
+
+@profiled("process")
+def update_month_sketches(sketches, df, k=SKETCH_K, exact_limit=SKETCH_EXACT_LIMIT):
+    # Feeds each month's prices into that month's quantile sketch (one sketch per month, made the first time it's seen)
+    months = df["date"].dt.to_period("M")
+    for month, prices in df.groupby(months)["price"]:
+        if month not in sketches:
+            sketches[month] = QuantileSketch(k=k, exact_limit=exact_limit)
+        sketches[month].update(prices.to_numpy())
+    return sketches
+
+
+def save_monthly_price_totals(totals, processed_dir, kaggle_name_monthly, data_format=DATA_FORMAT):
+    # Saves the monthly sums/counts and median/percentile prices (see RealtorCache.monthly_totals) with the same
+    # MM/DD/YYYY month format as the other processed files
+    df_monthly = totals.sort_index().reset_index()
+    df_monthly["month"] = df_monthly["month"].dt.to_timestamp()
+    df_monthly["price_count"] = df_monthly["price_count"].astype("int64")
+    write_table(df_monthly, processed_dir, kaggle_name_monthly, data_format, date_columns={"month": "%m/%d/%Y"})
+    return df_monthly
+
+
+def realtor_source(data_dir, filename, data_format=DATA_FORMAT) -> dict:
+    # What the realtor store is made from: the Kaggle file (name, size, last change) and the settings that change the
+    # cleaned rows or the month sketches. Saved in the store's manifest. START_DATE/END_DATE aren't in it on purpose
+    path = find_table(data_dir, filename, data_format)
+    if path is None:
+        raise FileNotFoundError(f"{filename} not found in {data_dir}")
+    stat = path.stat()
+    return {"file": path.name, "size": stat.st_size, "modified_ns": stat.st_mtime_ns, "columns": REALTOR_COLUMNS,
+            "date_format": RAW_DATE_FORMAT, "sketch": [SKETCH_K, SKETCH_EXACT_LIMIT]}
+
+
+def realtor_store_is_current(processed_dir, realtor_cache_name, source) -> bool:
+    # True when the store was made from this exact Kaggle file with these settings
+    if not cache_exists(processed_dir, realtor_cache_name):
+        return False
+    with open(realtor_manifest_path(processed_dir, realtor_cache_name)) as f:
+        return json.load(f).get("source") == source
+
+
 # Process Realtor Data (using prev_sold_date as date)
+@profiled("process")
 def process_realtor_data(
         filename: str = KAGGLE_NAME, #:str makes sure filename is a string
         data_dir: Path = DATA_DIR, #:Path makes sure directory is in path format
@@ -30,50 +133,96 @@ def process_realtor_data(
         kaggle_name_clean: str = KAGGLE_NAME_CLEAN,
         START_DATE = START_DATE,
         END_DATE = END_DATE,
+        chunksize: int = KAGGLE_CHUNKSIZE,
+        kaggle_name_monthly: str = KAGGLE_NAME_MONTHLY,
+        data_format: str = DATA_FORMAT,
+        realtor_cache_name: str = REALTOR_CACHE_NAME,
     ) -> pd.DataFrame: #This is the CSV from Kaggle Housing Data
 
     # Only keep: prev_sold_date (renamed to 'date'), price, state
 
+    # Every row with a date and price goes into the realtor store (data/processed/realtor_cache, see realtor_cache.py),
+    # sorted by date with a month index. START_DATE/END_DATE are applied after that by slicing the store, so when
+    # only the dates changed the ~2 million rows aren't read, cleaned or sorted again
+    # A store made from a Kaggle file that is gone or changed is deleted first, so when the rebuild fails nothing is
+    # left behind for process_merge_data/process_state_data to trust (they use the store whenever it is there)
+    try:
+        source = realtor_source(data_dir, filename, data_format)
+    except FileNotFoundError:
+        remove_cache(processed_dir, realtor_cache_name)
+        raise
+    if realtor_store_is_current(processed_dir, realtor_cache_name, source):
+        print(f"{filename} hasn't changed since it was cleaned. Re-using {realtor_cache_name} for the date range...")
+    else:
+        remove_cache(processed_dir, realtor_cache_name) #made from an older Kaggle file (or other settings)
+        if chunksize:
+            # The Kaggle file is over 2 million rows so by default we read it in pieces (see KAGGLE_CHUNKSIZE in config.py)
+            build_realtor_store_chunked(filename, data_dir, processed_dir, chunksize, data_format, realtor_cache_name, source)
+        else:
+            build_realtor_store(filename, data_dir, processed_dir, data_format, realtor_cache_name, source)
+
+    # Save the rows between the dates in the processed folder (dates as MM/DD/YYYY when saved as CSV) and their
+    # monthly sums/counts and median/percentile prices for the merge step
+    cache = open_realtor_cache(processed_dir, realtor_cache_name)
+    rows = cache.window(START_DATE, END_DATE)
+    with span("write realtor window", "io", rows_in=rows.stop - rows.start):
+        writer = TableWriter(processed_dir, kaggle_name_clean, data_format, date_columns={"date": "%m/%d/%Y"})
+        step = chunksize or max(1, rows.stop - rows.start)
+        for first in range(rows.start, rows.stop, step):
+            writer.write(cache.to_frame(slice(first, min(first + step, rows.stop))))
+        writer.close(empty=cache.to_frame(slice(0, 0)))
+    save_monthly_price_totals(cache.monthly_totals(START_DATE, END_DATE), processed_dir, kaggle_name_monthly, data_format)
+
+    # Always the cleaned rows between the dates (date, price, state), chunked or not. They come from the store's
+    # arrays, so they are only 3 columns no matter how big the Kaggle file was. The monthly totals are in kaggle_name_monthly
+    return cache.to_frame(rows)
+
+
+@profiled("process")
+def build_realtor_store(filename, data_dir, processed_dir, data_format, realtor_cache_name, source):
     print(f"Cleaning {filename} from Kaggle...")
 
-    # Get correct full path to data folder
-    full_path = data_dir / filename
-
     # Load CSV file into DataFrame
-    df = pd.read_csv(full_path)
+    df = read_table(data_dir, filename, data_format, columns=REALTOR_COLUMNS, dtype=REALTOR_DTYPES)
 
-    # Keep only the columns we actually need
-    df = df[["prev_sold_date", "price", "state"]]
+    # Clean and convert the dates and prices (no date filter, see process_realtor_data)
+    date_stats = DateStats("prev_sold_date")
+    df = clean_realtor_chunk(df, None, None, date_stats)
+    date_stats.report()
 
-    # Rename prev_sold_date to date
-    df = df.rename(columns={"prev_sold_date": "date"})
+    # Same rows as NumPy arrays sorted by date, plus the month index (see realtor_cache.py)
+    cache_writer = RealtorCacheWriter(processed_dir, realtor_cache_name)
+    cache_writer.write(df)
+    cache_writer.close(update_month_sketches({}, df), source)
 
-    # Convert the date column into a real datetime type
-    df["date"] = pd.to_datetime(df["date"], errors="coerce") #errors = coerce is the same as skip if error comes up, it prevents crashing
 
-    # Convert price to a numeric column just in case
-    df["price"] = pd.to_numeric(df["price"], errors="coerce")
-
-    # Drop rows where date or price is missing
-    df = df.dropna(subset=["date", "price"])
-
-    # Filter to 20 year range
-    df = df[(df["date"] >= START_DATE) & (df["date"] <= END_DATE)]
+@profiled("process")
+def build_realtor_store_chunked(filename, data_dir, processed_dir, chunksize, data_format, realtor_cache_name, source):
+    # Same store as build_realtor_store but only ever holds one chunk in memory. Each cleaned chunk is added to
+    # the store as it comes, and the store sorts all the rows by date when it is closed (see RealtorCacheWriter)
 
-    # Sort by date from oldest to newest
-    df = df.sort_values(by="date", ascending=True)
+    print(f"Cleaning {filename} from Kaggle in chunks of {chunksize} rows...")
 
-    # Convert to YYYY-MM format
-    df["date"] = df["date"].dt.strftime("%m/%d/%Y")
-
-    # Save the cleaned version in the new processed folder
-    out_path = processed_dir / kaggle_name_clean
-    df.to_csv(out_path, index=False)
+    cache_writer = RealtorCacheWriter(processed_dir, realtor_cache_name)
+    sketches = {} #one quantile sketch per month for the median/percentile prices
+    date_stats = DateStats("prev_sold_date") #added up over all the chunks
+    try:
+        reader = iter_table(data_dir, filename, chunksize, data_format, columns=REALTOR_COLUMNS, dtype=REALTOR_DTYPES)
+        for chunk in reader:
+            chunk = clean_realtor_chunk(chunk, None, None, date_stats)
 
-    return df
+            # Fold this chunk into the running monthly sketches
+            update_month_sketches(sketches, chunk)
+            cache_writer.write(chunk)
+        date_stats.report()
+        cache_writer.close(sketches, source)
+    except BaseException: #something failed part way, don't leave a half written cache behind
+        cache_writer.abort()
+        raise
 
 
 # Process FRED mortgage data (convert from weekly to monthly using averages for the months)
+@profiled("process")
 def process_mortgage_data(
         filename: str = FRED_NAME, #:str makes sure filename is a string
         data_dir: Path = DATA_DIR, #:Path makes sure directory is in path format
@@ -81,18 +230,16 @@ def process_mortgage_data(
         fred_name_clean: str = FRED_NAME_CLEAN,
         START_DATE = START_DATE,
         END_DATE = END_DATE,
+        data_format: str = DATA_FORMAT,
     ) -> pd.DataFrame: #This is the CSV from FRED Mortgage Rates database
 
     print(f"Cleaning {filename} from FRED...")
 
-    # Get correct full path to data folder
-    full_path = data_dir / filename
-
     # Load the CSV
-    df = pd.read_csv(full_path)
+    df = read_table(data_dir, filename, data_format)
 
     # Convert date to datetime and value to numeric
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["date"] = to_datetime(df["date"], RAW_DATE_FORMAT, errors="coerce")
     df["value"] = pd.to_numeric(df["value"], errors="coerce")
 
     # Drop nulls just in case and keep only needed columns
@@ -117,13 +264,50 @@ def process_mortgage_data(
     df_monthly = df_monthly.sort_values(by="month")
 
     # Save cleaned version
-    out_path = processed_dir / fred_name_clean
-    df_monthly.to_csv(out_path, index=False)
+    write_table(df_monthly, processed_dir, fred_name_clean, data_format)
+
+    return df_monthly
+
+
+# Process the FRED bulk series (weekly/monthly/quarterly, all mixed) into one wide monthly table
+@profiled("process")
+def process_fred_bulk_data(
+        filename: str = FRED_BULK_NAME,
+        data_dir: Path = DATA_DIR,
+        processed_dir: Path = PROCESSED_DIR,
+        fred_bulk_name_clean: str = FRED_BULK_NAME_CLEAN,
+        START_DATE = START_DATE,
+        END_DATE = END_DATE,
+        data_format: str = DATA_FORMAT,
+    ) -> pd.DataFrame: #This is the long table (series_id, date, value) from FRED_bulk in load.py
+
+    print(f"Cleaning {filename} from FRED...")
+
+    df = read_table(data_dir, filename, data_format)
+
+    # Same cleaning as process_mortgage_data, but for every series at once
+    df["date"] = to_datetime(df["date"], RAW_DATE_FORMAT, errors="coerce")
+    df["value"] = pd.to_numeric(df["value"], errors="coerce") #FRED uses "." for missing values
+    df = df.dropna(subset=["date", "value"])
+    df = df[(df["date"] >= START_DATE) & (df["date"] <= END_DATE)]
+
+    # Monthly average of every series in ONE groupby, then one column per series
+    df["month"] = df["date"].dt.to_period("M")
+    df_monthly = df.groupby(["month", "series_id"])["value"].mean().unstack("series_id")
+    df_monthly.columns.name = None
+    df_monthly = df_monthly.reset_index()
+
+    # Convert month period to first of the month timestamp and sort oldest to newest
+    df_monthly["month"] = df_monthly["month"].dt.to_timestamp()
+    df_monthly = df_monthly.sort_values(by="month")
+
+    write_table(df_monthly, processed_dir, fred_bulk_name_clean, data_format)
 
     return df_monthly
 
 
 # Process Google Trends data
+@profiled("process")
 def process_google_data(
         filename: str = GOOGLE_NAME, #:str makes sure filename is a string
         data_dir: Path = DATA_DIR, #:Path makes sure directory is in path format
@@ -132,37 +316,40 @@ def process_google_data(
         google_search_term: str = GOOGLE_SEARCH_TERM,
         START_DATE=START_DATE,
         END_DATE=END_DATE,
+        data_format: str = DATA_FORMAT,
+        keyword_columns: dict = GOOGLE_KEYWORD_COLUMNS,
     ) -> pd.DataFrame: #This is the CSV from Google Trends database
 
     print(f"Cleaning {filename} from Google Trends...")
 
-    # Get correct full path to data folder
-    full_path = data_dir / filename
-
     # Load the CSV
-    df = pd.read_csv(full_path)
+    df = read_table(data_dir, filename, data_format)
 
     # Convert date column
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df["date"] = to_datetime(df["date"], RAW_DATE_FORMAT, errors="coerce")
 
-    # Keep only the columns we need
-    df = df[["date", google_search_term]]
+    # Keep only the columns we need: the main search plus every extra search (GOOGLE_EXTRA_KEYWORDS) that was downloaded
+    missing = [kw for kw in keyword_columns if kw not in df.columns and kw != google_search_term]
+    if missing:
+        print(f"No Google Trends data for {missing} (run --load again to download them). Skipping them...")
+    keywords = [google_search_term] + [kw for kw in keyword_columns if kw in df.columns and kw != google_search_term]
+    df = df[["date"] + keywords]
 
     # Filter to 20 year range
     df = df[(df["date"] >= START_DATE) & (df["date"] <= END_DATE)]
 
-    # Convert google score to numeric
-    df[google_search_term] = pd.to_numeric(df[google_search_term], errors="coerce")
+    # Convert google scores to numeric (every search at once)
+    df[keywords] = df[keywords].apply(pd.to_numeric, errors="coerce")
 
     # Sort oldest to newest
     df = df.sort_values(by="date")
 
     # Save the cleaned version in the new processed folder
-    out_path = processed_dir / google_name_clean
-    df.to_csv(out_path, index=False)
+    write_table(df, processed_dir, google_name_clean, data_format)
 
     return df
 
+@profiled("process")
 def process_merge_data(  #This is what we use to merge the data we want from the 3 into 1 csv file
         processed_dir: Path = PROCESSED_DIR,
         kaggle_name_clean: str = KAGGLE_NAME_CLEAN,
@@ -170,36 +357,57 @@ def process_merge_data(  #This is what we use to merge the data we want from the
         fred_name_clean: str = FRED_NAME_CLEAN,
         merged_dir: Path = MERGED_CLEAN,
         google_search_term: str = GOOGLE_SEARCH_TERM,
+        kaggle_name_monthly: str = KAGGLE_NAME_MONTHLY,
+        data_format: str = DATA_FORMAT,
+        fred_bulk_name_clean: str = FRED_BULK_NAME_CLEAN,
+        feature_series: dict = FEATURE_SERIES,
+        feature_horizons: list = FEATURE_HORIZONS,
+        realtor_cache_name: str = REALTOR_CACHE_NAME,
+        START_DATE = START_DATE,
+        END_DATE = END_DATE,
+        seasonal_series: list = SEASONAL_SERIES,
+        keyword_columns: dict = GOOGLE_KEYWORD_COLUMNS,
     ):
     #Merges the cleaned realtor, google trends, and mortgage datasets into one monthly dataset and saves as merged.csv
     print("Further processing and merging data...")
 
-    # Load processed datasets
-    realtor_path = processed_dir / kaggle_name_clean
-    google_path = processed_dir / google_name_clean
-    mortgage_path = processed_dir / fred_name_clean
-
-    df_realtor = pd.read_csv(realtor_path)
-    df_google = pd.read_csv(google_path)
-    df_mortgage = pd.read_csv(mortgage_path)
-
-
-    # Convert date columns back to datetime so Python can work with it
-    df_realtor["date"] = pd.to_datetime(df_realtor["date"])
-    df_google["date"] = pd.to_datetime(df_google["date"])
-    df_mortgage["month"] = pd.to_datetime(df_mortgage["month"]) #column is already monthly
+    # Load processed datasets and convert date columns back to datetime so Python can work with it
+    # (parquet files already have real datetimes so nothing is re-parsed)
+    df_google = read_table(processed_dir, google_name_clean, data_format, date_columns={"date": None})
+    df_mortgage = read_table(processed_dir, fred_name_clean, data_format, date_columns={"month": None}) #column is already monthly
 
 
     # Realtor to Monthly Average Price
-    df_realtor["month"] = df_realtor["date"].dt.to_period("M")  # YYYY-MM
-    monthly_group = df_realtor.groupby("month")["price"].mean()
-    df_prices = monthly_group.reset_index()
-    df_prices["month"] = df_prices["month"].dt.to_timestamp()  # YYYY-MM-01
-    df_prices = df_prices.rename(columns={"price": "avg_price"})
-
-
-    # Google Trends to Monthly
-    df_google = df_google.rename(columns={"date": "month", google_search_term: "search_interest"})
+    # The realtor store is used whenever its manifest is there: process_realtor_data deletes it when the Kaggle file it
+    # was made from is gone or changed. Only without it are the monthly totals (or realtor_clean) read instead
+    if cache_exists(processed_dir, realtor_cache_name) or table_exists(processed_dir, kaggle_name_monthly, data_format):
+        # The prices are already added up by month, so no need to re-read ~2 million rows. The realtor store's month
+        # index gives exactly START_DATE to END_DATE (see realtor_cache.py), the monthly file what was processed last
+        if cache_exists(processed_dir, realtor_cache_name):
+            df_prices = open_realtor_cache(processed_dir, realtor_cache_name).monthly_totals(START_DATE, END_DATE).reset_index()
+            df_prices["month"] = df_prices["month"].dt.to_timestamp()
+        else:
+            df_prices = read_table(processed_dir, kaggle_name_monthly, data_format, date_columns={"month": "%m/%d/%Y"})
+        df_prices["avg_price"] = df_prices["price_sum"] / df_prices["price_count"]
+        quantile_columns = [c for c in PRICE_QUANTILES if c in df_prices.columns] #older monthly files only have sums/counts
+        df_prices = df_prices[["month", "avg_price"] + quantile_columns]
+    else:
+        # No monthly totals: re-read realtor_clean
+        df_realtor = read_table(processed_dir, kaggle_name_clean, data_format, date_columns={"date": "%m/%d/%Y"})
+        df_realtor["month"] = df_realtor["date"].dt.to_period("M")  # YYYY-MM
+        monthly_group = df_realtor.groupby("month")["price"].mean()
+        df_prices = monthly_group.reset_index()
+        df_prices["month"] = df_prices["month"].dt.to_timestamp()  # YYYY-MM-01
+        df_prices = df_prices.rename(columns={"price": "avg_price"})
+        for name, q in PRICE_QUANTILES.items(): #every price is in memory here, so these are exact
+            df_prices[name] = df_realtor.groupby("month")["price"].quantile(q).to_numpy()
+
+
+    # Google Trends to Monthly. The extra searches are already side by side (one column each), so they all come in with
+    # the same merge as search_interest, ex: "mortgage rates" -> kw_mortgage_rates
+    extra_columns = {kw: column for kw, column in keyword_columns.items() if kw != google_search_term}
+    df_google = df_google.rename(columns={"date": "month", google_search_term: "search_interest", **extra_columns})
+    df_google = df_google[["month", "search_interest"] + [c for c in extra_columns.values() if c in df_google.columns]]
 
 
     # Mortgage Rates to Monthly
@@ -210,50 +418,187 @@ def process_merge_data(  #This is what we use to merge the data we want from the
     df_merged = df_prices.merge(df_google, on="month", how="inner")
     df_merged = df_merged.merge(df_mortgage, on="month", how="inner")
 
+    # Extra FRED series (if process_fred_bulk_data ran) are joined in one step. Left join so a series that
+    # starts late or isn't published yet for the last months doesn't remove those months
+    if table_exists(processed_dir, fred_bulk_name_clean, data_format):
+        df_bulk = read_table(processed_dir, fred_bulk_name_clean, data_format, date_columns={"month": None})
+        df_bulk = df_bulk.drop(columns=[c for c in df_bulk.columns if c != "month" and c in df_merged.columns])
+        df_merged = df_merged.merge(df_bulk, on="month", how="left")
+
 
     # Sort
     df_merged = df_merged.sort_values(by="month")
 
     #--------------------------------For Future Analysis-------------------
     # This is here but not used for final project. May look into further for future analysis
-    # Add % change in house prices (month-over-month) and mortgage %
-    df_merged["price_pct_change"] = df_merged["avg_price"].pct_change() * 100
-    df_merged["mortgage_pct_change"] = df_merged["mortgage_rate"].pct_change() * 100
-    df_merged["search_pct_change"] = df_merged["search_interest"].pct_change() * 100
-
-    # Round both to 1 decimal place
-    df_merged["price_pct_change"] = df_merged["price_pct_change"].round(1)
-    df_merged["mortgage_pct_change"] = df_merged["mortgage_pct_change"].round(1)
-    df_merged["search_pct_change"] = df_merged["search_pct_change"].round(1)
-
-    #This is here but not used for final project. May look into further for future analysis
-    # Direction columns (-1, 0, 1) This is focusing simply on whether data went up or down, ignoring all the numbers
-    df_merged["price_direction"] = df_merged["price_pct_change"].apply(
-        lambda x: 1 if x > 0 else (0 if x == 0 else -1)
-    )
-    df_merged["mortgage_direction"] = df_merged["mortgage_pct_change"].apply(
-        lambda x: 1 if x > 0 else (0 if x == 0 else -1)
-    )
-    df_merged["search_direction"] = df_merged["search_pct_change"].apply(
-        lambda x: 1 if x > 0 else (0 if x == 0 else -1)
-    )
-
+    # % change (rounded to 1 decimal), direction (-1, 0, 1), log change, lags and leads for every series in
+    # FEATURE_SERIES over every horizon in FEATURE_HORIZONS (see features.py)
+    df_merged = df_merged.reset_index(drop=True)
+    df_merged = add_features(df_merged, feature_series, feature_horizons)
     # ^^^^^^^^^^^^^^^^^^^^ For Future Analysis (but I still want it in the excel sheet for now) ^^^^^^^^^^^^^^^^^^^^
 
-
-    #Convert month to MM/DD/YYYY (always 1st day of the month)
-    df_merged["month"] = df_merged["month"].dt.strftime("%m/%d/%Y")
+    # Deseasonalized copies of the price, rate and search series (ex: avg_price_sa, see seasonal.py), so the
+    # correlations and trend lines can leave out the usual winter swing
+    df_merged = add_deseasonalized(df_merged, seasonal_series)
 
 
-    # Save
-    out_path = processed_dir / merged_dir
-    df_merged.to_csv(out_path, index=False)
+    # Save (month as MM/DD/YYYY, always 1st day of the month, when saved as CSV)
+    write_table(df_merged, processed_dir, merged_dir, data_format, date_columns={"month": "%m/%d/%Y"})
 
     return df_merged
 
 
+# -----------------------------------------------------------
+# State level data (one row per state and month)
+# -----------------------------------------------------------
+@profiled("process")
+def process_google_state_data(
+        filename: str = GOOGLE_STATE_NAME,
+        data_dir: Path = DATA_DIR,
+        processed_dir: Path = PROCESSED_DIR,
+        google_state_name_clean: str = GOOGLE_STATE_NAME_CLEAN,
+        google_search_term: str = GOOGLE_SEARCH_TERM,
+        START_DATE=START_DATE,
+        END_DATE=END_DATE,
+        data_format: str = DATA_FORMAT,
+    ) -> pd.DataFrame: #This is the long table (state_code, date, search term) from GTrends_states in load.py
+
+    print(f"Cleaning {filename} from Google Trends...")
+
+    # Same cleaning as process_google_data, for every state at once
+    df = read_table(data_dir, filename, data_format)
+    df["date"] = to_datetime(df["date"], RAW_DATE_FORMAT, errors="coerce")
+    df = df[["state_code", "date", google_search_term]]
+    df = df[(df["date"] >= START_DATE) & (df["date"] <= END_DATE)]
+    df[google_search_term] = pd.to_numeric(df[google_search_term], errors="coerce")
+    df = df.sort_values(by=["state_code", "date"])
+
+    write_table(df, processed_dir, google_state_name_clean, data_format)
+
+    return df
+
+
+@profiled("process")
+def merge_state(state, state_code, df_state, df_mortgage, df_search) -> pd.DataFrame:
+    # One state's monthly average and median price and number of sales, joined to the national mortgage rate and that state's searches
+    df_state = df_state.assign(month=df_state["date"].dt.to_period("M"))
+    df_monthly = df_state.groupby("month")["price"].agg(avg_price="mean", price_median="median", sale_count="count").reset_index()
+    df_monthly["month"] = df_monthly["month"].dt.to_timestamp()
+
+    # Inner join with the mortgage rates keeps only months in the date range, left join with the searches keeps
+    # months Google has no data for (those get an empty search_interest)
+    df_merged = df_monthly.merge(df_mortgage, on="month", how="inner")
+    df_merged = df_merged.merge(df_search, on="month", how="left")
+
+    df_merged.insert(0, "state_code", state_code)
+    df_merged.insert(0, "state", state)
+    return df_merged.sort_values(by="month")
+
+
+_state_shared = {} #The mortgage and search tables inside each worker process (sent once when the process starts)
+
+
+def _init_state_worker(df_mortgage, df_search, processed_dir=None, realtor_cache_name=None, dates=(None, None)):
+    _state_shared["mortgage"] = df_mortgage
+    _state_shared["search"] = df_search
+    # With the NumPy cache every worker opens the same memory-mapped files, so the prices are shared instead of copied
+    _state_shared["cache"] = open_realtor_cache(processed_dir, realtor_cache_name) if processed_dir else None
+    _state_shared["rows"] = _state_shared["cache"].window(*dates) if processed_dir else None #rows between the dates
+
+
+def _merge_state_in_worker(state, state_code, df_state=None):
+    if df_state is None:
+        cache = _state_shared["cache"]
+        rows = _state_shared["rows"]
+        in_state = np.flatnonzero(cache.states[rows] == cache.state_code(state)) + rows.start
+        df_state = cache.to_frame(in_state)[["date", "price"]]
+    df_search = _state_shared["search"]
+    df_search = df_search[df_search["state_code"] == state_code][["month", "search_interest"]]
+    return merge_state(state, state_code, df_state, _state_shared["mortgage"], df_search)
+
+
+@profiled("process")
+def process_state_data(
+        processed_dir: Path = PROCESSED_DIR,
+        kaggle_name_clean: str = KAGGLE_NAME_CLEAN,
+        fred_name_clean: str = FRED_NAME_CLEAN,
+        google_state_name_clean: str = GOOGLE_STATE_NAME_CLEAN,
+        state_merged_name: str = STATE_MERGED_CLEAN,
+        google_search_term: str = GOOGLE_SEARCH_TERM,
+        states: dict = STATE_CODES,
+        data_format: str = DATA_FORMAT,
+        max_workers = STATE_WORKERS,
+        realtor_cache_name: str = REALTOR_CACHE_NAME,
+        START_DATE = START_DATE,
+        END_DATE = END_DATE,
+        seasonal_series: list = SEASONAL_SERIES,
+    ) -> pd.DataFrame:
+    #Splits the cleaned realtor data by state and merges each state with the mortgage rates and its own Google searches
+    #The states are done at the same time in separate processes (one per CPU core) and saved in ONE long table
+    print("Merging state level data...")
+
+    df_mortgage = read_table(processed_dir, fred_name_clean, data_format, date_columns={"month": None})
+    df_mortgage = df_mortgage.rename(columns={"value": "mortgage_rate"})
+
+    # Google state searches are optional (ex: Google blocked us during --load). Without them search_interest is left empty
+    if table_exists(processed_dir, google_state_name_clean, data_format):
+        df_search = read_table(processed_dir, google_state_name_clean, data_format, date_columns={"date": None})
+        df_search = df_search.rename(columns={"date": "month", google_search_term: "search_interest"})
+    else:
+        print(f"No {google_state_name_clean} found. State search interest will be left empty.")
+        df_search = pd.DataFrame({"state_code": pd.Series(dtype="str"), "month": pd.Series(dtype="datetime64[ns]"),
+                                  "search_interest": pd.Series(dtype="float64")})
+
+    # Only states in STATE_CODES (so territories like Puerto Rico are left out)
+    # With the NumPy cache (see realtor_cache.py) each worker picks out its own state's rows from the shared arrays.
+    # Without it, realtor_clean is read here and each state's rows are sent to the workers
+    use_cache = cache_exists(processed_dir, realtor_cache_name)
+    if use_cache:
+        cache = open_realtor_cache(processed_dir, realtor_cache_name)
+        partitions = [(state, states[state]) for state in sorted(cache.state_names) if state in states]
+        shared = (df_mortgage, df_search, processed_dir, realtor_cache_name, (START_DATE, END_DATE))
+    else:
+        df_realtor = read_table(processed_dir, kaggle_name_clean, data_format, columns=["date", "price", "state"],
+                                dtype={"state": "category"}, date_columns={"date": "%m/%d/%Y"})
+        if START_DATE is not None:
+            df_realtor = df_realtor[df_realtor["date"] >= START_DATE]
+        if END_DATE is not None:
+            df_realtor = df_realtor[df_realtor["date"] <= END_DATE]
+        partitions = [
+            (state, states[state], part[["date", "price"]])
+            for state, part in df_realtor.groupby("state", observed=True)
+            if state in states
+        ]
+        shared = (df_mortgage, df_search)
+    if not partitions:
+        raise ValueError("No rows in the realtor data match a state in STATE_CODES")
+
+    workers = max_workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(partitions)))
+    if workers == 1: #With 1 worker, starting a process only adds time
+        _init_state_worker(*shared)
+        frames = [_merge_state_in_worker(*partition) for partition in partitions]
+    else:
+        # "spawn" starts clean processes (same on Windows, Mac and Linux) instead of copying this one
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_state_worker, initargs=shared) as pool:
+            frames = list(pool.map(_merge_state_in_worker, *zip(*partitions)))
+
+    df_states = pd.concat(frames, ignore_index=True)
+
+    # Deseasonalized copies for every state, all states in one go (see seasonal.py)
+    df_states = add_deseasonalized(df_states, seasonal_series, group_column="state")
+
+    # Save (month as MM/DD/YYYY, always 1st day of the month, when saved as CSV)
+    write_table(df_states, processed_dir, state_merged_name, data_format, date_columns={"month": "%m/%d/%Y"})
+
+    return df_states
+
+
 if __name__ == "__main__":
     print("----------------------Running Data Cleaning/Processing----------------------")
+    ensure_dirs()
     clear_processed_folder()
 
     try:
@@ -266,6 +611,12 @@ if __name__ == "__main__":
     except Exception as e:
         print("FRED CSV FILE PROCESSING ERROR: Reason:", e)
 
+    if FRED_BULK_SERIES:
+        try:
+            process_fred_bulk_data()
+        except Exception as e:
+            print("FRED BULK CSV FILE PROCESSING ERROR: Reason:", e)
+
     try:
         process_google_data()
     except Exception as e:
@@ -276,4 +627,15 @@ if __name__ == "__main__":
     except Exception as e:
         print("MERGING CSV FILE ERROR: Reason:", e)
 
+    if STATE_LEVEL:
+        try:
+            process_google_state_data()
+        except Exception as e:
+            print("GOOGLE STATE CSV FILE PROCESSING ERROR: Reason:", e)
+
+        try:
+            process_state_data()
+        except Exception as e:
+            print("STATE MERGING CSV FILE ERROR: Reason:", e)
+
     print('Data Cleaning/Processing Complete: All successfully processed data will be saved to "data/processed/" folder.')
@@ -0,0 +1,280 @@
+#This code measures where the time and memory go when main.py is run with --profile
+#Every load/process/plot function and every table read or write is wrapped in a "span". Each span records:
+#   wall time, CPU time (of the thread running it), rows in and rows out (when there is a table), the memory of the
+#   whole process (RSS) and its highest point so far, and the tracemalloc peak if PROFILE_TRACEMALLOC is on
+#Spans are grouped in categories so it is easy to see if the time goes to the network, waiting on Google's rate limit,
+#reading/writing files (io), converting dates, seaborn statistics or drawing the graphs
+#When profiling is off (the default) a span only costs one if-check
+#save() writes 2 files to results/profile/:
+#   profile_summary.json  totals for every function and every category
+#   profile_trace.json    every span on a timeline (open it in https://ui.perfetto.dev or chrome://tracing)
+#Work done inside worker processes (parallel graphs, state merges) shows up as one span in the main process.
+#While several threads run at once (the concurrent --load), their tracemalloc peaks overlap
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from config import PROFILE_DIR, PROFILE_TRACEMALLOC
+
+_profile = None #The Profile being recorded, None when profiling is off
+
+
+def memory_mb(field):
+    # A memory number of this process from /proc/self/status (Linux), ex: "VmRSS" (now) or "VmHWM" (highest so far)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024 #KB
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    # Highest memory this process has used so far (None on Windows, which has no "resource" module)
+    # On Linux /proc is used because getrusage also counts memory used by the parent before this process started
+    peak = memory_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 #bytes on Mac, KB on Linux
+
+
+def count_rows(value):
+    # Rows of a DataFrame, Series or array (None for anything else, ex: a path or None)
+    if hasattr(value, "shape") and hasattr(value, "__len__"):
+        return len(value)
+    return None
+
+
+class Span:
+    # One timed piece of work. rows_in / rows_out / args can be filled in while it runs
+    def __init__(self, name, category, rows_in=None, args=None):
+        self.name = name
+        self.category = category
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.args = args or {}
+        self.children_seconds = 0.0 #time spent in spans inside this one (on the same thread)
+        self.children_cpu = 0.0
+        self.memory_peak = 0 #tracemalloc peak seen by spans inside this one
+
+
+class NullSpan:
+    # What span() gives back when profiling is off, so "s.rows_out = ..." still works
+    rows_in = rows_out = None
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profile:
+
+    def __init__(self, trace_memory=PROFILE_TRACEMALLOC):
+        self.trace_memory = trace_memory
+        self.start = time.perf_counter()
+        self.records = []
+        self.lock = threading.Lock()
+        self.local = threading.local() #each thread has its own stack of open spans
+        self.thread_names = {}
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name, category, rows_in=None, **args):
+        stack = self.stack()
+        current = Span(name, category, rows_in, args)
+        if self.trace_memory:
+            if stack: #the span around this one keeps the peak reached before it was reset
+                stack[-1].memory_peak = max(stack[-1].memory_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        rss_before = memory_mb("VmRSS")
+        stack.append(current)
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            record = {
+                "name": name,
+                "category": category,
+                "start": start - self.start,
+                "wall_seconds": wall,
+                "self_seconds": max(0.0, wall - current.children_seconds),
+                "cpu_seconds": cpu,
+                "self_cpu_seconds": max(0.0, cpu - current.children_cpu),
+                "rows_in": current.rows_in,
+                "rows_out": current.rows_out,
+                "peak_rss_mb": peak_rss_mb(),
+                "thread": threading.get_ident(),
+            }
+            rss_after = memory_mb("VmRSS")
+            if rss_before is not None and rss_after is not None:
+                record["rss_change_mb"] = rss_after - rss_before
+            if self.trace_memory:
+                peak = max(current.memory_peak, tracemalloc.get_traced_memory()[1])
+                record["tracemalloc_peak_mb"] = peak / (1024 * 1024)
+                if stack:
+                    stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+            if current.args:
+                record["args"] = {key: str(value) for key, value in current.args.items()}
+            if stack:
+                stack[-1].children_seconds += wall
+                stack[-1].children_cpu += cpu
+            with self.lock:
+                self.records.append(record)
+                self.thread_names.setdefault(record["thread"], threading.current_thread().name)
+
+    # ----- results -----
+    def summary(self):
+        # Totals per category (self time, so nested spans aren't counted twice) and per function (slowest first)
+        total = time.perf_counter() - self.start
+        categories = {}
+        functions = {}
+        for record in self.records:
+            category = categories.setdefault(record["category"], {"count": 0, "self_seconds": 0.0, "cpu_seconds": 0.0})
+            category["count"] += 1
+            category["self_seconds"] += record["self_seconds"]
+            category["cpu_seconds"] += record["self_cpu_seconds"]
+
+            function = functions.setdefault(record["name"], {
+                "category": record["category"], "count": 0, "wall_seconds": 0.0, "self_seconds": 0.0,
+                "cpu_seconds": 0.0, "rows_in": 0, "rows_out": 0, "peak_rss_mb": 0.0,
+            })
+            function["count"] += 1
+            for key in ("wall_seconds", "self_seconds", "cpu_seconds"):
+                function[key] += record[key]
+            for key in ("rows_in", "rows_out"):
+                function[key] += record[key] or 0
+            function["peak_rss_mb"] = max(function["peak_rss_mb"], record["peak_rss_mb"] or 0.0)
+            if "tracemalloc_peak_mb" in record:
+                function["tracemalloc_peak_mb"] = max(function.get("tracemalloc_peak_mb", 0.0), record["tracemalloc_peak_mb"])
+
+        rounded = lambda d: {key: round(value, 4) if isinstance(value, float) else value for key, value in d.items()}
+        return {
+            "total_seconds": round(total, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "tracemalloc": self.trace_memory,
+            "spans": len(self.records),
+            "categories": {name: rounded(values) for name, values in
+                           sorted(categories.items(), key=lambda item: item[1]["self_seconds"], reverse=True)},
+            "functions": {name: rounded(values) for name, values in
+                          sorted(functions.items(), key=lambda item: item[1]["wall_seconds"], reverse=True)},
+        }
+
+    def chrome_trace(self):
+        # "Trace Event Format": one complete ("X") event per span, times in microseconds
+        pid = os.getpid()
+        thread_ids = {thread: i for i, thread in enumerate(self.thread_names)}
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_ids[thread], "args": {"name": name}}
+                  for thread, name in self.thread_names.items()]
+        for record in self.records:
+            args = {key: record[key] for key in ("cpu_seconds", "rows_in", "rows_out", "peak_rss_mb", "rss_change_mb",
+                                                 "tracemalloc_peak_mb") if record.get(key) is not None}
+            args.update(record.get("args", {}))
+            events.append({
+                "name": record["name"], "cat": record["category"], "ph": "X", "pid": pid,
+                "tid": thread_ids[record["thread"]],
+                "ts": round(record["start"] * 1e6, 1), "dur": round(record["wall_seconds"] * 1e6, 1), "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# -----------------------------------------------------------
+# What the rest of the code uses
+# -----------------------------------------------------------
+def enable(trace_memory=PROFILE_TRACEMALLOC):
+    global _profile
+    _profile = Profile(trace_memory)
+    return _profile
+
+
+def disable():
+    global _profile
+    profile, _profile = _profile, None
+    if profile is not None and profile.trace_memory:
+        tracemalloc.stop()
+    return profile
+
+
+def is_enabled() -> bool:
+    return _profile is not None
+
+
+@contextmanager
+def span(name, category="code", rows_in=None, **args):
+    # Ex: with span("read kaggle", "io", path=path) as s:
+    #         df = pd.read_csv(path)
+    #         s.rows_out = len(df)
+    profile = _profile
+    if profile is None:
+        yield NULL_SPAN
+        return
+    with profile.span(name, category, rows_in, **args) as current:
+        yield current
+
+
+def profiled(category, name=None):
+    # Decorator that puts the whole function in a span. Rows in = rows of the first table argument,
+    # rows out = rows of the table it returns
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile is None:
+                return func(*args, **kwargs)
+            rows_in = next((rows for rows in map(count_rows, list(args) + list(kwargs.values())) if rows is not None), None)
+            with span(span_name, category, rows_in) as current:
+                result = func(*args, **kwargs)
+                current.rows_out = count_rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def save(out_dir=PROFILE_DIR):
+    # Writes profile_summary.json and profile_trace.json and returns their paths
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    summary_path = out_dir / "profile_summary.json"
+    trace_path = out_dir / "profile_trace.json"
+    with open(summary_path, "w") as f:
+        json.dump(_profile.summary(), f, indent=2)
+    with open(trace_path, "w") as f:
+        json.dump(_profile.chrome_trace(), f)
+    return summary_path, trace_path
+
+
+def print_summary(top=12):
+    summary = _profile.summary()
+    print(f"\nProfile ({summary['total_seconds']:.1f} s, peak memory {summary['peak_rss_mb'] or 0:.0f} MB):")
+    print(f"  {'category':<12} {'time (s)':>9} {'cpu (s)':>8}")
+    for name, values in summary["categories"].items():
+        print(f"  {name:<12} {values['self_seconds']:>9.2f} {values['cpu_seconds']:>8.2f}")
+    print(f"\n  {'function':<36} {'calls':>5} {'time (s)':>9} {'cpu (s)':>8} {'rows in':>10} {'rows out':>10}")
+    for name, values in list(summary["functions"].items())[:top]:
+        print(f"  {name:<36} {values['count']:>5} {values['wall_seconds']:>9.2f} {values['cpu_seconds']:>8.2f} "
+              f"{values['rows_in'] or '':>10} {values['rows_out'] or '':>10}")
@@ -0,0 +1,145 @@
+#This code decides how long to wait between Google Trends requests instead of always sleeping a fixed time
+#It is a "token bucket" with "AIMD" (additive increase, multiplicative decrease):
+#   - Requests spend tokens. Tokens refill at the current rate (requests per second), so a few requests go with no wait
+#   - Every request that works raises the rate a little (additive increase)
+#   - Every time Google says "too many requests" (429) the rate is cut in half (multiplicative decrease)
+#   - The rate also slowly recovers on its own as time passes since the last 429
+#The state is saved to a small JSON file so the next run remembers if Google was throttling us recently
+
+import json
+import threading
+import time
+from pathlib import Path
+from config import TRENDS_RATE_LIMIT, TRENDS_LIMITER_STATE
+from profiler import span
+
+
+def is_throttled(error) -> bool:
+    # True if the error means Google is rate limiting us: an HTTP 429 status on the error or its response, or a
+    # pytrends TooManyRequestsError (or a subclass of it). The message text isn't checked, "429" can be in any message
+    for status in (getattr(getattr(error, "response", None), "status_code", None), getattr(error, "status_code", None)):
+        if status == 429:
+            return True
+    return any(cls.__name__ == "TooManyRequestsError" for cls in type(error).__mro__)
+
+
+class AdaptiveRateLimiter:
+
+    def __init__(self, state_path=TRENDS_LIMITER_STATE, max_rate=TRENDS_RATE_LIMIT["max_rate"],
+                 min_rate=TRENDS_RATE_LIMIT["min_rate"], burst=TRENDS_RATE_LIMIT["burst"],
+                 increase=TRENDS_RATE_LIMIT["increase"], decrease=TRENDS_RATE_LIMIT["decrease"],
+                 recovery=TRENDS_RATE_LIMIT["recovery"]):
+        self.state_path = Path(state_path) if state_path else None
+        self.max_rate = max_rate #requests per second when nothing is throttling us
+        self.min_rate = min_rate #never slower than this
+        self.burst = burst #how many requests can go back to back with no wait
+        self.increase = increase #rate added after each request that works
+        self.decrease = decrease #rate multiplied by this after a 429
+        self.recovery = recovery #rate added back per second that passes without a 429
+        self.lock = threading.Lock()
+
+        # Start fast (full bucket at the max rate) unless a saved state says otherwise
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.throttle_count = 0
+        self.load()
+
+    # ----- saving and loading the state between runs -----
+    def load(self):
+        if self.state_path is None or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            self.rate = min(self.max_rate, max(self.min_rate, float(state["rate"])))
+            self.tokens = min(float(self.burst), float(state["tokens"]))
+            self.updated = float(state["updated"])
+            self.throttle_count = int(state.get("throttle_count", 0))
+        except (OSError, ValueError, KeyError):
+            pass #Broken state file = start fresh
+
+    def save(self):
+        # Only called when the rate changed (a 429 or a request that works below max_rate), not on every request
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        state = {"rate": self.rate, "tokens": self.tokens, "updated": self.updated, "throttle_count": self.throttle_count}
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        tmp_path.replace(self.state_path)
+
+    # ----- the rate limiting itself -----
+    def refill(self, now):
+        # Adds tokens for the time that passed, and lets the rate recover toward the max
+        elapsed = max(0.0, now - self.updated)
+        self.rate = min(self.max_rate, self.rate + self.recovery * elapsed)
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        # Waits until a request is allowed and returns how many seconds it waited
+        with self.lock:
+            self.refill(time.time())
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            self.tokens -= 1 #Can go below 0 here, the wait below pays it back
+
+        if wait > 0:
+            if wait >= 1:
+                print(f"Google Trends rate limit: waiting {wait:.1f} seconds . . .")
+            time.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self.lock:
+            self.refill(time.time())
+            old_rate = self.rate
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            if self.rate != old_rate:
+                self.save()
+
+    def on_throttle(self):
+        with self.lock:
+            self.refill(time.time())
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0) #Empty the bucket so the next request waits for the new, slower rate
+            self.throttle_count += 1
+            if self.rate != old_rate:
+                self.save()
+        print(f"Google Trends is throttling us (429). Slowing down to 1 request every {1 / self.rate:.1f} seconds.")
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_trends_limiter(max_wait=None, state_path=TRENDS_LIMITER_STATE) -> AdaptiveRateLimiter:
+    # One shared limiter per state file so every Trends call in this run goes through the same one
+    # max_wait (the --sleep value) is the longest wait between requests, even when throttled
+    settings = dict(TRENDS_RATE_LIMIT)
+    if max_wait:
+        settings["min_rate"] = 1 / max_wait
+    key = (str(state_path), settings["min_rate"])
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = AdaptiveRateLimiter(state_path=state_path, **settings)
+        return _limiters[key]
+
+
+def call_with_limiter(limiter, func, *args, retries=5, **kwargs):
+    # Runs one Google Trends call through the limiter. If it gets throttled, slows down and tries again
+    for attempt in range(retries + 1):
+        with span("rate limit wait", "wait"):
+            limiter.acquire()
+        try:
+            with span(f"Google Trends {func.__name__}", "network"):
+                result = func(*args, **kwargs)
+        except Exception as e:
+            if not is_throttled(e) or attempt == retries:
+                raise
+            limiter.on_throttle()
+            continue
+        limiter.on_success()
+        return result
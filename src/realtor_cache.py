@@ -0,0 +1,311 @@
+#This code saves the cleaned Kaggle data a second time as plain NumPy arrays in "data/processed/realtor_cache":
+#   days.npy    int32   date of each sale as a day number (days since 1970-01-01)
+#   prices.npy  float64 price of each sale
+#   states.npy  uint8   state of each sale as a number. manifest.json lists the state names in number order
+#   month_index.npz     where each month's rows start and end, plus each month's number of sales, sum of prices and
+#                       quantile sketch (see build_month_index)
+#   manifest.json       number of rows, state names, first/last date, a SHA-256 of each array and what the data was
+#                       made from (the "source", see process_realtor_data)
+#Rows are sorted by date (oldest to newest), so every month's rows sit next to each other. Any date range is then
+#2 binary searches (window) and its monthly totals come from the month index (monthly_totals), without going
+#through the rows again.
+#The arrays are opened "memory-mapped": nothing is read until it is used, opening takes milliseconds instead of
+#re-reading 2M rows of text, and several processes opening the same files share the same memory instead of each
+#having their own copy.
+#Ex (notebook): cache = open_realtor_cache(PROCESSED_DIR); cache.prices.mean(); cache.to_frame()
+#               cache.to_frame(cache.window("2020-01-01", "2020-12-31")); cache.monthly_totals("2020-01-01", "2020-12-31")
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from config import PROCESSED_DIR, REALTOR_CACHE_NAME, SKETCH_K, SKETCH_EXACT_LIMIT, PRICE_QUANTILES
+from profiler import span
+from sketch import QuantileSketch
+
+CACHE_COLUMNS = {"days": "int32", "prices": "float64", "states": "uint8"}
+MISSING_STATE = 255 #state number used when a sale has no state (so at most 255 real states)
+MONTH_INDEX_NAME = "month_index.npz"
+SORT_BLOCK = 1_000_000 #rows sorted into place at a time when the cache is closed (about 13 MB per block)
+
+
+def day_number(date) -> int:
+    # A date (text, Timestamp, ...) as days since 1970-01-01, same as the days array
+    return int(pd.Timestamp(date).to_datetime64().astype("datetime64[D]").astype("int64"))
+
+
+def month_numbers(days):
+    # Day numbers to month numbers (months since 1970-01, same as pandas' Period("YYYY-MM", "M").ordinal)
+    return np.asarray(days).astype("datetime64[D]").astype("datetime64[M]").astype("int64")
+
+
+def build_month_index(days, prices, sketches=None, k=SKETCH_K, exact_limit=SKETCH_EXACT_LIMIT) -> dict:
+    # The month index for rows sorted by date. One entry per month that has sales:
+    #   months          month number
+    #   offsets         the month's rows are offsets[i] to offsets[i + 1] (one more entry than months)
+    #   counts, sums    number of sales and sum of their prices
+    #   sketch_*        each month's quantile sketch (see QuantileSketch.summary): its kept values and their weights
+    #                   are sketch_values/sketch_weights[sketch_offsets[i]:sketch_offsets[i + 1]], plus min and max
+    # sketches = {pd.Period month: QuantileSketch} already made while cleaning (a month without one gets a new one)
+    days = np.asarray(days)
+    prices = np.asarray(prices, dtype="float64")
+    if len(days) and np.any(days[1:] < days[:-1]):
+        raise ValueError("Realtor rows must be sorted by date to build the month index")
+    row_months = month_numbers(days)
+    starts = np.r_[0, np.flatnonzero(row_months[1:] != row_months[:-1]) + 1] if len(days) else np.empty(0, dtype="int64")
+    offsets = np.r_[starts, len(days)].astype("int64")
+    sketches = {period.ordinal: sketch for period, sketch in (sketches or {}).items()}
+
+    values, weights, sketch_offsets, minimums, maximums = [], [], [0], [], []
+    for i, month in enumerate(row_months[starts]):
+        sketch = sketches.get(month)
+        if sketch is None:
+            sketch = QuantileSketch(k=k, exact_limit=exact_limit).update(prices[offsets[i]:offsets[i + 1]])
+        month_values, month_weights = sketch.summary()
+        values.append(month_values)
+        weights.append(month_weights)
+        sketch_offsets.append(sketch_offsets[-1] + len(month_values))
+        minimums.append(sketch.min)
+        maximums.append(sketch.max)
+
+    return {
+        "months": row_months[starts],
+        "offsets": offsets,
+        "counts": np.diff(offsets),
+        "sums": np.add.reduceat(prices, starts) if len(starts) else np.empty(0),
+        "sketch_values": np.concatenate(values) if values else np.empty(0),
+        "sketch_weights": np.concatenate(weights) if weights else np.empty(0),
+        "sketch_offsets": np.asarray(sketch_offsets, dtype="int64"),
+        "sketch_min": np.asarray(minimums, dtype="float64"),
+        "sketch_max": np.asarray(maximums, dtype="float64"),
+    }
+
+
+class RealtorCacheWriter:
+    # Writes the cache a piece at a time (same pieces as TableWriter), in any date order. The arrays go to raw files
+    # first since the final number of rows isn't known yet, then close() sorts them by date into .npy files (see
+    # sort_by_day) and writes the month index and the manifest.
+    # Everything is built in a temporary folder that replaces the old cache in one step, so a crash never leaves half a cache
+
+    def __init__(self, processed_dir=PROCESSED_DIR, cache_name=REALTOR_CACHE_NAME):
+        self.path = Path(processed_dir) / cache_name
+        self.tmp_path = Path(processed_dir) / f"{cache_name}.tmp"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+        self.raw_files = {name: open(self.tmp_path / f"{name}.raw", "wb") for name in CACHE_COLUMNS}
+        self.state_codes = {} #state name: number, in the order they are first seen
+        self.day_counts = {} #day number: rows with that date
+        self.rows = 0
+
+    def encode_states(self, states):
+        # Turns state names into numbers, only looping over the different names (not every row)
+        codes, names = pd.factorize(states)
+        lookup = np.empty(len(names) + 1, dtype="uint8")
+        for i, name in enumerate(names):
+            if name not in self.state_codes:
+                if len(self.state_codes) >= MISSING_STATE:
+                    raise ValueError(f"More than {MISSING_STATE} different states, they don't fit in uint8")
+                self.state_codes[name] = len(self.state_codes)
+            lookup[i] = self.state_codes[name]
+        lookup[-1] = MISSING_STATE #pd.factorize gives -1 for missing values, which picks the last entry
+        return lookup[codes]
+
+    def write(self, df):
+        # df has the realtor_clean columns: date (datetime), price, state
+        days = df["date"].to_numpy(dtype="datetime64[D]").astype("int64")
+        arrays = {
+            "days": days.astype("int32"),
+            "prices": df["price"].to_numpy(dtype="float64"),
+            "states": self.encode_states(df["state"]),
+        }
+        for name, values in arrays.items():
+            self.raw_files[name].write(np.ascontiguousarray(values, dtype=CACHE_COLUMNS[name]).tobytes())
+        for day, count in zip(*(a.tolist() for a in np.unique(days, return_counts=True))):
+            self.day_counts[day] = self.day_counts.get(day, 0) + count
+        self.rows += len(df)
+
+    def sort_by_day(self, raws, outs, block=SORT_BLOCK):
+        # Counting sort: the number of rows for each day is known, so each day gets its own stretch of the output
+        # (all the earlier days' rows come before it). The rows are then read a block at a time and each one is put
+        # in the next free place of its day. Rows with the same date stay in the order they were written, and only one
+        # block is in memory at a time
+        day_values = np.array(sorted(self.day_counts), dtype="int64")
+        counts = np.array([self.day_counts[day] for day in day_values.tolist()], dtype="int64")
+        starts = np.cumsum(counts) - counts #first place of each day in the output
+        for first in range(0, self.rows, block):
+            days = raws["days"][first:first + block]
+            order = np.argsort(days, kind="stable")
+            which = np.searchsorted(day_values, days[order]) #day of each row (0 = the first day)
+            group_starts = np.flatnonzero(np.r_[True, which[1:] != which[:-1]])
+            group_sizes = np.diff(np.r_[group_starts, len(which)])
+            rank = np.arange(len(which)) - np.repeat(group_starts, group_sizes) #rows of the same day before it in this block
+            places = starts[which] + rank
+            for name, out in outs.items():
+                out[places] = raws[name][first:first + block][order]
+            starts[which[group_starts]] += group_sizes
+
+    def close(self, sketches=None, source=None, k=SKETCH_K, exact_limit=SKETCH_EXACT_LIMIT):
+        # sketches = the month sketches made while cleaning (saved in the month index), source = what the rows were
+        # made from (saved in the manifest so the next run can tell if they are still up to date)
+        for f in self.raw_files.values():
+            f.close()
+
+        manifest = {"rows": self.rows, "date_unit": "days since 1970-01-01", "columns": dict(CACHE_COLUMNS),
+                    "states": list(self.state_codes), "missing_state": MISSING_STATE, "sha256": {},
+                    "month_index": {"file": MONTH_INDEX_NAME, "sketch_k": k, "sketch_exact_limit": exact_limit},
+                    "source": source}
+        outs = {name: np.lib.format.open_memmap(self.tmp_path / f"{name}.npy", mode="w+", dtype=dtype, shape=(self.rows,))
+                for name, dtype in CACHE_COLUMNS.items()}
+        if self.rows:
+            raws = {name: np.memmap(self.tmp_path / f"{name}.raw", dtype=dtype, mode="r", shape=(self.rows,))
+                    for name, dtype in CACHE_COLUMNS.items()}
+            with span("sort realtor store", "process", rows_in=self.rows):
+                self.sort_by_day(raws, outs)
+            del raws
+        for name, out in outs.items():
+            out.flush()
+            manifest["sha256"][name] = hashlib.sha256(memoryview(np.ascontiguousarray(out)).cast("B")).hexdigest()
+        del outs, out
+        for name in CACHE_COLUMNS:
+            (self.tmp_path / f"{name}.raw").unlink()
+
+        mmap_mode = "r" if self.rows else None #an empty file can't be memory-mapped
+        days = np.load(self.tmp_path / "days.npy", mmap_mode=mmap_mode)
+        prices = np.load(self.tmp_path / "prices.npy", mmap_mode=mmap_mode)
+        if self.rows:
+            manifest["first_date"] = str(np.datetime64(int(days[0]), "D"))
+            manifest["last_date"] = str(np.datetime64(int(days[-1]), "D"))
+        np.savez(self.tmp_path / MONTH_INDEX_NAME, **build_month_index(days, prices, sketches, k, exact_limit))
+        manifest["months"] = len(np.load(self.tmp_path / MONTH_INDEX_NAME)["months"])
+        del days, prices
+
+        with open(self.tmp_path / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.tmp_path.replace(self.path)
+        return self.path
+
+    def abort(self):
+        for f in self.raw_files.values():
+            f.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+
+class RealtorCache:
+    # The opened cache. days/prices/states are read-only memory-mapped arrays
+    def __init__(self, path, manifest, days, prices, states):
+        self.path = path
+        self.manifest = manifest
+        self.days = days
+        self.prices = prices
+        self.states = states
+        self.state_names = manifest["states"]
+        self._month_index = None
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def dates(self):
+        # Day numbers as real dates (makes a copy)
+        return self.days.astype("datetime64[D]")
+
+    @property
+    def month_index(self) -> dict:
+        # Loaded the first time it is used. Caches saved before there was a month index get one made from their rows
+        if self._month_index is None:
+            index_path = self.path / MONTH_INDEX_NAME
+            if index_path.exists():
+                with np.load(index_path) as saved:
+                    self._month_index = {name: saved[name] for name in saved.files}
+            else:
+                self._month_index = build_month_index(self.days, self.prices)
+        return self._month_index
+
+    def window(self, start=None, end=None) -> slice:
+        # Rows with start <= date <= end (None = no limit), found with 2 binary searches since rows are sorted by date
+        first = 0 if start is None else int(np.searchsorted(self.days, day_number(start), side="left"))
+        last = len(self) if end is None else int(np.searchsorted(self.days, day_number(end), side="right"))
+        return slice(first, max(first, last))
+
+    def monthly_totals(self, start=None, end=None, quantiles=PRICE_QUANTILES) -> pd.DataFrame:
+        # price_sum, price_count and the PRICE_QUANTILES prices of every month between start and end (index = month)
+        # Whole months come straight from the month index. Only the first and last month can be cut by the dates,
+        # and only their rows are read
+        index = self.month_index
+        rows = self.window(start, end)
+        months = range(0)
+        if rows.stop > rows.start: #the months holding the first and last row, and all in between
+            first, last = np.searchsorted(index["offsets"], [rows.start, rows.stop - 1], side="right") - 1
+            months = range(first, last + 1)
+        settings = self.manifest.get("month_index", {})
+        k = settings.get("sketch_k", SKETCH_K)
+        exact_limit = settings.get("sketch_exact_limit", SKETCH_EXACT_LIMIT)
+
+        sums, counts, values = [], [], []
+        for i in months:
+            month_start, month_end = index["offsets"][i], index["offsets"][i + 1]
+            cut_start, cut_end = max(month_start, rows.start), min(month_end, rows.stop)
+            if (cut_start, cut_end) == (month_start, month_end):
+                sketch_rows = slice(index["sketch_offsets"][i], index["sketch_offsets"][i + 1])
+                sketch = QuantileSketch.from_summary(index["sketch_values"][sketch_rows], index["sketch_weights"][sketch_rows],
+                                                     index["counts"][i], index["sketch_min"][i], index["sketch_max"][i],
+                                                     k, exact_limit)
+                sums.append(index["sums"][i])
+                counts.append(index["counts"][i])
+            else:
+                prices = np.asarray(self.prices[cut_start:cut_end], dtype="float64")
+                sketch = QuantileSketch(k=k, exact_limit=exact_limit).update(prices)
+                sums.append(prices.sum())
+                counts.append(len(prices))
+            values.append(sketch.quantiles(list(quantiles.values())))
+
+        month_index = pd.PeriodIndex.from_ordinals([index["months"][i] for i in months], freq="M", name="month")
+        totals = pd.DataFrame({"price_sum": np.asarray(sums, dtype="float64"), "price_count": np.asarray(counts, dtype="int64")},
+                              index=month_index)
+        return totals.join(pd.DataFrame(np.reshape(values, (len(totals), len(quantiles))), index=month_index,
+                                        columns=list(quantiles), dtype="float64"))
+
+    def state_code(self, name):
+        # Number used for a state name, or None if no sale is in that state
+        return self.state_names.index(name) if name in self.state_names else None
+
+    def to_frame(self, rows=slice(None)) -> pd.DataFrame:
+        # Same columns as realtor_clean (date, price, state) for all rows or some of them (ex: a mask or slice)
+        codes = np.asarray(self.states[rows])
+        categories = pd.Categorical.from_codes(
+            np.where(codes == MISSING_STATE, -1, codes).astype("int64"), categories=self.state_names
+        )
+        return pd.DataFrame({
+            "date": pd.to_datetime(np.asarray(self.days[rows]).astype("datetime64[D]")),
+            "price": np.asarray(self.prices[rows]),
+            "state": categories,
+        })
+
+
+def manifest_path(processed_dir=PROCESSED_DIR, cache_name=REALTOR_CACHE_NAME) -> Path:
+    return Path(processed_dir) / cache_name / "manifest.json"
+
+
+def cache_exists(processed_dir=PROCESSED_DIR, cache_name=REALTOR_CACHE_NAME) -> bool:
+    return manifest_path(processed_dir, cache_name).exists()
+
+
+def remove_cache(processed_dir=PROCESSED_DIR, cache_name=REALTOR_CACHE_NAME):
+    # Deletes the cache (used when the file it was made from is gone or changed, so nothing reads it after that)
+    shutil.rmtree(Path(processed_dir) / cache_name, ignore_errors=True)
+
+
+def open_realtor_cache(processed_dir=PROCESSED_DIR, cache_name=REALTOR_CACHE_NAME) -> RealtorCache:
+    # Opens the arrays without reading them (memory-mapped, read-only)
+    path = Path(processed_dir) / cache_name
+    with open(path / "manifest.json") as f:
+        manifest = json.load(f)
+    mmap_mode = "r" if manifest["rows"] else None #an empty file can't be memory-mapped
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in CACHE_COLUMNS}
+    for name, values in arrays.items():
+        if len(values) != manifest["rows"]:
+            raise ValueError(f"Realtor cache is broken: {name}.npy has {len(values)} rows, expected {manifest['rows']}")
+    return RealtorCache(path, manifest, arrays["days"], arrays["prices"], arrays["states"])
@@ -0,0 +1,92 @@
+#This code draws straight trend lines (least squares) with their confidence band, the same thing seaborn's regplot
+#draws but without its bootstrap. regplot finds the band by re-fitting the line on 1000 resampled copies of the data
+#for every graph. For a straight line the band has an exact formula, so all the lines of a figure (ex: the 6 of the
+#pair plot) are fitted at once with a few NumPy sums:
+#   slope = Sxy / Sxx       intercept = mean(y) - slope * mean(x)
+#   band  = line(x) +- t * s * sqrt(1/n + (x - mean(x))^2 / Sxx)
+#s is the spread of the points around the line and t comes from the t distribution with n - 2 degrees of freedom.
+#Rows where x or y is missing are skipped for that line only (same as regplot)
+
+import math
+from statistics import NormalDist
+import numpy as np
+from config import REGRESSION_CI
+
+GRID_POINTS = 100 #points along each line (same as regplot)
+
+
+def t_quantile(p, df):
+    # Value of the t distribution with df degrees of freedom that has p of it below (scipy isn't a requirement)
+    # 1 and 2 degrees of freedom have exact formulas, more use a Cornish-Fisher expansion around the normal value
+    # (off by less than 0.1% from 5 degrees of freedom up, the smallest lines drawn have about 20 points)
+    df = np.asarray(df, dtype="float64")
+    z = NormalDist().inv_cdf(p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (z
+             + (z**3 + z) / (4 * df)
+             + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+             + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+             + (79 * z**9 + 776 * z**7 + 1482 * z**5 - 1920 * z**3 - 945 * z) / (92160 * df**4))
+    t = np.where(df == 1, math.tan(math.pi * (p - 0.5)), t)
+    t = np.where(df == 2, (2 * p - 1) / math.sqrt(2 * p * (1 - p)), t)
+    return np.where(df >= 1, t, np.nan)
+
+
+def fit_lines(x, y):
+    # x and y are (points, lines) arrays: column p of y is fitted against column p of x
+    # Returns a dict of arrays with one value per line: slope, intercept, n, x_mean, sxx, s (residual spread), x_min, x_max
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    if x.ndim == 1:
+        x, y = x[:, None], y[:, None]
+    present = ~(np.isnan(x) | np.isnan(y))
+    n = present.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.where(present, x, 0.0).sum(axis=0) / n
+        y_mean = np.where(present, y, 0.0).sum(axis=0) / n
+        dx = np.where(present, x - x_mean, 0.0)
+        dy = np.where(present, y - y_mean, 0.0)
+        sxx = (dx ** 2).sum(axis=0)
+        slope = (dx * dy).sum(axis=0) / sxx
+        residuals = np.where(present, dy - slope * dx, 0.0)
+        s = np.sqrt((residuals ** 2).sum(axis=0) / (n - 2))
+    return {
+        "slope": slope,
+        "intercept": y_mean - slope * x_mean,
+        "n": n,
+        "x_mean": x_mean,
+        "sxx": sxx,
+        "s": s,
+        "x_min": np.where(present, x, np.inf).min(axis=0),
+        "x_max": np.where(present, x, -np.inf).max(axis=0),
+    }
+
+
+def line_band(fits, ci=REGRESSION_CI, points=GRID_POINTS):
+    # Every line from its smallest to its largest x. Returns (x, y, lower, upper), each (lines, points)
+    # ci = confidence level in % (ex: 95). None = no band (lower and upper are None)
+    steps = np.linspace(0.0, 1.0, points)
+    grid = fits["x_min"][:, None] + (fits["x_max"] - fits["x_min"])[:, None] * steps
+    fitted = fits["intercept"][:, None] + fits["slope"][:, None] * grid
+    if ci is None:
+        return grid, fitted, None, None
+    t = t_quantile(0.5 + ci / 200, fits["n"] - 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = (t * fits["s"])[:, None] * np.sqrt(1 / fits["n"][:, None]
+                                                    + (grid - fits["x_mean"][:, None]) ** 2 / fits["sxx"][:, None])
+    return grid, fitted, fitted - spread, fitted + spread
+
+
+def draw_trend_lines(axes, x=None, y=None, color="red", ci=REGRESSION_CI, label=None, fits=None):
+    # Draws line p (and its band) on axes[p]. Lines with fewer than 2 points are left out
+    # fits = the result of fit_lines(x, y) if it was already worked out (then x and y aren't needed)
+    if fits is None:
+        fits = fit_lines(x, y)
+    grid, fitted, lower, upper = line_band(fits, ci)
+    for p, ax in enumerate(axes):
+        if fits["n"][p] < 2 or not np.isfinite(fits["slope"][p]):
+            continue
+        ax.plot(grid[p], fitted[p], color=color, label=label)
+        if lower is not None and fits["n"][p] > 2:
+            ax.fill_between(grid[p], lower[p], upper[p], color=color, alpha=0.15, linewidth=0)
+    return fits
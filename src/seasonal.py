@@ -0,0 +1,108 @@
+#This code splits monthly series into 3 parts (classical additive decomposition, same as statsmodels' seasonal_decompose):
+#   trend      centered 12-month moving average (the 2 end months get half weight, so each calendar month counts once)
+#   seasonal   the average of (value - trend) for each calendar month, shifted so the 12 averages add up to 0
+#   residual   what is left: value - trend - seasonal
+#The "deseasonalized" series is value - seasonal: it keeps the trend and the surprises but not the usual winter dip.
+#All the series (ex: every column of the merged data, or every column of every state) are done at once as one
+#(months x series) matrix: the moving average is one matrix product over sliding windows and the calendar month
+#averages are another, so 200 series take about as long as 1.
+#Missing months are added back as empty rows first so a 12-month window is really 12 months. The trend is empty for
+#the first and last 6 months and for windows with a missing month. A calendar month needs at least SEASONAL_MIN_CYCLES
+#years with a trend value, otherwise that series gets no seasonal part (and no deseasonalized values)
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from config import SEASONAL_PERIOD, SEASONAL_MIN_CYCLES, SEASONAL_SUFFIX
+
+PARTS = ["observed", "trend", "seasonal", "residual"]
+
+
+def trend_weights(period=SEASONAL_PERIOD):
+    # Centered moving average weights. An even period (12) needs period + 1 months with half weight on both ends
+    if period % 2:
+        return np.full(period, 1 / period)
+    weights = np.full(period + 1, 1 / period)
+    weights[[0, -1]] = 1 / (2 * period)
+    return weights
+
+
+def month_phases(months, period=SEASONAL_PERIOD):
+    # Place of each month in the cycle (0 to period - 1). With period 12: 0 = January ... 11 = December
+    months = pd.DatetimeIndex(months)
+    return np.asarray((months.year * 12 + months.month - 1) % period)
+
+
+def decompose(values, phases, period=SEASONAL_PERIOD, min_cycles=SEASONAL_MIN_CYCLES) -> dict:
+    # values = (months, series) array with one row per month, phases = month_phases of those months
+    # Returns trend, seasonal and residual (each the same shape as values) and profile: (period, series), the seasonal
+    # value of each place in the cycle
+    values = np.asarray(values, dtype="float64")
+    if values.ndim == 1:
+        values = values[:, None]
+    phases = np.asarray(phases)
+
+    # Every window of every series times the weights in one product (a window with a missing month gives NaN)
+    weights = trend_weights(period)
+    half = len(weights) // 2
+    trend = np.full(values.shape, np.nan)
+    if len(values) >= len(weights):
+        trend[half:len(values) - half] = sliding_window_view(values, len(weights), axis=0) @ weights
+
+    # Average of value - trend for each place in the cycle: a (period, months) 0/1 matrix times the detrended values
+    detrended = values - trend
+    present = ~np.isnan(detrended)
+    in_phase = (np.arange(period)[:, None] == phases[None, :]).astype("float64")
+    counts = in_phase @ present
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profile = (in_phase @ np.where(present, detrended, 0.0)) / counts
+    profile[counts < min_cycles] = np.nan
+    profile[:, np.isnan(profile).any(axis=0)] = np.nan #a series missing part of the cycle gets no seasonal part at all
+    profile = profile - profile.mean(axis=0)
+
+    seasonal = profile[phases]
+    return {"trend": trend, "seasonal": seasonal, "residual": values - trend - seasonal, "profile": profile}
+
+
+def decompose_wide(wide, period=SEASONAL_PERIOD, min_cycles=SEASONAL_MIN_CYCLES) -> dict:
+    # wide = DataFrame with one row per month (index) and one column per series
+    # Returns DataFrames for observed, trend, seasonal and residual (missing months added as empty rows) and profile
+    wide = wide.sort_index().astype("float64")
+    wide = wide[~wide.index.duplicated()].asfreq("MS")
+    parts = decompose(wide.to_numpy(), month_phases(wide.index, period), period, min_cycles)
+    frames = {"observed": wide}
+    for name in PARTS[1:]:
+        frames[name] = pd.DataFrame(parts[name], index=wide.index, columns=wide.columns)
+    frames["profile"] = pd.DataFrame(parts["profile"], index=pd.RangeIndex(period, name="phase"), columns=wide.columns)
+    return frames
+
+
+def decompose_frame(df, columns, date_column="month", period=SEASONAL_PERIOD, min_cycles=SEASONAL_MIN_CYCLES) -> dict:
+    # Same as decompose_wide for some columns of a table with one row per month
+    return decompose_wide(df.set_index(date_column)[columns], period, min_cycles)
+
+
+def add_deseasonalized(df, columns, date_column="month", group_column=None, suffix=SEASONAL_SUFFIX,
+                       period=SEASONAL_PERIOD, min_cycles=SEASONAL_MIN_CYCLES) -> pd.DataFrame:
+    # Adds <column><suffix> (value - seasonal part) for every column, ex: avg_price_sa
+    # group_column (ex: "state"): every group is decomposed on its own, but all groups and columns in the same matrix
+    columns = [c for c in columns if c in df.columns]
+    if not columns or df.empty:
+        return df.assign(**{c + suffix: np.nan for c in columns})
+
+    if group_column is None:
+        wide = df.set_index(date_column)[columns]
+    else:
+        wide = df.pivot(index=date_column, columns=group_column, values=columns) #columns = (column, group)
+    frames = decompose_wide(wide, period, min_cycles)
+    adjusted = (frames["observed"] - frames["seasonal"]).to_numpy()
+
+    # Pick every row's value out of the (months, series) result without a merge
+    row_positions = frames["observed"].index.get_indexer(df[date_column])
+    if group_column is None:
+        column_positions = np.repeat(np.arange(len(columns)), len(df))
+    else:
+        keys = pd.MultiIndex.from_arrays([np.repeat(columns, len(df)), np.tile(df[group_column].to_numpy(), len(columns))])
+        column_positions = frames["observed"].columns.get_indexer(keys)
+    values = adjusted[np.tile(row_positions, len(columns)), column_positions].reshape(len(columns), len(df))
+    return df.assign(**{column + suffix: values[i] for i, column in enumerate(columns)})
@@ -0,0 +1,149 @@
+#This code finds medians and other percentiles (ex: 10th and 90th) of prices without keeping every price in memory
+#A QuantileSketch is fed prices a chunk at a time and can answer "what is the median so far?" at any point
+#   - Small groups (up to exact_limit prices) are kept exactly, so their percentiles are exact (same as pandas)
+#   - Bigger groups switch to a "KLL" sketch: prices are kept in levels, and when a level fills up it is sorted and
+#     every other price moves up a level counting double. Memory stays around a few times k no matter how many prices,
+#     and the rank of an answer is off by about 1.7 / k (about 1% for k = 200)
+#Two sketches can be merged (ex: one per chunk, state or worker process) and give the same accuracy as one sketch
+#fed everything
+
+import numpy as np
+from config import SKETCH_K, SKETCH_EXACT_LIMIT
+
+
+class QuantileSketch:
+
+    def __init__(self, k=SKETCH_K, exact_limit=SKETCH_EXACT_LIMIT, seed=0):
+        self.k = k #size of the top level. Bigger = more accurate and more memory
+        self.exact_limit = exact_limit #keep every value until there are more than this
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+        self.exact = True
+        self.values = [] #exact mode: the arrays of values as they came in
+        self.levels = [] #sketch mode: levels[h] holds values that each count as 2**h values
+        self.rng = np.random.default_rng(seed) #picks odd or even values when compacting. Seeded so runs repeat exactly
+
+    # ----- adding values -----
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.count += values.size
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+
+        if self.exact:
+            self.values.append(values)
+            if self.count > self.exact_limit:
+                self.to_sketch()
+        else:
+            self.add_to_level(0, values)
+            self.compact()
+        return self
+
+    def merge(self, other):
+        # Adds everything other has seen into this sketch (other is not changed)
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+
+        if self.exact and other.exact and self.count <= self.exact_limit:
+            self.values.extend(other.values)
+            return self
+
+        if self.exact:
+            self.to_sketch()
+        other_levels = [np.concatenate(other.values)] if other.exact else other.levels
+        for h, level in enumerate(other_levels):
+            self.add_to_level(h, level)
+        self.compact()
+        return self
+
+    # ----- sketch mode -----
+    def to_sketch(self):
+        self.levels = [np.concatenate(self.values)] if self.values else []
+        self.values = []
+        self.exact = False
+        self.compact()
+
+    def add_to_level(self, h, values):
+        while len(self.levels) <= h:
+            self.levels.append(np.empty(0))
+        self.levels[h] = np.concatenate([self.levels[h], values])
+
+    def capacity(self, h):
+        # The top level holds k values and each level below holds 2/3 as many (but at least 2)
+        depth = len(self.levels) - h - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def compact(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.capacity(h):
+                level = np.sort(level)
+                # With an odd number of values one stays behind so the total weight doesn't change
+                keep = level[:len(level) % 2]
+                level = level[len(level) % 2:]
+                promoted = level[self.rng.integers(2)::2]
+                self.levels[h] = keep
+                self.add_to_level(h + 1, promoted)
+            h += 1
+
+    # ----- saving -----
+    def summary(self):
+        # (values, weights): every value the sketch kept and how many values each one stands for (2**level).
+        # Enough to answer the same quantiles later, see from_summary (ex: saved per month in realtor_cache.py)
+        kept = self.values if self.exact else self.levels
+        values = np.concatenate(kept) if kept else np.empty(0)
+        weights = (np.ones(len(values)) if self.exact else
+                   np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)]))
+        return values, weights
+
+    @classmethod
+    def from_summary(cls, values, weights, count, minimum, maximum, k=SKETCH_K, exact_limit=SKETCH_EXACT_LIMIT):
+        # The sketch back from summary() (gives the same quantiles)
+        sketch = cls(k=k, exact_limit=exact_limit)
+        sketch.count = int(count)
+        sketch.min = minimum
+        sketch.max = maximum
+        values = np.asarray(values, dtype="float64")
+        weights = np.asarray(weights, dtype="float64")
+        if sketch.count <= exact_limit:
+            sketch.values = [values] if len(values) else []
+        else:
+            sketch.exact = False
+            levels = np.log2(weights).round().astype("int64")
+            sketch.levels = [values[levels == h] for h in range(levels.max() + 1 if len(levels) else 0)]
+        return sketch
+
+    # ----- answers -----
+    def quantiles(self, qs):
+        # Values at each fraction in qs (ex: [0.1, 0.5, 0.9]). Exact mode matches np.quantile / pandas .quantile()
+        qs = np.asarray(qs, dtype="float64")
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        if self.exact:
+            return np.quantile(np.concatenate(self.values), qs)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        cumulative = np.cumsum(weights[order])
+        # Position of each answer in the weighted, sorted values (same rank rule as np.quantile: q * (n - 1))
+        ranks = qs * (cumulative[-1] - 1)
+        result = values[np.searchsorted(cumulative, ranks, side="right").clip(0, len(values) - 1)]
+        # The smallest and largest values are always known exactly
+        result = np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+        return result
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def median(self):
+        return self.quantile(0.5)
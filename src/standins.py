@@ -0,0 +1,253 @@
+#This code has stand-ins (fakes) for the 3 data sources so the load stage can be run and timed with no internet:
+#   FredStandIn     a small web server on this computer that answers the same URLs as api.stlouisfed.org/fred
+#                   (point FRED at it with fred_base_url=, see run_load in main.py)
+#   TrendsStandIn   makes fake pytrends clients (same build_payload / interest_over_time methods as TrendReq)
+#   KaggleStandIn   "downloads" a synthetic Kaggle CSV (see synthetic.py) with the same methods as KaggleApiFetcher
+#Each one can be made slow (latency, seconds per request), big (payload size) and can answer
+#"too many requests" (429) part of the time (error_rate, 0 to 1), so retries, the Google rate limiter and
+#downloading the sources at the same time can be measured offline. Each keeps counts in .stats (see bench_load.py)
+#Ex:
+#   with FredStandIn(latency=0.1, error_rate=0.2) as fred:
+#       FRED_mortgage(api_url=fred_urls(fred.base_url)[0], series_url=fred_urls(fred.base_url)[1], use_cache=False)
+
+import json
+import random
+import shutil
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from synthetic import fred_frame, generate_kaggle
+
+
+class StandInStats:
+    # Counts what a stand-in was asked for. Requests can come from several threads at once
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0 #429s sent back
+        self.bytes_sent = 0
+
+    def add(self, throttled=False, bytes_sent=0):
+        with self.lock:
+            self.requests += 1
+            self.throttled += int(throttled)
+            self.bytes_sent += bytes_sent
+
+    def to_dict(self):
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled, "bytes_sent": self.bytes_sent}
+
+
+class StandIn:
+    # What every stand-in shares: wait latency seconds, then maybe say 429 (repeatable with the same seed)
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats = StandInStats()
+
+    def answer(self) -> bool:
+        # Waits like a slow server would. True = this request gets a 429
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+
+
+# -----------------------------------------------------------
+# FRED
+# -----------------------------------------------------------
+class FredStandIn(StandIn):
+    # observations = weeks sent back for each series (the payload size). retry_after = seconds put in the
+    # Retry-After header of a 429 (None = no header, so the session backs off on its own, see http_session.py)
+
+    def __init__(self, observations=2800, latency=0.0, error_rate=0.0, retry_after=None, seed=0, port=0):
+        super().__init__(latency, error_rate, seed)
+        self.observations = observations
+        self.retry_after = retry_after
+        self.seed = seed
+        self.port = port
+        self.server = None
+        self.thread = None
+        self.series = {} #series_id: its observations as JSON ready dicts (made the first time it is asked for)
+        self.series_lock = threading.Lock()
+        self.last_updated = time.strftime("%Y-%m-%d %H:%M:%S-05")
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/fred"
+
+    def observations_for(self, series_id):
+        with self.series_lock:
+            if series_id not in self.series:
+                end = pd.Timestamp(date.today())
+                start = end - pd.Timedelta(weeks=self.observations)
+                seed = self.seed + sum(series_id.encode()) #a different (but repeatable) series for every ID
+                self.series[series_id] = fred_frame(seed, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")).to_dict("records")
+            return self.series[series_id]
+
+    def respond(self, path, query):
+        # Returns (status code, JSON body) like the real FRED API
+        series_id = query.get("series_id", ["MORTGAGE30US"])[0]
+        if path.endswith("/series/observations"):
+            observations = self.observations_for(series_id)
+            start = query.get("observation_start", [None])[0]
+            if start:
+                observations = [obs for obs in observations if obs["date"] >= start]
+            return 200, {"count": len(observations), "observations": observations}
+        if path.endswith("/series"):
+            return 200, {"seriess": [{"id": series_id, "last_updated": self.last_updated}]}
+        return 404, {"error_code": 404, "error_message": f"Not found: {path}"}
+
+    def make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" #keep-alive, like the real server
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                throttled = stand_in.answer()
+                if throttled:
+                    status, body = 429, {"error_code": 429, "error_message": "Too Many Requests."}
+                else:
+                    status, body = stand_in.respond(url.path, parse_qs(url.query))
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if throttled and stand_in.retry_after is not None:
+                    self.send_header("Retry-After", str(stand_in.retry_after))
+                self.end_headers()
+                self.wfile.write(data)
+                stand_in.stats.add(throttled, len(data))
+
+            def log_message(self, *args):
+                pass #no line printed for every request
+
+        return Handler
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# -----------------------------------------------------------
+# Google Trends
+# -----------------------------------------------------------
+class TooManyRequestsError(Exception):
+    # Same name as the pytrends error, so is_throttled in rate_limiter.py treats it the same way
+    def __init__(self, message="The request failed: Google returned a response with code 429"):
+        super().__init__(message)
+
+
+class TrendsStandIn(StandIn):
+    # months = months of search interest sent back (None = every month in the timeframe asked for)
+
+    def __init__(self, months=None, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.months = months
+        self.seed = seed
+
+    def client(self):
+        # Pass as client_factory= to GTrends_Homes_Selling / GTrends_states (or trends_client_factory= to run_load)
+        return FakeTrendReq(self)
+
+
+class FakeTrendReq:
+    # Same methods as pytrends' TrendReq that load.py uses
+
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+        self.kw_list = []
+        self.timeframe = None
+        self.geo = ""
+
+    def request(self, payload_rows=0):
+        if self.stand_in.answer():
+            self.stand_in.stats.add(throttled=True)
+            raise TooManyRequestsError()
+        self.stand_in.stats.add(bytes_sent=payload_rows * 40) #about 40 bytes per month of JSON from Google
+
+    def build_payload(self, kw_list, cat=0, timeframe="today 5-y", geo="", gprop=""):
+        self.request()
+        start, end = timeframe.split() #only "YYYY-MM-DD YYYY-MM-DD" timeframes are used in load.py
+        if pd.Timestamp(start) > pd.Timestamp(end):
+            raise ValueError(f"The request failed: Google returned a response with code 400 ({timeframe})")
+        self.kw_list = list(kw_list)
+        self.timeframe = (start, end)
+        self.geo = geo
+
+    def interest_over_time(self) -> pd.DataFrame:
+        start, end = self.timeframe
+        months = pd.date_range(start, end, freq="MS")
+        if self.stand_in.months is not None:
+            months = pd.date_range(end=end, periods=self.stand_in.months, freq="MS")
+        self.request(len(months))
+        rng = np.random.default_rng(self.stand_in.seed + sum(self.geo.encode()))
+        df = pd.DataFrame({kw: rng.integers(20, 101, len(months)) for kw in self.kw_list},
+                          index=pd.DatetimeIndex(months, name="date"))
+        df["isPartial"] = False
+        return df
+
+
+# -----------------------------------------------------------
+# Kaggle
+# -----------------------------------------------------------
+class KaggleStandIn(StandIn):
+    # rows = Kaggle rows in the "downloaded" CSV (the payload size). The CSV is made once in work_dir and copied
+    # for every download, so making it isn't part of the download time. Pass as fetcher= to kaggle_housing
+
+    def __init__(self, work_dir, rows=100_000, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__(latency, error_rate, seed)
+        self.work_dir = Path(work_dir)
+        self.rows = rows
+        self.seed = seed
+        self.csv_path = self.work_dir / f"kaggle_standin_{rows}_{seed}.csv"
+
+    def prepare(self):
+        if not self.csv_path.exists():
+            self.work_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.csv_path.with_suffix(".tmp")
+            generate_kaggle(tmp_path, self.rows, self.seed)
+            tmp_path.replace(self.csv_path)
+        return self
+
+    def version(self, dataset):
+        if self.answer():
+            self.throttle()
+        self.stats.add()
+        return f"v1 standin-{self.rows}-{self.seed}"
+
+    def download(self, dataset, path):
+        self.prepare()
+        if self.answer():
+            self.throttle()
+        Path(path).mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(self.csv_path, Path(path) / "realtor-data.zip.csv")
+        self.stats.add(bytes_sent=self.csv_path.stat().st_size)
+
+    def throttle(self):
+        self.stats.add(throttled=True)
+        raise RuntimeError("(429) Reason: Too Many Requests")
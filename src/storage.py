@@ -0,0 +1,202 @@
+#This code reads and writes the data tables for every stage (load.py, process.py, analyze.py)
+#Tables can be saved as CSV (default, easy to open in Excel) or Parquet (typed columnar files that keep
+#datetime, float and category columns as-is, so the next stage doesn't have to re-parse text)
+#The format is chosen with DATA_FORMAT in config.py
+
+from pathlib import Path
+import pandas as pd
+from config import DATA_FORMAT
+from profiler import profiled, span
+from dates import to_datetime, format_dates
+
+TABLE_SUFFIXES = {"csv": ".csv", "parquet": ".parquet"}
+
+
+def check_format(data_format=DATA_FORMAT):
+    # Makes sure the format is one we know and that pyarrow is installed for parquet. Falls back to CSV otherwise
+    if data_format not in TABLE_SUFFIXES:
+        print(f"Invalid data format '{data_format}' — must be one of {list(TABLE_SUFFIXES)}. Defaulting to 'csv'.")
+        return "csv"
+
+    if data_format == "parquet":
+        try:
+            import pyarrow #Only needed for parquet so it is imported here instead of at the top
+        except ImportError:
+            print("PARQUET WARNING: pyarrow is not installed (pip install pyarrow). Saving as CSV instead.")
+            return "csv"
+
+    return data_format
+
+
+def table_path(directory, filename, data_format=DATA_FORMAT) -> Path:
+    # Same file name as in config.py but with the extension of the chosen format (ex: merged_clean.parquet)
+    data_format = check_format(data_format)
+    return Path(directory) / Path(filename).with_suffix(TABLE_SUFFIXES[data_format]).name
+
+
+def find_table(directory, filename, data_format=DATA_FORMAT):
+    # Returns the path to an existing table, trying the chosen format first and then the other ones
+    # (ex: the Kaggle download is always a CSV even when parquet is chosen). Returns None if nothing is found
+    preferred = table_path(directory, filename, data_format)
+    if preferred.exists():
+        return preferred
+
+    for suffix in TABLE_SUFFIXES.values():
+        other = Path(directory) / Path(filename).with_suffix(suffix).name
+        if other.exists():
+            return other
+
+    return None
+
+
+def table_exists(directory, filename, data_format=DATA_FORMAT) -> bool:
+    return find_table(directory, filename, data_format) is not None
+
+
+def format_dates_for_csv(df, date_columns):
+    # CSV files keep the date formats this project has always used (ex: MM/DD/YYYY). Parquet keeps real datetimes
+    if not date_columns:
+        return df
+
+    df = df.copy()
+    for column, date_format in date_columns.items():
+        if date_format is not None and column in df.columns:
+            df[column] = format_dates(df[column], date_format) #each distinct date is formatted once
+    return df
+
+
+@profiled("dates")
+def parse_dates(df, date_columns):
+    # Turns text date columns back into datetimes. Columns that are already datetimes (parquet) are left alone
+    if not date_columns:
+        return df
+
+    for column, date_format in date_columns.items():
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = to_datetime(df[column], date_format, errors="raise") #each distinct date is read once
+    return df
+
+
+@profiled("io")
+def write_table(df, directory, filename, data_format=DATA_FORMAT, index=False, date_columns=None) -> Path:
+    # date_columns is a dictionary of {column: format} used only when saving as CSV
+    out_path = table_path(directory, filename, data_format)
+
+    if out_path.suffix == ".parquet":
+        df.to_parquet(out_path, index=index)
+    else:
+        format_dates_for_csv(df, date_columns).to_csv(out_path, index=index)
+
+    return out_path
+
+
+@profiled("io")
+def read_table(directory, filename, data_format=DATA_FORMAT, columns=None, dtype=None, date_columns=None) -> pd.DataFrame:
+    # Reads a table saved by write_table (or a plain CSV download). Only the listed columns are read
+    full_path = find_table(directory, filename, data_format)
+    if full_path is None:
+        raise FileNotFoundError(f"No such table: {table_path(directory, filename, data_format)}")
+
+    if full_path.suffix == ".parquet":
+        df = pd.read_parquet(full_path, columns=columns)
+        if dtype:
+            df = df.astype(dtype)
+    else:
+        df = pd.read_csv(full_path, usecols=columns, dtype=dtype)
+
+    return parse_dates(df, date_columns)
+
+
+def iter_table(directory, filename, chunksize, data_format=DATA_FORMAT, columns=None, dtype=None):
+    # Same as read_table but gives back pieces of chunksize rows at a time so big files never sit in memory at once
+    full_path = find_table(directory, filename, data_format)
+    if full_path is None:
+        raise FileNotFoundError(f"No such table: {table_path(directory, filename, data_format)}")
+
+    if full_path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(full_path)
+        batches = (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns))
+        chunks = (chunk.astype(dtype) if dtype else chunk for chunk in batches)
+    else:
+        chunks = pd.read_csv(full_path, usecols=columns, dtype=dtype, chunksize=chunksize)
+
+    # Each piece is read in its own span (the time spent using a piece between reads isn't counted as reading)
+    chunks = iter(chunks)
+    while True:
+        with span("read chunk", "io", file=full_path.name) as current:
+            chunk = next(chunks, None)
+            current.rows_out = None if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class TableWriter:
+    # Writes a table a piece at a time (used by the chunked Kaggle processing)
+    # CSV pieces are appended to the file, parquet pieces become row groups of one file
+
+    def __init__(self, directory, filename, data_format=DATA_FORMAT, date_columns=None, columns=None):
+        self.path = table_path(directory, filename, data_format)
+        self.date_columns = date_columns
+        self.columns = columns
+        self.parquet_writer = None
+        self.schema = None
+        self.wrote_header = False
+
+    @profiled("io", "write chunk")
+    def write(self, df):
+        if self.path.suffix == ".parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self.parquet_writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self.schema = table.schema
+                self.parquet_writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            self.parquet_writer.write_table(table)
+        else:
+            format_dates_for_csv(df, self.date_columns).to_csv(
+                self.path, mode="a" if self.wrote_header else "w", header=not self.wrote_header, index=False
+            )
+            self.wrote_header = True
+
+    def close(self, empty=None):
+        # empty is an example (empty) DataFrame used to still write the header when no rows were written
+        if self.parquet_writer is None and not self.wrote_header and empty is not None:
+            self.write(empty)
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        return self.path
+
+
+@profiled("io")
+def convert_csv_to_table(csv_path, directory, filename, data_format=DATA_FORMAT, chunksize=250000):
+    # Converts a downloaded CSV (ex: the Kaggle file) to the chosen format without loading all of it at once
+    # Column types come from the first chunk: numbers are kept as float64, everything else as text
+    out_path = table_path(directory, filename, data_format)
+    if out_path.suffix != ".parquet":
+        return Path(csv_path)
+
+    writer = None
+    dtypes = None
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, low_memory=False):
+        if dtypes is None:
+            dtypes = {
+                column: ("float64" if pd.api.types.is_numeric_dtype(chunk[column]) else "string")
+                for column in chunk.columns
+            }
+            writer = TableWriter(directory, filename, data_format)
+        for column, column_type in dtypes.items():
+            if column_type == "float64":
+                chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+            else:
+                chunk[column] = chunk[column].astype("string")
+        writer.write(chunk.astype(dtypes))
+
+    if writer is not None:
+        writer.close()
+        Path(csv_path).unlink() #The parquet copy replaces the CSV
+
+    return out_path
@@ -0,0 +1,163 @@
+#This code runs the analysis for many periods at once ("variants") instead of editing START_DATE/END_DATE in config.py
+#and running everything again for each one. A variant is one window (ex: 2013-2024) + one mask (ex: leave out 2008 and
+#2020) + one season (ex: summer months only), see SWEEP_WINDOWS, SWEEP_MASKS and SWEEP_SEASONS in config.py.
+#The merged data is loaded once and sent once to each worker process (same as plot_all). Each variant then gets:
+#   the correlation of every pair of SWEEP_SERIES
+#   the trend line (slope, intercept and the slope's confidence range) of every SWEEP_REGRESSIONS pair
+#   the SWEEP_PLOTS graphs, saved in results/sweep/<variant name>/
+#and all the numbers end up in one table, results/sweep/sweep_summary.csv (one row per variant)
+#Run from the src/ directory: python main.py sweep
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product, repeat
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import matplotlib
+import analyze #sets the plot backend before pyplot is imported
+import matplotlib.pyplot as plt
+from analyze import trend_fits
+from analysis_cache import cached, get_cache, set_cache_dir
+from regression import t_quantile
+from config import (
+    SWEEP_WINDOWS, SWEEP_MASKS, SWEEP_SEASONS, SWEEP_SERIES, SWEEP_REGRESSIONS, SWEEP_PLOTS, SWEEP_MIN_MONTHS,
+    SWEEP_DIR, SWEEP_SUMMARY_NAME, SWEEP_WORKERS, REGRESSION_CI,
+)
+from profiler import profiled
+
+DESCRIPTION = ["name", "window", "mask", "season"] #First columns of the summary
+
+
+def make_variants(windows=SWEEP_WINDOWS, masks=SWEEP_MASKS, seasons=SWEEP_SEASONS) -> list:
+    # Every window + mask + season, ex: {"name": "2013-2024_no_2008_summer", "start": "2013-01-01", "end": None,
+    # "excluded": [("2007-12-01", "2009-06-30")], "months": [6, 7, 8], ...}
+    variants = []
+    for (window, (start, end)), (mask, excluded), (season, months) in product(windows.items(), masks.items(), seasons.items()):
+        variants.append({"name": f"{window}_{mask}_{season}", "window": window, "mask": mask, "season": season,
+                         "start": start, "end": end, "excluded": list(excluded), "months": months})
+    return variants
+
+
+def select_months(df, variant, date_column="month") -> pd.DataFrame:
+    # The rows of df that are in the variant's window, not in its masked periods and in its season
+    dates = df[date_column]
+    keep = pd.Series(True, index=df.index)
+    if variant["start"] is not None:
+        keep &= dates >= pd.Timestamp(variant["start"])
+    if variant["end"] is not None:
+        keep &= dates <= pd.Timestamp(variant["end"])
+    for first, last in variant["excluded"]:
+        keep &= ~dates.between(pd.Timestamp(first), pd.Timestamp(last))
+    if variant["months"] is not None:
+        keep &= dates.dt.month.isin(variant["months"])
+    return df[keep]
+
+
+def summarize(df, variant, series=SWEEP_SERIES, regressions=SWEEP_REGRESSIONS, ci=REGRESSION_CI,
+              min_months=SWEEP_MIN_MONTHS) -> dict:
+    # One row of the summary: what the variant is, how many months it has, then its correlations and trend lines
+    row = {key: variant[key] for key in DESCRIPTION}
+    row["months"] = len(df)
+    row["first_month"] = df["month"].min().strftime("%Y-%m") if len(df) else None
+    row["last_month"] = df["month"].max().strftime("%Y-%m") if len(df) else None
+    if len(df) < min_months:
+        return row
+
+    # Correlation of every pair (months where either one is missing are skipped for that pair)
+    series = [c for c in series if c in df.columns]
+    corr = cached("correlation", df[series], lambda: df[series].corr())
+    for i, a in enumerate(series):
+        for b in series[i + 1:]:
+            row[f"{a}_vs_{b}"] = corr.loc[a, b]
+
+    # Trend lines (same fits as the scatter plots draw), slope +- t * s / sqrt(Sxx) for its confidence range
+    regressions = [(x, y) for x, y in regressions if x in df.columns and y in df.columns]
+    if regressions:
+        fits = trend_fits(df, regressions)
+        for p, (x, y) in enumerate(regressions):
+            name = f"{y}_on_{x}"
+            row[f"{name}_slope"] = fits["slope"][p]
+            row[f"{name}_intercept"] = fits["intercept"][p]
+            if ci is not None:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    spread = t_quantile(0.5 + ci / 200, fits["n"][p] - 2) * fits["s"][p] / np.sqrt(fits["sxx"][p])
+                row[f"{name}_slope_low"] = fits["slope"][p] - spread
+                row[f"{name}_slope_high"] = fits["slope"][p] + spread
+    return row
+
+
+def draw_variant(df, variant, results_dir=SWEEP_DIR, plots=SWEEP_PLOTS) -> list:
+    # The plots (names of analyze.py functions) of one variant in results_dir/<variant name>/. Returns the errors
+    out_dir = Path(results_dir) / variant["name"]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    errors = []
+    for plot_name in plots:
+        try:
+            getattr(analyze, plot_name)(df, results_dir=out_dir)
+        except Exception as e:
+            errors.append((plot_name, str(e)))
+        finally:
+            plt.close("all")
+    return errors
+
+
+@profiled("analyze")
+def evaluate_variant(df, variant, results_dir=SWEEP_DIR, plots=SWEEP_PLOTS, min_months=SWEEP_MIN_MONTHS):
+    # Summary row and graphs of one variant. Returns (row, errors) where errors = [(what, reason), ...]
+    try:
+        selected = select_months(df, variant)
+        row = summarize(selected, variant, min_months=min_months)
+        errors = draw_variant(selected, variant, results_dir, plots) if len(selected) >= min_months else []
+        return row, errors
+    except Exception as e:
+        return {key: variant[key] for key in DESCRIPTION}, [("summary", str(e))]
+
+
+_worker_df = None #The merged data inside each sweep process (sent once when the process starts, not once per variant)
+
+
+def _init_sweep_worker(df, cache_dir):
+    global _worker_df
+    matplotlib.use("Agg", force=True)
+    set_cache_dir(cache_dir) #same analysis cache folder as the main process
+    _worker_df = df
+
+
+def _evaluate_in_worker(variant, results_dir, plots, min_months):
+    return evaluate_variant(_worker_df, variant, results_dir, plots, min_months)
+
+
+@profiled("analyze")
+def run_sweep(df, variants=None, results_dir=SWEEP_DIR, parallel=True, max_workers=SWEEP_WORKERS, plots=SWEEP_PLOTS,
+              min_months=SWEEP_MIN_MONTHS, summary_name=SWEEP_SUMMARY_NAME) -> pd.DataFrame:
+    # Evaluates every variant (make_variants() by default) and saves the summary table. In parallel mode the variants
+    # are spread over one process per CPU core
+    variants = make_variants() if variants is None else variants
+    results_dir = Path(results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    for old in results_dir.glob("*/*.png"): #graphs from the last sweep (its variants may have been different)
+        old.unlink()
+
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(variants)))
+    if not parallel or workers == 1: #With 1 worker, starting a process only adds time
+        results = [evaluate_variant(df, variant, results_dir, plots, min_months) for variant in variants]
+    else:
+        # "spawn" starts clean processes (same on Windows, Mac and Linux) instead of copying this one
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_sweep_worker, initargs=(df, get_cache().cache_dir)) as pool:
+            results = list(pool.map(_evaluate_in_worker, variants, repeat(results_dir), repeat(plots), repeat(min_months)))
+
+    rows = []
+    for row, errors in results:
+        for what, reason in errors:
+            print(f"SWEEP ERROR ({row['name']}, {what}): Reason:", reason)
+        if row.get("months", min_months) < min_months:
+            print(f"{row['name']}: only {row['months']} months, left out (SWEEP_MIN_MONTHS = {min_months})")
+        rows.append(row)
+
+    summary = pd.DataFrame(rows)
+    summary.to_csv(results_dir / summary_name, index=False, float_format="%.4f")
+    return summary
@@ -0,0 +1,132 @@
+#This code makes fake (synthetic) input files with the same columns and formats as the real downloads:
+#   kaggle_housing.csv   same 12 columns as the Kaggle dataset (some missing dates/prices, a few huge prices)
+#   mortgage_rates.csv   weekly FRED observations (realtime_start, realtime_end, date, value with "." for missing)
+#   google_trends_*.csv  monthly pytrends output (date, search term, isPartial)
+#The numbers are random but repeatable (same seed = same files), so benchmarks can be compared run to run
+#with no internet. The Kaggle file is written a chunk at a time so even 50M rows never has to fit in memory
+#Run from the src/ directory:
+#   python synthetic.py --rows 1M --out ../data/bench/1M
+
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from config import KAGGLE_NAME, FRED_NAME, GOOGLE_SEARCH_TERM, GOOGLE_EXTRA_KEYWORDS, STATE_CODES
+
+KAGGLE_COLUMNS = ["brokered_by", "status", "price", "bed", "bath", "acre_lot", "street", "city", "state",
+                  "zip_code", "house_size", "prev_sold_date"]
+SYNTHETIC_STATES = list(STATE_CODES) + ["Puerto Rico", "Virgin Islands"] #the real data also has territories
+
+
+def parse_rows(text) -> int:
+    # "100k" -> 100000, "1M" -> 1000000, "2.5M" -> 2500000, "5000" -> 5000
+    text = str(text).strip().upper()
+    multiplier = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}.get(text[-1:], 1)
+    number = text[:-1] if multiplier > 1 else text
+    return int(float(number) * multiplier)
+
+
+def kaggle_chunk(rng, rows, first_day, last_day) -> pd.DataFrame:
+    # One piece of the fake Kaggle file
+    days = rng.integers(first_day, last_day, rows)
+    dates = pd.to_datetime(days, unit="D").strftime("%Y-%m-%d").to_numpy(dtype=object)
+    dates[rng.random(rows) < 0.3] = np.nan #a lot of listings were never sold before
+
+    prices = rng.lognormal(12.6, 0.7, rows).round(0)
+    prices[rng.random(rows) < 0.001] *= 50 #a few multi-million dollar outliers
+    prices[rng.random(rows) < 0.01] = np.nan
+
+    return pd.DataFrame({
+        "brokered_by": rng.integers(1, 110_000, rows).astype("float64"),
+        "status": np.where(rng.random(rows) < 0.6, "for_sale", "sold"),
+        "price": prices,
+        "bed": rng.integers(1, 7, rows).astype("float64"),
+        "bath": rng.integers(1, 5, rows).astype("float64"),
+        "acre_lot": rng.exponential(0.5, rows).round(2),
+        "street": rng.integers(1, 2_000_000, rows).astype("float64"),
+        "city": "Springfield",
+        "state": np.array(SYNTHETIC_STATES)[rng.integers(0, len(SYNTHETIC_STATES), rows)],
+        "zip_code": rng.integers(1000, 99999, rows).astype("float64"),
+        "house_size": rng.normal(1900, 600, rows).clip(400).round(0),
+        "prev_sold_date": dates,
+    }, columns=KAGGLE_COLUMNS)
+
+
+def generate_kaggle(path, rows, seed=0, chunksize=1_000_000, start="1990-01-01", end="2025-06-30"):
+    rng = np.random.default_rng(seed)
+    first_day = np.datetime64(start, "D").astype("int64")
+    last_day = np.datetime64(end, "D").astype("int64")
+    for written in range(0, max(rows, 1), chunksize): #rows = 0 still writes the header
+        n = min(chunksize, rows - written)
+        chunk = kaggle_chunk(rng, n, first_day, last_day)
+        chunk.to_csv(path, mode="a" if written else "w", header=not written, index=False)
+    return Path(path)
+
+
+def fred_frame(seed=0, start="1971-04-08", end="2025-06-26") -> pd.DataFrame:
+    # Weekly (Thursday) 30 year mortgage rates that wander around 7% (kept between 2.5% and 18%)
+    # Same columns and text as the FRED API's observations (also served by FredStandIn in standins.py)
+    rng = np.random.default_rng(seed + 1)
+    weeks = pd.date_range(start, end, freq="W-THU")
+    # Each week moves a little toward 7% plus some noise (a few thousand weeks, so a plain loop is fine)
+    noise = rng.normal(0, 0.12, len(weeks))
+    rates = np.empty(len(weeks))
+    rate = 7.0
+    for i in range(len(weeks)):
+        rate = 7 + 0.995 * (rate - 7) + noise[i]
+        rates[i] = rate
+    rates = np.clip(rates, 2.5, 18).round(2)
+    values = rates.astype(str).astype(object)
+    values[rng.random(len(weeks)) < 0.002] = "." #FRED uses "." for a missing value
+    return pd.DataFrame({"realtime_start": end, "realtime_end": end, "date": weeks.strftime("%Y-%m-%d"),
+                         "value": values})
+
+
+def generate_fred(path, seed=0, start="1971-04-08", end="2025-06-26"):
+    fred_frame(seed, start, end).to_csv(path, index=False)
+    return Path(path)
+
+
+def generate_trends(path, kw=GOOGLE_SEARCH_TERM, seed=0, start="2004-01-01", end="2024-12-01", extra_keywords=GOOGLE_EXTRA_KEYWORDS):
+    # Monthly search interest from 0 to 100 with a yearly (seasonal) pattern, like interest_over_time() gives.
+    # kw first, then one column per extra keyword (each with its own level, trend and season), all on one scale
+    rng = np.random.default_rng(seed + 2)
+    months = pd.date_range(start, end, freq="MS")
+    seasonal = 10 * np.sin(2 * np.pi * (months.month - 3) / 12)
+    trend = np.linspace(40, 70, len(months))
+    interest = np.clip(trend + seasonal + rng.normal(0, 5, len(months)), 0, None).to_numpy()[:, None]
+    extras = [extra for extra in dict.fromkeys(extra_keywords) if extra != kw]
+    if extras:
+        # (months, keywords) all at once: start level, end level and season strength/shift of each keyword
+        start_level, end_level = rng.uniform(10, 80, (2, len(extras)))
+        strength, shift = rng.uniform(0, 15, len(extras)), rng.integers(0, 12, len(extras))
+        extra_values = (np.linspace(start_level, end_level, len(months))
+                        + strength * np.sin(2 * np.pi * (months.month.to_numpy()[:, None] - 3 - shift) / 12)
+                        + rng.normal(0, 5, (len(months), len(extras))))
+        interest = np.column_stack([interest, np.clip(extra_values, 0, None)])
+    interest = (100 * interest / interest.max()).round(0).astype("int64")
+    df = pd.DataFrame(interest, columns=[kw] + extras)
+    df.insert(0, "date", months)
+    df["isPartial"] = False
+    df.to_csv(path, index=False)
+    return Path(path)
+
+
+def generate_dataset(out_dir, rows, seed=0, kw=GOOGLE_SEARCH_TERM):
+    # All 3 input files with the usual file names, ready for process.py
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    generate_kaggle(out_dir / KAGGLE_NAME, rows, seed)
+    generate_fred(out_dir / FRED_NAME, seed)
+    generate_trends(out_dir / ("google_trends_" + kw + ".csv"), kw, seed) #same name as GOOGLE_NAME in config.py
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make synthetic Kaggle, FRED and Google Trends input files.")
+    parser.add_argument("--rows", default="100k", help="Kaggle rows, ex: 100k, 1M, 50M")
+    parser.add_argument("--out", type=Path, required=True, help="Folder to write the files to")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_dataset(args.out, parse_rows(args.rows), args.seed)
+    print(f"Wrote {parse_rows(args.rows):,} Kaggle rows and the FRED/Google files to {args.out}")
@@ -2,13 +2,22 @@
 #Feel free to change any of the variables that have "***************" at the end of the line
 
 import os
+import json
+import shutil
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 from pathlib import Path
+import numpy as np
+import pandas as pd
 
 from load import (
     clear_data_folder,
     kaggle_housing,
     FRED_mortgage,
-    GTrends_Homes_Selling
+    GTrends_Homes_Selling,
+    align_keyword_batches,
 )
 
 from process import (
@@ -17,7 +26,25 @@ from process import (
     process_mortgage_data,
     process_google_data,
     process_merge_data,
+    process_state_data,
 )
+from synthetic import generate_kaggle, generate_dataset
+from rate_limiter import AdaptiveRateLimiter, is_throttled
+from storage import write_table, read_table, iter_table, TableWriter
+from standins import TooManyRequestsError, TrendsStandIn, FakeTrendReq
+from pipeline import build_steps, run_steps
+from features import compute_features
+from sketch import QuantileSketch
+from leadlag import cross_correlation
+from regression import fit_lines, line_band
+from analysis_cache import AnalysisCache, set_cache_dir
+from dates import DateStats, to_datetime, format_dates
+from realtor_cache import RealtorCacheWriter, open_realtor_cache, cache_exists
+from config import PRICE_QUANTILES, HEATMAP_NAME, KEYWORD_HEATMAP_NAME, TRENDS_RATE_LIMIT
+import profiler
+from sweep import make_variants, run_sweep
+from seasonal import decompose_frame, add_deseasonalized
+from analyze import keyword_correlations, plot_keyword_heatmap
 
 from analyze import (
     clear_results_folder,
@@ -50,6 +77,13 @@ TEST_LOADED_DIR.mkdir(exist_ok=True)
 TEST_PROCESSED_DIR.mkdir(exist_ok=True)
 TEST_RESULTS_DIR.mkdir(exist_ok=True)
 
+# The graphs' analysis cache (see analysis_cache.py) saves its results here instead of data/cache/analysis, so the
+# tests never leave files in data/ or re-use results from an earlier run of the project
+TEST_ANALYSIS_CACHE_DIR = TEST_DATA_DIR / "analysis_cache"
+shutil.rmtree(TEST_ANALYSIS_CACHE_DIR, ignore_errors=True)
+TEST_ANALYSIS_CACHE_DIR.mkdir()
+set_cache_dir(TEST_ANALYSIS_CACHE_DIR)
+
 #Test CSV File Names
 KAGGLE_NAME= "KAGGLE_TEST.csv"#Feel free to change this ***************
 FRED_NAME="FRED_TEST.csv" #Feel free to change this ***************
@@ -102,6 +136,62 @@ def test_fred():
     FRED_mortgage(api_key=TEST_FRED_API_KEY, series_id=TEST_FRED_SERIES, data_dir=TEST_LOADED_DIR, FRED_NAME=FRED_NAME)
     print("===============================================\n")
 
+def test_fred_incremental():
+    # Runs FRED_mortgage against a small local stand-in for the FRED API (no internet or API key needed)
+    # 1st pull gets 4 weeks, then 2 new weeks are "published" and the incremental pull should only ask for those 2
+    print("===============TEST: FRED Incremental Pull (local stub server)=================")
+    weeks = pd.date_range("2024-01-04", periods=6, freq="W-THU").strftime("%Y-%m-%d")
+    all_observations = [
+        {"realtime_start": "2024-02-08", "realtime_end": "2024-02-08", "date": d, "value": f"{6.5 + i / 10:.2f}"}
+        for i, d in enumerate(weeks)
+    ]
+    stub = {"published": 4, "requests": [], "fail_next": True}
+
+    class StubFRED(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            stub["requests"].append(query)
+            if stub["fail_next"]: # one temporary server error to check that the session retries
+                stub["fail_next"] = False
+                self.send_response(503)
+                self.end_headers()
+                return
+            start = query.get("observation_start", ["0000-00-00"])[0]
+            observations = [o for o in all_observations[:stub["published"]] if o["date"] >= start]
+            body = json.dumps({"observations": observations}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): # keep the test output quiet
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFRED)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub_url = f"http://127.0.0.1:{server.server_port}/fred/series/observations"
+    incremental_name = "FRED_INCREMENTAL_TEST.csv"
+    (TEST_LOADED_DIR / incremental_name).unlink(missing_ok=True)
+
+    try:
+        FRED_mortgage(api_key="STUB", series_id="MORTGAGE30US", data_dir=TEST_LOADED_DIR, FRED_NAME=incremental_name,
+                      data_format="csv", use_cache=False, api_url=stub_url)
+        stub["published"] = 6
+        FRED_mortgage(api_key="STUB", series_id="MORTGAGE30US", data_dir=TEST_LOADED_DIR, FRED_NAME=incremental_name,
+                      data_format="csv", use_cache=False, incremental=True, api_url=stub_url)
+
+        df = pd.read_csv(TEST_LOADED_DIR / incremental_name)
+        expected_start = (pd.Timestamp(weeks[3]) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        last_request = stub["requests"][-1]
+        assert list(df["date"]) == list(weeks), list(df["date"])
+        assert last_request.get("observation_start") == [expected_start], last_request
+        print("PASS: incremental pull only requested the new weeks and appended them.")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("===============================================\n")
+
 def test_google():
     print("===============TEST: Google Trends Pull========")
     GTrends_Homes_Selling(time_sleep=TEST_SLEEP,kw=TEST_GOOGLE_SEARCH,data_dir=TEST_LOADED_DIR, GOOGLE_NAME=GOOGLE_NAME, START_DATE = START_DATE, END_DATE = END_DATE)
@@ -153,6 +243,446 @@ def test_merge_data():
     print("===============================================\n")
 
 
+def test_features():
+    # Checks the vectorized feature columns against plain pandas, one column at a time
+    print("===============TEST: Derived Feature Columns========")
+    df = pd.DataFrame({"avg_price": [100, 110, 110, 99, 120, 0, 130], "mortgage_rate": [6.0, 6.5, 6.1, None, 7.0, 7.2, 7.1]})
+    features = compute_features(df, {"avg_price": "price", "mortgage_rate": "mortgage"}, [1, 3])
+    for column, name in [("avg_price", "price"), ("mortgage_rate", "mortgage")]:
+        for h, suffix in [(1, ""), (3, "_3m")]:
+            expected = (df[column].pct_change(h) * 100).round(1)
+            pd.testing.assert_series_equal(features[f"{name}_pct_change{suffix}"], expected, check_names=False)
+            expected_direction = expected.apply(lambda x: 1 if x > 0 else (0 if x == 0 else -1))
+            assert (features[f"{name}_direction{suffix}"] == expected_direction).all()
+            pd.testing.assert_series_equal(features[f"{name}_lag_{h}m"], df[column].shift(h).astype(float), check_names=False)
+            pd.testing.assert_series_equal(features[f"{name}_lead_{h}m"], df[column].shift(-h).astype(float), check_names=False)
+    print("Feature test passed: % change, direction, lag and lead match pandas.")
+    print("===============================================\n")
+
+def test_quantile_sketch():
+    # Small groups must match pandas exactly. Big groups (split in pieces and merged) must be within about 1% in rank
+    print("===============TEST: Median/Percentile Sketch========")
+    prices = pd.Series(np.random.default_rng(0).lognormal(12.5, 0.8, 500_000))
+
+    small = QuantileSketch(exact_limit=20000).update(prices[:3000]).merge(QuantileSketch().update(prices[3000:5000]))
+    assert small.exact and small.median() == prices[:5000].median()
+
+    big = QuantileSketch(k=200, exact_limit=20000)
+    for part in np.array_split(prices.to_numpy(), 20):
+        big.merge(QuantileSketch(k=200, exact_limit=20000).update(part))
+    sorted_prices = np.sort(prices.to_numpy())
+    for q in [0.1, 0.5, 0.9]:
+        rank = np.searchsorted(sorted_prices, big.quantile(q)) / len(prices)
+        assert abs(rank - q) < 0.01, f"{q} came out at rank {rank:.4f}"
+    print(f"Sketch test passed: exact for small groups, median of 500,000 prices within 1% rank (kept {sum(len(l) for l in big.levels)} values).")
+    print("===============================================\n")
+
+
+def test_lead_lag():
+    # The FFT lead/lag correlations must match pandas .corr() with .shift() at every lag, with missing months
+    print("===============TEST: Lead/Lag Correlation========")
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=240).cumsum()
+    b = np.r_[np.zeros(4), a[:-4]] + rng.normal(size=240) #b follows a 4 months later
+    a[rng.random(240) < 0.1] = np.nan
+    b[:30] = np.nan
+
+    correlation, months = cross_correlation(a, b, max_lag=36, min_periods=24)
+    expected = [pd.Series(a).corr(pd.Series(b).shift(-lag)) for lag in range(-36, 37)]
+    assert np.allclose(correlation[0], expected, atol=1e-9, equal_nan=True)
+    assert np.nanargmax(correlation[0]) - 36 == 4
+    print("Lead/lag test passed: matches pandas at all 73 lags and finds the 4 month lead.")
+    print("===============================================\n")
+
+def test_dates():
+    # Reading each distinct date once must give the same dates as pd.to_datetime, read odd formats with the fallback
+    # and count what couldn't be read
+    print("===============TEST: Date Parsing===============")
+    values = pd.Series(["2019-05-01", None, "2020-02-30", "12/31/2021", "2019-05-01", "not a date"] * 1000)
+    stats = DateStats("prev_sold_date")
+    dates = to_datetime(values, "%Y-%m-%d", stats=stats)
+    expected = pd.to_datetime(values, format="mixed", errors="coerce")
+    assert dates.equals(expected), dates.head(6)
+    assert (stats.rows, stats.distinct, stats.missing, stats.fallback, stats.coerced) == (6000, 4, 1000, 1000, 2000)
+    assert format_dates(dates, "%m/%d/%Y").equals(dates.dt.strftime("%m/%d/%Y"))
+    print("Date parsing test passed: same dates as pandas, 1000 read by the fallback, 2000 unreadable counted.")
+    print("===============================================\n")
+
+def test_month_index():
+    # Rows written in random date order must come back sorted (same-day rows in the order written), and any date
+    # window's monthly totals from the month index must match working them out from the rows
+    print("===============TEST: Realtor Store Month Index========")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "date": pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3000, 50_000), unit="D"),
+        "price": rng.lognormal(12.5, 0.8, 50_000).round(),
+        "state": rng.choice(["Texas", "Ohio", "Maine"], 50_000),
+    })
+    writer = RealtorCacheWriter(TEST_PROCESSED_DIR, "month_index_test")
+    for part in np.array_split(np.arange(len(df)), 7):
+        writer.write(df.iloc[part])
+    writer.close()
+    cache = open_realtor_cache(TEST_PROCESSED_DIR, "month_index_test")
+    expected = df.sort_values(by="date", kind="stable").reset_index(drop=True)
+    assert cache.to_frame()[["date", "price"]].astype({"date": "datetime64[ns]"}).equals(
+        expected[["date", "price"]].astype({"date": "datetime64[ns]"}))
+
+    for start, end in [("2016-03-15", "2019-11-02"), ("2015-01-01", "2030-01-01"), ("2020-06-01", "2020-06-30")]:
+        rows = df[(df["date"] >= start) & (df["date"] <= end)]
+        months = rows.groupby(rows["date"].dt.to_period("M"))["price"]
+        totals = cache.monthly_totals(start, end)
+        assert len(cache.to_frame(cache.window(start, end))) == len(rows)
+        assert np.allclose(totals["price_sum"], months.sum()) and (totals["price_count"] == months.count()).all()
+        for name, q in PRICE_QUANTILES.items():
+            assert np.allclose(totals[name], months.quantile(q)), name
+    shutil.rmtree(TEST_PROCESSED_DIR / "month_index_test", ignore_errors=True)
+
+    # A store made from a Kaggle file that was changed or removed since is deleted by process_realtor_data, so
+    # the merge (which trusts the store whenever it is there) can't use old prices
+    stale_dir = TEST_DATA_DIR / "stale_store"
+    stale_dir.mkdir(exist_ok=True)
+    generate_kaggle(stale_dir / "STALE_KAGGLE.csv", 2000, seed=1)
+    chunked = process_realtor_data(filename="STALE_KAGGLE.csv", data_dir=stale_dir, processed_dir=stale_dir,
+                                   data_format="csv", realtor_cache_name="stale_test", chunksize=500)
+    whole = process_realtor_data(filename="STALE_KAGGLE.csv", data_dir=stale_dir, processed_dir=stale_dir,
+                                 data_format="csv", realtor_cache_name="stale_test", chunksize=None)
+    assert list(chunked.columns) == ["date", "price", "state"] and chunked.equals(whole) #same rows either way
+    generate_kaggle(stale_dir / "STALE_KAGGLE.csv", 3000, seed=2) #a new download
+    process_realtor_data(filename="STALE_KAGGLE.csv", data_dir=stale_dir, processed_dir=stale_dir,
+                         data_format="csv", realtor_cache_name="stale_test", chunksize=500)
+    store = open_realtor_cache(stale_dir, "stale_test")
+    assert store.manifest["source"]["size"] == (stale_dir / "STALE_KAGGLE.csv").stat().st_size #re-made from it
+    del store
+    (stale_dir / "STALE_KAGGLE.csv").unlink() #Kaggle download failed
+    try:
+        process_realtor_data(filename="STALE_KAGGLE.csv", data_dir=stale_dir, processed_dir=stale_dir,
+                             data_format="csv", realtor_cache_name="stale_test")
+        raise AssertionError("processing worked without the Kaggle file")
+    except FileNotFoundError:
+        pass
+    assert not cache_exists(stale_dir, "stale_test")
+
+    clear_processed_folder(stale_dir) #same as --process: realtor_clean/realtor_monthly are removed too
+    months = pd.date_range("2010-01-01", "2012-12-01", freq="MS")
+    pd.DataFrame({"date": months, "homes for sale": 50}).to_csv(stale_dir / "STALE_GOOGLE.csv", index=False)
+    pd.DataFrame({"month": months, "value": 4.0}).to_csv(stale_dir / "STALE_FRED.csv", index=False)
+    try:
+        process_merge_data(processed_dir=stale_dir, google_name_clean="STALE_GOOGLE.csv", fred_name_clean="STALE_FRED.csv",
+                           merged_dir="STALE_MERGED.csv", google_search_term="homes for sale", data_format="csv",
+                           realtor_cache_name="stale_test")
+        raise AssertionError("the merge used a stale realtor store")
+    except FileNotFoundError:
+        pass
+    shutil.rmtree(stale_dir, ignore_errors=True)
+    print("Month index test passed: rows sorted by date, monthly totals match the rows for 3 date windows, stale store not used.")
+    print("===============================================\n")
+
+def test_bad_prices():
+    # A price that isn't a number (ex: "N/A") must only drop its own row, in both the chunked and whole file modes
+    print("===============TEST: Bad Kaggle Prices========")
+    bad_dir = TEST_DATA_DIR / "bad_prices"
+    bad_dir.mkdir(exist_ok=True)
+    df = pd.read_csv(generate_kaggle(bad_dir / "BAD_KAGGLE.csv", 2000, seed=3), dtype={"price": "str"})
+    df.loc[[5, 700, 1500], "price"] = ["N/A", "call agent", "$"]
+    df.to_csv(bad_dir / "BAD_KAGGLE.csv", index=False)
+    results = [process_realtor_data(filename="BAD_KAGGLE.csv", data_dir=bad_dir, processed_dir=bad_dir, data_format="csv",
+                                    realtor_cache_name=f"bad_prices_{chunksize}", START_DATE=None, END_DATE=None,
+                                    chunksize=chunksize) for chunksize in (300, None)]
+    expected = pd.to_numeric(df["price"], errors="coerce").notna() & pd.to_datetime(df["prev_sold_date"], errors="coerce").notna()
+    assert results[0].equals(results[1]) and len(results[0]) == expected.sum()
+    shutil.rmtree(bad_dir, ignore_errors=True)
+    print("Bad price test passed: 3 text prices dropped, the rest cleaned the same in chunks or all at once.")
+    print("===============================================\n")
+
+def test_state_data():
+    # Each state's monthly prices must match a plain groupby, with and without the realtor store, with the states
+    # merged in worker processes, and a state with no Google data must get an empty search_interest
+    print("===============TEST: State Level Merge========")
+    state_dir = TEST_DATA_DIR / "state_test"
+    state_dir.mkdir(exist_ok=True)
+    generate_kaggle(state_dir / "STATES_KAGGLE.csv", 20_000, seed=3)
+    process_realtor_data(filename="STATES_KAGGLE.csv", data_dir=state_dir, processed_dir=state_dir,
+                         kaggle_name_clean="STATES_CLEAN.csv", kaggle_name_monthly="STATES_MONTHLY.csv",
+                         START_DATE="2010-01-01", END_DATE="2020-12-31", data_format="csv", realtor_cache_name="state_test")
+    months = pd.date_range("2010-01-01", "2020-12-01", freq="MS")
+    pd.DataFrame({"month": months, "value": np.linspace(3, 7, len(months))}).to_csv(state_dir / "STATES_FRED.csv", index=False)
+    pd.DataFrame({"state_code": "TX", "date": months, "homes for sale": 50.0}).to_csv(state_dir / "STATES_GOOGLE.csv", index=False)
+
+    states = {"Texas": "TX", "Ohio": "OH"}
+    settings = dict(processed_dir=state_dir, kaggle_name_clean="STATES_CLEAN.csv", fred_name_clean="STATES_FRED.csv",
+                    google_state_name_clean="STATES_GOOGLE.csv", google_search_term="homes for sale", states=states,
+                    data_format="csv", START_DATE="2010-01-01", END_DATE="2020-12-31")
+    with_store = process_state_data(state_merged_name="STATES_MERGED_STORE.csv", realtor_cache_name="state_test",
+                                    max_workers=2, **settings)
+    without_store = process_state_data(state_merged_name="STATES_MERGED_CLEAN.csv", realtor_cache_name="missing_store",
+                                       max_workers=1, **settings) #no store: reads STATES_CLEAN.csv
+
+    rows = pd.read_csv(state_dir / "STATES_CLEAN.csv")
+    rows["month"] = pd.to_datetime(rows["date"], format="%m/%d/%Y").dt.to_period("M").dt.to_timestamp()
+    rows = rows[rows["state"].isin(states)]
+    expected = rows.groupby(["state", "month"])["price"].agg(["mean", "median", "count"])
+    for df_states in (with_store, without_store):
+        df_states = df_states.set_index(["state", "month"]).sort_index()
+        assert set(df_states["state_code"]) == {"TX", "OH"} and len(df_states) == len(expected)
+        assert np.allclose(df_states["price_median"], expected["median"])
+        assert np.allclose(df_states["avg_price"], expected["mean"])
+        assert (df_states["sale_count"] == expected["count"]).all()
+        assert (df_states.loc["Texas", "search_interest"] == 50).all() and df_states.loc["Ohio", "search_interest"].isna().all()
+    shutil.rmtree(state_dir, ignore_errors=True)
+    print("State merge test passed: 2 states match a groupby median/mean/count with and without the realtor store.")
+    print("===============================================\n")
+
+def test_make():
+    # A second make with nothing changed must skip every step. Changing END_DATE must re-run the Kaggle step, and
+    # realtor_clean must only hold START_DATE to END_DATE (same as --process)
+    print("===============TEST: Make (Skip Up To Date Steps)========")
+    make_dir = TEST_DATA_DIR / "make_test"
+    shutil.rmtree(make_dir, ignore_errors=True) #no pipeline_state.json from an earlier run
+    generate_dataset(make_dir, 3000, seed=4)
+    def steps(end):
+        folders = dict(data_dir=make_dir, processed_dir=make_dir / "processed", results_dir=make_dir / "results")
+        for folder in folders.values():
+            folder.mkdir(exist_ok=True)
+        all_steps = build_steps(**folders, START_DATE="2005-01-01", END_DATE=end, data_format="csv", state_level=False,
+                                fred_bulk_series=[]) #no FRED bulk file in the synthetic data
+        return [step for step in all_steps if not step.name.startswith("plot:")] #graphs are slow and tested elsewhere
+    state_path = make_dir / "pipeline_state.json"
+
+    first = run_steps(steps("2020-12-31"), state_path)
+    assert set(first.values()) == {"ran"}, first
+    second = run_steps(steps("2020-12-31"), state_path)
+    assert set(second.values()) == {"up to date"}, second
+
+    third = run_steps(steps("2015-12-31"), state_path)
+    assert third["clean_realtor"] == "ran" and third["merge"] == "ran", third
+    dates = pd.to_datetime(pd.read_csv(make_dir / "processed" / "realtor_clean.csv")["date"], format="%m/%d/%Y")
+    assert dates.min() >= pd.Timestamp("2005-01-01") and dates.max() <= pd.Timestamp("2015-12-31")
+    shutil.rmtree(make_dir, ignore_errors=True)
+    print("Make test passed: second run skipped every step, a new END_DATE re-wrote realtor_clean for the new dates.")
+    print("===============================================\n")
+
+def test_rate_limiter():
+    # The rate must halve on every 429 (never below min_rate), go up a little after each request that works, recover
+    # over time, and only real 429s may count as throttling. The state file is only re-written when the rate changes
+    print("===============TEST: Google Rate Limiter========")
+    limiter = AdaptiveRateLimiter(state_path=None, max_rate=1.0, min_rate=0.1, increase=0.05, decrease=0.5, recovery=0)
+    limiter.on_throttle()
+    assert np.isclose(limiter.rate, 0.5) and limiter.tokens <= 0 and limiter.throttle_count == 1
+    limiter.on_throttle()
+    assert np.isclose(limiter.rate, 0.25)
+    for _ in range(3):
+        limiter.on_throttle()
+    assert np.isclose(limiter.rate, 0.1) #0.03125 would be below min_rate
+    limiter.on_success()
+    assert np.isclose(limiter.rate, 0.15)
+    for _ in range(100):
+        limiter.on_success()
+    assert np.isclose(limiter.rate, 1.0) #never above max_rate
+
+    limiter.recovery = 0.01
+    limiter.on_throttle() #0.5
+    limiter.refill(limiter.updated + 20) #20 seconds with no 429: +0.2
+    assert np.isclose(limiter.rate, 0.7)
+
+    # Built directly, the limiter has the same floor as config.py (not a slower one of its own)
+    assert AdaptiveRateLimiter(state_path=None).min_rate == TRENDS_RATE_LIMIT["min_rate"]
+    state_path = TEST_DATA_DIR / "rate_limiter_state.json"
+    state_path.unlink(missing_ok=True)
+    limiter = AdaptiveRateLimiter(state_path=state_path, burst=5)
+    limiter.acquire()
+    limiter.on_success() #already at max_rate
+    assert not state_path.exists()
+    limiter.on_throttle()
+    assert np.isclose(AdaptiveRateLimiter(state_path=state_path).rate, limiter.rate, atol=0.01)
+    state_path.unlink()
+
+    class HTTPError(Exception):
+        def __init__(self, status):
+            super().__init__(f"status {status}")
+            self.response = type("Response", (), {"status_code": status})()
+    assert is_throttled(TooManyRequestsError()) and is_throttled(HTTPError(429))
+    assert not is_throttled(HTTPError(500))
+    assert not is_throttled(ValueError("row 1429 could not be read")) #"429" in the text alone isn't a 429
+    print("Rate limiter test passed: halves on 429s down to min_rate, recovers on success and over time, saved only on a change.")
+    print("===============================================\n")
+
+def test_storage():
+    # A table written whole (write_table) or in pieces (TableWriter) must read back the same in both formats, with
+    # dates saved as MM/DD/YYYY in CSV, and an empty TableWriter must still leave a readable file with the columns
+    print("===============TEST: Table Storage (CSV/Parquet)========")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"date": pd.Timestamp("2010-01-01") + pd.to_timedelta(rng.integers(0, 5000, 1000), unit="D"),
+                       "price": rng.lognormal(12, 1, 1000).round(), "state": rng.choice(["Ohio", "Utah"], 1000)})
+    dates = {"date": "%m/%d/%Y"}
+    def same(a, b):
+        return (a["date"].astype("datetime64[ns]").equals(b["date"].astype("datetime64[ns]"))
+                and np.allclose(a["price"], b["price"]) and list(a["state"]) == list(b["state"]))
+
+    for data_format in ["csv", "parquet"]:
+        path = write_table(df, TEST_PROCESSED_DIR, "STORAGE_WHOLE.csv", data_format, date_columns=dates)
+        assert path.suffix == "." + data_format
+        assert same(read_table(TEST_PROCESSED_DIR, "STORAGE_WHOLE.csv", data_format, date_columns=dates), df)
+
+        writer = TableWriter(TEST_PROCESSED_DIR, "STORAGE_PIECES.csv", data_format, date_columns=dates)
+        for part in np.array_split(np.arange(len(df)), 4):
+            writer.write(df.iloc[part])
+        writer.close()
+        assert same(read_table(TEST_PROCESSED_DIR, "STORAGE_PIECES.csv", data_format, date_columns=dates), df)
+        chunks = list(iter_table(TEST_PROCESSED_DIR, "STORAGE_PIECES.csv", 300, data_format, columns=["price"]))
+        assert [len(c) for c in chunks] == [300, 300, 300, 100] and np.allclose(pd.concat(chunks)["price"], df["price"])
+
+        TableWriter(TEST_PROCESSED_DIR, "STORAGE_EMPTY.csv", data_format, date_columns=dates).close(empty=df.iloc[:0])
+        empty = read_table(TEST_PROCESSED_DIR, "STORAGE_EMPTY.csv", data_format)
+        assert len(empty) == 0 and list(empty.columns) == list(df.columns)
+    print("Storage test passed: whole, piece by piece and empty tables read back the same as CSV and parquet.")
+    print("===============================================\n")
+
+def test_seasonal():
+    # The batched decomposition must match a pandas 2x12 moving average and calendar month averages, find a known
+    # seasonal pattern, and give every state the same result as decomposing that state on its own
+    print("===============TEST: Seasonal Decomposition========")
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2005-03-01", "2024-12-01", freq="MS")
+    pattern = np.array([-3, -2, 0, 1, 2, 3, 3, 2, 1, 0, -2, -5], dtype="float64") #mean 0
+    df = pd.DataFrame({"month": months, "price": np.linspace(100, 200, len(months)) + pattern[months.month - 1]
+                       + rng.normal(0, 0.2, len(months)), "search": rng.normal(50, 5, len(months))})
+    df = df.drop(index=[100]) #a missing month
+
+    parts = decompose_frame(df, ["price", "search"])
+    price = parts["observed"]["price"]
+    expected_trend = price.rolling(12).mean().rolling(2).mean().shift(-6)
+    assert np.allclose(parts["trend"]["price"], expected_trend, equal_nan=True)
+    detrended = price - parts["trend"]["price"]
+    expected_profile = detrended.groupby(detrended.index.month).mean()
+    assert np.allclose(parts["profile"]["price"], expected_profile - expected_profile.mean())
+    assert np.abs(parts["profile"]["price"].to_numpy() - pattern).max() < 0.2
+
+    states = pd.concat([df.assign(state=state, price=df["price"] * (i + 1)) for i, state in enumerate(["Ohio", "Utah"])],
+                       ignore_index=True)
+    together = add_deseasonalized(states, ["price", "search"], group_column="state")
+    for state in ["Ohio", "Utah"]:
+        alone = add_deseasonalized(states[states["state"] == state], ["price", "search"])
+        assert np.allclose(together.loc[together["state"] == state, ["price_sa", "search_sa"]], alone[["price_sa", "search_sa"]])
+    print("Seasonal test passed: matches pandas, finds the monthly pattern, states done together match one at a time.")
+    print("===============================================\n")
+
+def test_keywords():
+    # Requests scaled on their own (max = 100 each) must end up on one scale through the anchor search, the main
+    # search must come from a request of its own, the extra searches must be cleaned side by side, and the keyword
+    # matrix must be pandas' .corr() and draw with 60 searches
+    print("===============TEST: Search Keywords============")
+    rng = np.random.default_rng(0)
+    months = pd.DatetimeIndex(pd.date_range("2005-01-01", "2024-12-01", freq="MS"), name="date")
+    truth = pd.DataFrame(rng.uniform(5, 50, (len(months), 7)), index=months, columns=["main", *"abcdef"])
+    batches = [truth[["main"]], truth[["main", *"abcd"]], truth[["main", *"ef"]]]
+    frames = [100 * batch / batch.to_numpy().max() for batch in batches] #what Google sends back for each request
+    aligned = align_keyword_batches(frames, "main")
+    assert list(aligned.columns) == ["main", *"abcdef"] and aligned["main"].equals(frames[0]["main"])
+    ratios = aligned.div(aligned["main"], axis=0)
+    assert np.allclose(ratios, truth.div(truth["main"], axis=0), atol=1e-3)
+
+    class RecordingTrendReq(FakeTrendReq):
+        requests = []
+        def build_payload(self, kw_list, **kwargs):
+            RecordingTrendReq.requests.append(list(kw_list))
+            super().build_payload(kw_list, **kwargs)
+    stand_in = TrendsStandIn()
+    GTrends_Homes_Selling(time_sleep=1, kw="main", data_dir=TEST_LOADED_DIR, GOOGLE_NAME="KEYWORDS_LOADED.csv",
+                          START_DATE="2010-01-01", END_DATE="2012-12-31", data_format="csv", use_cache=False,
+                          client_factory=lambda: RecordingTrendReq(stand_in), limiter_state=None,
+                          extra_keywords=[*"abcdef"], per_request=5)
+    assert RecordingTrendReq.requests == [["main"], ["main", *"abcd"], ["main", *"ef"]]
+    assert list(pd.read_csv(TEST_LOADED_DIR / "KEYWORDS_LOADED.csv").columns) == ["date", "main", *"abcdef", "isPartial"]
+
+    raw = aligned.reset_index().assign(isPartial=False)
+    raw["date"] = raw["date"].dt.strftime("%Y-%m-%d")
+    raw.to_csv(TEST_LOADED_DIR / "KEYWORDS.csv", index=False)
+    clean = process_google_data(filename="KEYWORDS.csv", data_dir=TEST_LOADED_DIR, processed_dir=TEST_PROCESSED_DIR,
+                                google_name_clean="KEYWORDS_CLEAN.csv", google_search_term="main",
+                                START_DATE="2010-01-01", END_DATE="2024-12-31", data_format="csv",
+                                keyword_columns={"a": "kw_a", "f": "kw_f", "missing": "kw_missing"})
+    assert list(clean.columns) == ["date", "main", "a", "f"] and len(clean) == 180
+
+    columns = {f"kw_{i}": rng.normal(size=len(months)) for i in range(60)}
+    df = pd.DataFrame({"month": months, "search_interest": rng.normal(size=len(months)),
+                       "avg_price": rng.normal(size=len(months)), **columns})
+    df.loc[:20, "kw_3"] = np.nan
+    corr = keyword_correlations(df, TEST_RESULTS_DIR, keywords=["search_interest", *columns], macro=["avg_price"])
+    assert corr.shape == (62, 62) and list(corr.columns[-1:]) == ["avg_price"]
+    assert np.allclose(corr, df.drop(columns="month").corr().loc[corr.index, corr.columns], equal_nan=True)
+    plot_keyword_heatmap(df, TEST_RESULTS_DIR, keywords=["search_interest", *columns], macro=["avg_price"])
+    assert (TEST_RESULTS_DIR / KEYWORD_HEATMAP_NAME).exists()
+    print("Keyword test passed: main search requested alone, requests put on one scale, extra searches cleaned together, matrix matches pandas.")
+    print("===============================================\n")
+
+def test_regression():
+    # The fast trend lines must match np.polyfit, skip missing rows line by line and give the textbook 95% band
+    print("===============TEST: Fast Regression============")
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(120, 6))
+    y = 3 * x + 1 + rng.normal(size=(120, 6))
+    x[5, 2] = np.nan
+    y[9, 4] = np.nan
+
+    fits = fit_lines(x, y)
+    for p in range(6):
+        keep = ~(np.isnan(x[:, p]) | np.isnan(y[:, p]))
+        assert np.allclose(np.polyfit(x[keep, p], y[keep, p], 1), [fits["slope"][p], fits["intercept"][p]])
+
+    # At the mean of x the band is +- t * s / sqrt(n), t = 1.980 for 118 degrees of freedom
+    half_x = rng.normal(size=60)
+    fits = fit_lines(np.r_[half_x, -half_x], rng.normal(size=120)) #mean of x = middle of the line
+    grid, fitted, lower, upper = line_band(fits, ci=95, points=3)
+    half = (upper - lower)[0, 1] / 2 * np.sqrt(fits["n"][0]) / fits["s"][0]
+    assert abs(half - 1.9803) < 1e-3, half
+    assert line_band(fits, ci=None)[2] is None
+    print("Fast regression test passed: matches np.polyfit on all 6 lines and the 95% band uses t = 1.980.")
+    print("===============================================\n")
+
+def test_analysis_cache():
+    # Same data + settings = worked out once (in memory, then from disk in a new cache), anything else = worked out again
+    print("===============TEST: Analysis Cache=============")
+    cache_dir = TEST_PROCESSED_DIR / "analysis_cache"
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    cache_dir.mkdir()
+    df = pd.DataFrame({"a": np.arange(24.0), "b": np.arange(24.0) ** 2})
+    calls = []
+    def rolling(window):
+        calls.append(window)
+        return df.rolling(window).mean()
+
+    cache = AnalysisCache(max_items=2, cache_dir=cache_dir)
+    first = cache.get("rolling_mean", df, lambda: rolling(6), window=6)
+    assert cache.get("rolling_mean", df, lambda: rolling(6), window=6) is first
+    cache.get("rolling_mean", df, lambda: rolling(3), window=3) #new settings
+    cache.get("rolling_mean", df.assign(b=df["b"] + 1), lambda: rolling(6), window=6) #new data, pushes window=6 out of memory
+    assert calls == [6, 3, 6] and len(cache.items) == 2
+
+    again = AnalysisCache(cache_dir=cache_dir) #like a new run
+    assert again.get("rolling_mean", df, lambda: rolling(6), window=6).equals(first)
+    assert calls == [6, 3, 6] and again.stats()["disk_hits"] == 1
+    print("Analysis cache test passed: re-used in memory and from disk, recomputed for new data or settings.")
+    print("===============================================\n")
+
+def test_profiler():
+    # Nested spans: the outer span's self time must leave out the inner one, and rows in/out come from the tables
+    print("===============TEST: Profiler========")
+    profiler.enable()
+
+    @profiler.profiled("process")
+    def double(df):
+        with profiler.span("sleep", "wait"):
+            time.sleep(0.05)
+        return pd.concat([df, df])
+
+    double(pd.DataFrame({"x": range(10)}))
+    summary = profiler.disable().summary()
+    outer, inner = summary["functions"]["double"], summary["functions"]["sleep"]
+    assert (outer["rows_in"], outer["rows_out"]) == (10, 20)
+    assert inner["wall_seconds"] >= 0.05 and outer["self_seconds"] < 0.05
+    assert set(summary["categories"]) == {"process", "wait"}
+    print("Profiler test passed: self time, rows in/out and categories are right.")
+    print("===============================================\n")
 
 def test_analyze():
     print("===============TEST: Full Analysis=======")
@@ -174,6 +704,38 @@ def test_analyze():
     print("===============================================\n")
 
 
+def test_sweep():
+    # Every window x mask x season is a variant. Each variant's numbers must match working them out on its own months,
+    # and variants with too few months are left out (empty numbers, no graphs)
+    print("===============TEST: Analysis Sweep=============")
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2005-01-01", "2024-12-01", freq="MS")
+    df = pd.DataFrame({"month": months, "search_interest": rng.uniform(20, 100, len(months)),
+                       "mortgage_rate": rng.uniform(2, 8, len(months)), "avg_price": rng.uniform(2e5, 5e5, len(months))})
+    variants = make_variants(
+        windows={"all": (None, None), "2020": ("2020-01-01", "2020-12-31")},
+        masks={"none": [], "no_2008": [("2007-12-01", "2009-06-30")]},
+        seasons={"all_year": None, "summer": [6, 7, 8]},
+    )
+    summary = run_sweep(df, variants, results_dir=TEST_RESULTS_DIR / "sweep", parallel=False,
+                        plots=["plot_correlation_heatmap"])
+    assert len(summary) == 8
+
+    row = summary.set_index("name").loc["all_no_2008_summer"]
+    expected = df[df["month"].dt.month.isin([6, 7, 8]) & ~df["month"].between("2007-12-01", "2009-06-30")]
+    assert row["months"] == len(expected) == 56
+    assert np.isclose(row["mortgage_rate_vs_search_interest"], expected["mortgage_rate"].corr(expected["search_interest"]))
+    assert np.isclose(row["avg_price_on_search_interest_slope"], np.polyfit(expected["search_interest"], expected["avg_price"], 1)[0])
+    assert row["avg_price_on_search_interest_slope_low"] < row["avg_price_on_search_interest_slope"] < row["avg_price_on_search_interest_slope_high"]
+    assert (TEST_RESULTS_DIR / "sweep" / "all_no_2008_summer" / HEATMAP_NAME).exists()
+
+    short = summary.set_index("name").loc["2020_none_summer"] #3 months
+    assert short["months"] == 3 and np.isnan(short["mortgage_rate_vs_search_interest"])
+    assert not (TEST_RESULTS_DIR / "sweep" / "2020_none_summer").exists()
+    print("Sweep test passed: 8 variants, numbers match each variant's own months, short variants left out.")
+    print("===============================================\n")
+
+
 # ============================================================
 # RUN ALL TESTS
 # ============================================================
@@ -185,6 +747,7 @@ def run_all_tests():
     clear_data_folder(TEST_LOADED_DIR) #put this inside each one same with processed and results
     test_kaggle()
     test_fred()
+    test_fred_incremental()
     test_google()
 
 
@@ -196,6 +759,21 @@ def run_all_tests():
     test_FRED_processing()
     test_GOOGLE_processing()
     test_merge_data()
+    test_features()
+    test_quantile_sketch()
+    test_month_index()
+    test_bad_prices()
+    test_state_data()
+    test_make()
+    test_rate_limiter()
+    test_storage()
+    test_dates()
+    test_lead_lag()
+    test_seasonal()
+    test_keywords()
+    test_regression()
+    test_analysis_cache()
+    test_profiler()
 
 
     print("========================================")
@@ -203,6 +781,7 @@ def run_all_tests():
     print("========================================\n")
     clear_results_folder(TEST_RESULTS_DIR)
     test_analyze()
+    test_sweep()
 
 
     print("All tests completed.")